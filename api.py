@@ -0,0 +1,367 @@
+import base64
+import gzip
+import hashlib
+import json
+from datetime import date, datetime, time
+from functools import wraps
+
+from flask import Blueprint, g, jsonify, request
+
+from db import get_db, read_only
+from fragment_cache import (
+    day_scope, get_versions, not_modified, page_validators, trip_scope, with_validators
+)
+from ids import normalize_url_ids
+from task_status import day_member_statuses
+from trip_list import user_trips_page
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+
+# ------------------ JSON API (v1) ------------------
+#
+# Read-only JSON views of trips, days and tasks for mobile clients and
+# the day page JS. Conventions shared by every collection:
+#
+#   ?fields=id,title      sparse fieldset; only those columns are selected
+#   ?limit=50             page size (max MAX_LIMIT)
+#   ?cursor=...           opaque keyset cursor from the previous page
+#
+# Responses are {"data": [...], "next_cursor": str|null}. Pages are
+# walked with keyset predicates on the sort columns, so page N costs the
+# same as page 1. Bodies are gzip/brotli compressed and carry a weak
+# ETag; day and trip collections derive it from the cache version
+# counters and answer 304 before querying anything.
+
+api = Blueprint("api", __name__, url_prefix="/api/v1")
+api.url_value_preprocessor(normalize_url_ids)
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+MIN_COMPRESS_BYTES = 512
+
+TRIP_FIELDS = ("id", "name", "start_date", "end_date", "owner_id", "created_at")
+DAY_FIELDS = ("id", "trip_id", "date")
+TASK_FIELDS = (
+    "id", "trip_id", "day_id", "title", "description", "start_time",
+    "end_time", "lat", "lng", "order_key", "created_at",
+)
+# Computed per task from task_status_current, only when asked for
+TASK_STATUS_FIELDS = ("status", "group")
+
+TRIP_ACCESS_SQL = """
+    (t.owner_id = %s OR EXISTS (
+        SELECT 1 FROM trip_members tm
+        WHERE tm.trip_id = t.id AND tm.user_id = %s
+    ))
+"""
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+@api.errorhandler(ApiError)
+def handle_api_error(e):
+    return jsonify({"error": e.message}), e.status
+
+
+def api_login_required(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not getattr(g, "current_user", None):
+            raise ApiError(401, "Login required")
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+# ---------------- request helpers ----------------
+
+def requested_fields(allowed, extra=(), always=("id",)):
+    """Columns named in ?fields= (validated), or every column"""
+    raw = request.args.get("fields")
+    if not raw:
+        return list(allowed)
+    fields = [f.strip() for f in raw.split(",") if f.strip()]
+    unknown = [f for f in fields if f not in allowed and f not in extra]
+    if unknown:
+        raise ApiError(400, f"Unknown fields: {', '.join(unknown)}")
+    return list(dict.fromkeys(list(always) + fields))
+
+
+def page_limit():
+    try:
+        limit = int(request.args.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError(400, "limit must be an integer")
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def encode_cursor(values):
+    raw = json.dumps([jsonable(v) for v in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(n_values):
+    cursor = request.args.get("cursor")
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+    except ValueError:
+        raise ApiError(400, "Invalid cursor")
+    if not isinstance(values, list) or len(values) != n_values:
+        raise ApiError(400, "Invalid cursor")
+    return values
+
+
+def jsonable(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, time):
+        return value.isoformat(timespec="minutes")
+    return value
+
+
+def keyset_page(sql, params, sort_columns, fields, limit):
+    """
+    Run a keyset-paginated query. sql must select the sort columns and end
+    with an ORDER BY on them; LIMIT is appended here. Returns the page in
+    API shape, trimmed to the requested fields.
+    """
+    cur = get_db().cursor()
+    cur.execute(sql + " LIMIT %s", (*params, limit + 1))
+    rows = cur.fetchall()
+    cur.close()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][col] for col in sort_columns])
+
+    return {
+        "data": [{f: jsonable(row[f]) for f in fields if f in row} for row in rows],
+        "next_cursor": next_cursor,
+    }
+
+
+def select_list(fields, sort_columns, allowed, alias):
+    columns = [f for f in fields if f in allowed]
+    columns += [c for c in sort_columns if c not in columns]
+    return ", ".join(f"{alias}.{c}" for c in columns)
+
+
+def user_id():
+    return g.current_user["id"]
+
+
+def trip_for_user(trip_id):
+    cur = get_db().cursor()
+    cur.execute(f"""
+        SELECT t.* FROM trips t
+        WHERE t.id = %s AND {TRIP_ACCESS_SQL}
+    """, (trip_id, user_id(), user_id()))
+    trip = cur.fetchone()
+    cur.close()
+    if not trip:
+        raise ApiError(404, "Trip not found")
+    return trip
+
+
+def day_for_user(day_id):
+    cur = get_db().cursor()
+    cur.execute(f"""
+        SELECT d.* FROM days d
+        JOIN trips t ON t.id = d.trip_id
+        WHERE d.id = %s AND {TRIP_ACCESS_SQL}
+    """, (day_id, user_id(), user_id()))
+    day = cur.fetchone()
+    cur.close()
+    if not day:
+        raise ApiError(404, "Day not found")
+    return day
+
+
+def versioned(scopes):
+    """(etag, last_modified, 304 response or None) for version-keyed data"""
+    versions = get_versions(get_db(), scopes)
+    etag, last_modified = page_validators(
+        versions, user_id(), request.full_path, date.today()
+    )
+    return etag, last_modified, not_modified(etag, last_modified)
+
+
+# ---------------- routes ----------------
+
+@api.route("/trips")
+@read_only
+@api_login_required
+def list_trips():
+    fields = requested_fields(TRIP_FIELDS)
+    sort_columns = ("created_at", "id")
+    cursor = decode_cursor(len(sort_columns))
+
+    # Same owned/joined keyset query as the /trips page
+    rows, has_more = user_trips_page(
+        get_db(), user_id(), limit=page_limit(), after=cursor,
+        columns=select_list(fields, sort_columns, TRIP_FIELDS, "t"),
+    )
+    return jsonify({
+        "data": [{f: jsonable(row[f]) for f in fields} for row in rows],
+        "next_cursor": encode_cursor([rows[-1][c] for c in sort_columns]) if has_more else None,
+    })
+
+
+@api.route("/trips/<trip_id>")
+@read_only
+@api_login_required
+def get_trip(trip_id):
+    fields = requested_fields(TRIP_FIELDS)
+    trip = trip_for_user(trip_id)
+    return jsonify({"data": {f: jsonable(trip[f]) for f in fields}})
+
+
+@api.route("/trips/<trip_id>/days")
+@read_only
+@api_login_required
+def list_days(trip_id):
+    fields = requested_fields(DAY_FIELDS)
+    sort_columns = ("date", "id")
+    cursor = decode_cursor(len(sort_columns))
+    trip_for_user(trip_id)
+
+    etag, last_modified, cached = versioned([trip_scope(trip_id)])
+    if cached:
+        return cached
+
+    keyset_sql, params = "", [trip_id]
+    if cursor:
+        keyset_sql = "AND (d.date, d.id) > (%s::date, %s)"
+        params += cursor
+
+    sql = f"""
+        SELECT {select_list(fields, sort_columns, DAY_FIELDS, "d")}
+        FROM days d
+        WHERE d.trip_id = %s {keyset_sql}
+        ORDER BY d.date ASC, d.id ASC
+    """
+    page = keyset_page(sql, params, sort_columns, fields, page_limit())
+    return with_validators(jsonify(page), etag, last_modified)
+
+
+@api.route("/days/<day_id>/tasks")
+@read_only
+@api_login_required
+def list_tasks(day_id):
+    fields = requested_fields(TASK_FIELDS, extra=TASK_STATUS_FIELDS)
+    sort_columns = ("order_key", "id")
+    cursor = decode_cursor(len(sort_columns))
+    day = day_for_user(day_id)
+
+    etag, last_modified, cached = versioned(
+        [trip_scope(day["trip_id"]), day_scope(day_id)]
+    )
+    if cached:
+        return cached
+
+    keyset_sql, params = "", [day_id]
+    if cursor:
+        keyset_sql = 'AND (x.order_key, x.id) > (%s COLLATE "C", %s)'
+        params += cursor
+
+    sql = f"""
+        SELECT {select_list(fields, sort_columns, TASK_FIELDS, "x")}
+        FROM tasks x
+        WHERE x.day_id = %s
+        AND (x.is_deleted IS NULL OR x.is_deleted = false)
+        {keyset_sql}
+        ORDER BY x.order_key ASC, x.id ASC
+    """
+    page = keyset_page(sql, params, sort_columns, fields, page_limit())
+
+    if any(f in fields for f in TASK_STATUS_FIELDS):
+        statuses = day_member_statuses(get_db(), day_id)
+        for task in page["data"]:
+            group = statuses.get(task["id"])
+            if "status" in fields:
+                task["status"] = group["members"].get(user_id()) if group else None
+            if "group" in fields:
+                task["group"] = {
+                    k: group[k] for k in ("required", "yes", "no", "skipped", "pending", "status")
+                } if group else None
+
+    return with_validators(jsonify(page), etag, last_modified)
+
+
+@api.route("/tasks/<task_id>")
+@read_only
+@api_login_required
+def get_task(task_id):
+    fields = requested_fields(TASK_FIELDS)
+    cur = get_db().cursor()
+    cur.execute(f"""
+        SELECT {select_list(fields, (), TASK_FIELDS, "x")}
+        FROM tasks x
+        JOIN trips t ON t.id = x.trip_id
+        WHERE x.id = %s
+        AND (x.is_deleted IS NULL OR x.is_deleted = false)
+        AND {TRIP_ACCESS_SQL}
+    """, (task_id, user_id(), user_id()))
+    task = cur.fetchone()
+    cur.close()
+    if not task:
+        raise ApiError(404, "Task not found")
+    return jsonify({"data": {f: jsonable(task[f]) for f in fields}})
+
+
+# ---------------- response encoding ----------------
+
+@api.after_request
+def finish_response(response):
+    if request.method != "GET" or response.status_code != 200:
+        return response
+
+    # Content hash when the view didn't set a version-based ETag
+    if not response.get_etag()[0]:
+        body = response.get_data()
+        response.set_etag(hashlib.sha1(body).hexdigest()[:20], weak=True)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.make_conditional(request)
+        if response.status_code == 304:
+            return response
+
+    return compress(response)
+
+
+def compress(response):
+    response.vary.add("Accept-Encoding")
+    if response.direct_passthrough or "Content-Encoding" in response.headers:
+        return response
+
+    body = response.get_data()
+    if len(body) < MIN_COMPRESS_BYTES:
+        return response
+
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        response.set_data(brotli.compress(body, quality=5))
+        response.headers["Content-Encoding"] = "br"
+    elif accepted["gzip"]:
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        return response
+
+    # The representation changed; the ETag stays valid only weakly
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
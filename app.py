@@ -1,109 +1,287 @@
+import io
 import os
 import time
-import uuid
 from dotenv import load_dotenv
 from datetime import datetime, date, timedelta
 import json
 import math
 import csv
-from flask import Flask, render_template, request, redirect, url_for, flash, session, g
-from db import init_db, get_db
+import click
+from flask import Blueprint, Flask, Response, make_response, render_template, request, redirect, url_for, flash, session, g, jsonify
+from db import (
+    configure as configure_db, get_db, get_router, init_db, mark_write, read_only, request_role
+)
+from day_optimizer import optimize_day
+from task_status import (
+    compact_events, day_member_statuses, record_status, reset_status, task_completion_sql
+)
+from task_notes import get_note, note_history, save_note
+from live_updates import event_stream, publish, publish_location
+from api import ApiError, api, decode_cursor, encode_cursor, jsonable
+import chat
+from ids import new_id, normalize_url_ids
+import metrics
+import passwords
+from passwords import PasswordHasherBusy, hash_password, verify_password
+from rate_limit import rate_limiter
+from app_logging import (
+    QueryProfile, configure_logging, dropped_records, get_logger, log_request, parse_sample_rates
+)
+from fragment_cache import (
+    bump_versions, day_scope, fragment_cache, friends_scope, get_versions,
+    not_modified, page_validators, trip_scope, with_validators
+)
+from ordering import (
+    MAX_KEY_LENGTH, apply_order, key_between, key_for_insert, keys_between,
+    last_key, locked_day, rebalance_day
+)
+from trip_list import user_trips_page
+from trip_export import EXPORT_FORMATS, export_stream
+import friend_graph
+from friend_graph import (
+    accept_friend_request, create_user, friend_count, friends_of, invitable_friends,
+    invite_friends_to_trip, pending_requests, reject_friend_request, send_friend_request
+)
 from functools import wraps
-load_dotenv()
-app = Flask(__name__)
-app.secret_key = "tripplanner-dev-secret"
+import threading
 
-# Optimize Flask configuration for better performance
-app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 31536000  # 1 year cache for static files
+log = get_logger("app")
 
-# Request timing middleware
-@app.before_request
+
+bp = Blueprint("main", __name__, cli_group=None)
+# Ids in URLs are matched as the uuid columns store them (ids.py)
+bp.url_value_preprocessor(normalize_url_ids)
+
+
+def create_app(config=None):
+    """
+    Build the Flask app. Cheap by design: no database connection, schema
+    work or network setup happens here. Connections open on first
+    get_db(); the schema is managed with `flask --app app migrate`.
+    """
+    load_dotenv()
+    app = Flask(__name__)
+    app.config.from_mapping(
+        SECRET_KEY="tripplanner-dev-secret",
+        # Optimize Flask configuration for better performance
+        SEND_FILE_MAX_AGE_DEFAULT=31536000,  # 1 year cache for static files
+        PERMANENT_SESSION_LIFETIME=timedelta(days=31),  # Session lasts 31 days
+        UPLOAD_FOLDER="uploads",
+        DATABASE_URL=os.environ.get("DATABASE_URL"),
+        # Comma-separated read replica URLs, tracked by the endpoint router
+        DATABASE_REPLICA_URLS=[
+            url.strip()
+            for url in os.environ.get("DATABASE_REPLICA_URLS", "").split(",")
+            if url.strip()
+        ],
+        # IPv4-first DNS for Windows dev machines with slow IPv6 lookups
+        DB_NETWORK_TUNING=os.environ.get("DB_NETWORK_TUNING") == "1",
+        # Seconds between background endpoint latency probes (0 = off)
+        DB_PROBE_INTERVAL=int(os.environ.get("DB_PROBE_INTERVAL", 30)),
+        # Replicas lagging more than this are skipped for reads
+        DB_MAX_REPLICA_LAG=float(os.environ.get("DB_MAX_REPLICA_LAG", 5)),
+        # After a write, the user's reads stay on the primary this long
+        DB_READ_YOUR_WRITES_SECONDS=float(os.environ.get("DB_READ_YOUR_WRITES_SECONDS", 5)),
+        # Rendered task/member list fragments kept per worker
+        FRAGMENT_CACHE_SIZE=int(os.environ.get("FRAGMENT_CACHE_SIZE", 512)),
+        # Optional shared tier so workers reuse each other's renders
+        FRAGMENT_CACHE_REDIS_URL=os.environ.get("FRAGMENT_CACHE_REDIS_URL"),
+        LOG_LEVEL=os.environ.get("LOG_LEVEL", "INFO"),
+        # Per-endpoint sample rates, e.g. "main.ping=0.01,api.list_trips=0.5"
+        LOG_SAMPLE_RATES=parse_sample_rates(os.environ.get("LOG_SAMPLE_RATES")),
+        # Requests slower than this are always logged with their query profile
+        LOG_SLOW_REQUEST_MS=float(os.environ.get("LOG_SLOW_REQUEST_MS", 500)),
+        # Shared directory for per-worker metric files (multi-process servers)
+        METRICS_DIR=os.environ.get("METRICS_DIR"),
+        METRICS_FLUSH_SECONDS=float(os.environ.get("METRICS_FLUSH_SECONDS", 5)),
+        # scrypt cost (N = 2**this); see `flask --app app calibrate-passwords`
+        PASSWORD_SCRYPT_LOG2N=int(os.environ.get("PASSWORD_SCRYPT_LOG2N", passwords.DEFAULT_LOG2_N)),
+        # Hashes run at once per worker (default: CPU count) / allowed to wait
+        PASSWORD_HASH_THREADS=int(os.environ.get("PASSWORD_HASH_THREADS", 0)) or None,
+        PASSWORD_HASH_QUEUE=int(os.environ.get("PASSWORD_HASH_QUEUE", passwords.DEFAULT_QUEUE)),
+        # Sign-in attempts per client IP / per username: burst, then per minute (0 = off)
+        RATE_LIMIT_IP_BURST=int(os.environ.get("RATE_LIMIT_IP_BURST", 30)),
+        RATE_LIMIT_IP_PER_MINUTE=float(os.environ.get("RATE_LIMIT_IP_PER_MINUTE", 30)),
+        RATE_LIMIT_USER_BURST=int(os.environ.get("RATE_LIMIT_USER_BURST", 10)),
+        RATE_LIMIT_USER_PER_MINUTE=float(os.environ.get("RATE_LIMIT_USER_PER_MINUTE", 5)),
+        # Optional shared buckets so the limits hold across workers
+        RATE_LIMIT_REDIS_URL=os.environ.get("RATE_LIMIT_REDIS_URL"),
+        # Trusted proxies in front of the app that append to X-Forwarded-For
+        RATE_LIMIT_PROXY_HOPS=int(os.environ.get("RATE_LIMIT_PROXY_HOPS", 0)),
+    )
+    if config:
+        app.config.update(config)
+
+    configure_logging(
+        level=app.config["LOG_LEVEL"],
+        sample_rates=app.config["LOG_SAMPLE_RATES"],
+        slow_request_ms=app.config["LOG_SLOW_REQUEST_MS"],
+    )
+    metrics.configure(
+        directory=app.config["METRICS_DIR"],
+        flush_seconds=app.config["METRICS_FLUSH_SECONDS"],
+    )
+    passwords.configure(
+        log2_n=app.config["PASSWORD_SCRYPT_LOG2N"],
+        threads=app.config["PASSWORD_HASH_THREADS"],
+        queue=app.config["PASSWORD_HASH_QUEUE"],
+    )
+    rate_limiter.configure(
+        ip_burst=app.config["RATE_LIMIT_IP_BURST"],
+        ip_per_minute=app.config["RATE_LIMIT_IP_PER_MINUTE"],
+        user_burst=app.config["RATE_LIMIT_USER_BURST"],
+        user_per_minute=app.config["RATE_LIMIT_USER_PER_MINUTE"],
+        redis_url=app.config["RATE_LIMIT_REDIS_URL"],
+        proxy_hops=app.config["RATE_LIMIT_PROXY_HOPS"],
+    )
+    configure_db(
+        url=app.config["DATABASE_URL"],
+        replica_urls=app.config["DATABASE_REPLICA_URLS"],
+        network_tuning=app.config["DB_NETWORK_TUNING"],
+        probe_interval=app.config["DB_PROBE_INTERVAL"],
+        max_replica_lag=app.config["DB_MAX_REPLICA_LAG"],
+        read_your_writes_seconds=app.config["DB_READ_YOUR_WRITES_SECONDS"],
+    )
+    fragment_cache.configure(
+        max_entries=app.config["FRAGMENT_CACHE_SIZE"],
+        redis_url=app.config["FRAGMENT_CACHE_REDIS_URL"],
+    )
+
+    app.register_blueprint(bp)
+    app.register_blueprint(api)
+    return app
+
+
+# Request timing and query profile (app_logging.log_request, metrics)
+@bp.before_app_request
 def start_timer():
-    g.start_time = time.time()
+    g.start_time = time.perf_counter()
+    g.query_profile = QueryProfile()
+
+# Sign-in forms are throttled here, ahead of load_current_user and the
+# routes, so a rejected attempt costs no database work (rate_limit.py)
+RATE_LIMITED_ENDPOINTS = {
+    "main.login": "login",
+    "main.register": "register",
+    "main.forgot": "forgot",
+}
+
+@bp.before_app_request
+def throttle_sign_in():
+    action = RATE_LIMITED_ENDPOINTS.get(request.endpoint)
+    if action is None or request.method != "POST":
+        return None
+
+    ip = rate_limiter.client_ip(request)
+    retry_after = rate_limiter.check(action, ip, request.form.get("username"))
+    if retry_after is None:
+        return None
+
+    retry_after = max(1, math.ceil(retry_after))
+    log.warning("rate_limited", action=action, ip=ip, retry_after=retry_after)
+    flash(f"Too many attempts, please try again in {retry_after} seconds")
+    response = make_response(render_template("auth.html"), 429)
+    response.headers["Retry-After"] = str(retry_after)
+    return response
 
-@app.after_request
+@bp.after_app_request
 def log_request_time(response):
     if hasattr(g, 'start_time'):
-        total_time = (time.time() - g.start_time) * 1000
-        if total_time > 500:  # Log slow requests
-            print(f">>> SLOW REQUEST: {request.method} {request.path} - {total_time:.1f}ms")
-        elif total_time > 100:
-            print(f">>> Request: {request.method} {request.path} - {total_time:.1f}ms")
+        duration = time.perf_counter() - g.start_time
+        current_user = g.get("current_user")
+        profile = g.get("query_profile")
+        log_request(
+            request.method, request.path, request.endpoint, response.status_code,
+            duration * 1000,
+            user_id=current_user["id"] if current_user else None,
+            profile=profile,
+        )
+        metrics.observe_request(
+            request.endpoint, request.method, response.status_code, duration, profile
+        )
+    return response
+
+@bp.after_app_request
+def remember_writes(response):
+    # Successful writes pin the user's next reads to the primary
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        mark_write()
     return response
 
-@app.teardown_request
+@bp.teardown_app_request
 def close_db(error=None):
     db = g.pop("db_conn", None)
     if db is not None:
         db.close()
-app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=31)  # Session lasts 31 days
-UPLOAD_FOLDER = "uploads"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
-
-# init_db() will be called in application context when the server starts
 
 def uid():
-    return str(uuid.uuid4())
+    return new_id()
 
 # temporary in-memory storage
 
-def task_completion_stats(conn, where_clause="", params=()):
-    cur = conn.cursor()
-    
-    cur.execute(
-        f"""
-        SELECT COUNT(*) 
-        FROM tasks
+AVERAGE_DELAY_SQL = """
+    SELECT COALESCE(SUM(eta_minutes), 0) AS total_minutes, COUNT(*) AS snapshots
+    FROM eta_snapshots
+    WHERE task_id IN (
+        SELECT id FROM tasks
         WHERE is_deleted = false
-        {where_clause}
-        """,
-        params
+        {task_filter_sql}
     )
-    total = cur.fetchone()[0]
-
-    cur.execute(
-        f"""
-        SELECT COUNT(DISTINCT task_id)
-        FROM task_status_events
-        WHERE status = %s
-        AND task_id IN (
-            SELECT id FROM tasks
-            WHERE is_deleted = false
-            {where_clause}
-        )
-        """,
-        ('YES',) + params
-    )
-    completed = cur.fetchone()[0]
-
-    cur.execute(
-        f"""
-        SELECT COUNT(DISTINCT task_id)
-        FROM task_status_events
-        WHERE status = %s
-        AND task_id IN (
-            SELECT id FROM tasks
-            WHERE is_deleted = false
-            {where_clause}
-        )
-        """,
-        ('SKIPPED',) + params
-    )
-    skipped = cur.fetchone()[0]
-    
-    cur.close()
-
+"""
+
+# ETA snapshots by the time of day their task starts
+DELAY_BUCKETS_SQL = """
+    SELECT
+        COUNT(*) FILTER (WHERE t.start_time >= '06:00' AND t.start_time < '12:00') AS morning,
+        COUNT(*) FILTER (WHERE t.start_time >= '12:00' AND t.start_time < '18:00') AS afternoon,
+        COUNT(*) FILTER (WHERE t.start_time < '06:00' OR t.start_time >= '18:00') AS evening
+    FROM tasks t
+    JOIN eta_snapshots e ON e.task_id = t.id
+    WHERE t.trip_id = %s
+    AND t.is_deleted = false
+"""
+
+# Task rows for pages: times as "HH:MM" (what the forms post and the
+# page's JSON expects), plus starts_at = the day's date + start_time
+TASK_FIELDS_SQL = """
+    t.id, t.trip_id, t.day_id, t.title, t.description,
+    to_char(t.start_time, 'HH24:MI') AS start_time,
+    to_char(t.end_time, 'HH24:MI') AS end_time,
+    t.lat, t.lng, t.order_index, t.order_key, t.created_at, t.is_deleted,
+    d.date + t.start_time AS starts_at
+"""
+
+DAY_TASKS_SQL = f"""
+    SELECT {TASK_FIELDS_SQL}
+    FROM tasks t
+    JOIN days d ON d.id = t.day_id
+    WHERE t.day_id = %s AND (t.is_deleted IS NULL OR t.is_deleted = false)
+    ORDER BY t.order_key ASC
+"""
+
+
+def completion_result(row):
+    total = row["total"]
+    completed = row["completed"]
+    skipped = row["skipped"]
     unanswered = max(total - completed - skipped, 0)
 
-    result = {
+    return {
         "total": total,
         "completed": completed,
         "skipped": skipped,
         "unanswered": unanswered
     }
-    
-    return result
+
+
+def task_completion_stats(conn, where_clause="", params=()):
+    """Counts by each task's group status: YES once every required member said YES"""
+    cur = conn.cursor()
+    cur.execute(task_completion_sql(where_clause), tuple(params))
+    row = cur.fetchone()
+    cur.close()
+
+    return completion_result(row)
 
 
 
@@ -111,60 +289,45 @@ def average_delay_minutes(conn, task_filter_sql="", params=()):
     try:
         cur = conn.cursor()
         cur.execute(
-            f"""
-            SELECT eta_minutes
-            FROM eta_snapshots
-            WHERE task_id IN (
-                SELECT id FROM tasks
-                WHERE is_deleted = false
-                {task_filter_sql}
-            )
-            """,
+            AVERAGE_DELAY_SQL.format(task_filter_sql=task_filter_sql),
             params
         )
-        rows = cur.fetchall()
+        row = cur.fetchone()
         cur.close()
-        
-        if not rows:
-            return 0
-        
-        total_minutes = sum(row[0] for row in rows if row[0] is not None)
-        return total_minutes // len(rows) if len(rows) > 0 else 0
+
+        return average_from_row(row)
         
     except Exception as e:
-        print(f"DEBUG: eta_snapshots table error: {e}")
+        log.debug("average_delay_unavailable", error=str(e))
         return 0  # Return 0 delay if table doesn't exist or query fails
 
+
+def average_from_row(row):
+    if not row or not row["snapshots"]:
+        return 0
+    return row["total_minutes"] // row["snapshots"]
+
+
 def delay_time_buckets(conn, trip_id):
     try:
         cur = conn.cursor()
-        cur.execute("""
-            SELECT t.start_time
-            FROM tasks t
-            JOIN eta_snapshots e ON e.task_id = t.id
-            WHERE t.trip_id = %s
-            AND t.is_deleted = false
-        """, (trip_id,))
-        rows = cur.fetchall()
+        cur.execute(DELAY_BUCKETS_SQL, (trip_id,))
+        row = cur.fetchone()
         cur.close()
-        
-        buckets = {"morning": 0, "afternoon": 0, "evening": 0}
-        
-        for row in rows:
-            hour = int(row["start_time"].split(":")[0])
-            if 6 <= hour < 12:
-                buckets["morning"] += 1
-            elif 12 <= hour < 18:
-                buckets["afternoon"] += 1
-            else:
-                buckets["evening"] += 1
-        
-        return buckets
+
+        return buckets_from_row(row)
         
     except Exception as e:
-        print(f"DEBUG: delay_time_buckets error: {e}")
+        log.debug("delay_buckets_unavailable", error=str(e))
         return {"morning": 0, "afternoon": 0, "evening": 0}
 
+
+def buckets_from_row(row):
+    return {
+        bucket: row[bucket] if row else 0
+        for bucket in ("morning", "afternoon", "evening")
+    }
+
 def overall_analytics(user_id):
     conn = get_db()
 
@@ -182,18 +345,16 @@ def overall_analytics(user_id):
     if not trip_ids:
         return {"tasks": {"total": 0, "completed": 0, "skipped": 0, "unanswered": 0}}
 
-    placeholders = ",".join("?" * len(trip_ids))
-
     stats = task_completion_stats(
         conn,
-        f"AND trip_id IN ({placeholders})",
-        trip_ids
+        "AND trip_id = ANY(%s::uuid[])",
+        (trip_ids,)
     )
     
     avg_delay = average_delay_minutes(
         conn,
-        f"AND trip_id IN ({placeholders})",
-        trip_ids
+        "AND trip_id = ANY(%s::uuid[])",
+        (trip_ids,)
     )
 
     result = {
@@ -223,10 +384,10 @@ def trip_analytics(trip_id):
 
     cur = conn.cursor()
     cur.execute(
-        "SELECT COUNT(*) FROM days WHERE trip_id = %s",
+        "SELECT COUNT(*) AS count FROM days WHERE trip_id = %s",
         (trip_id,)
     )
-    days_count = cur.fetchone()[0]
+    days_count = cur.fetchone()["count"]
     cur.close()
 
     return {
@@ -271,58 +432,73 @@ def login_required(fn):
         # Ensure g is properly available and current_user is set
         if not hasattr(g, 'current_user') or not g.current_user:
             flash("Please login first")
-            return redirect(url_for("auth"))
+            return redirect(url_for("main.auth"))
         return fn(*args, **kwargs)
     return wrapper
 
-def make_public_id(user_id):
-    return "TP-" + user_id.split("-")[0][:6].upper()
-
-def resolve_public_id(public_id, conn):
-    """Convert public ID like 'TP-ABC123' back to full user ID"""
-    if not public_id.startswith("TP-"):
-        return None
-    
-    prefix = public_id[3:].lower()  # Remove "TP-" and convert to lowercase
-    
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT id FROM users 
-        WHERE LOWER(SUBSTR(id, 1, 6)) = %s
-    """, (prefix,))
-    user = cur.fetchone()
-    cur.close()
-    
-    return user["id"] if user else None
-
 
 
-@app.route("/_ping")
+@bp.route("/_ping")
 def _ping():
     return "pong"
 
-@app.route("/ping")
+@bp.route("/ping")
 def ping():
     """Fast endpoint for testing latency without DB calls"""
     return {"status": "ok", "timestamp": time.time()}
 
-@app.route("/ping-db")  
+@bp.route("/ping-db")
 def ping_db():
     """Test endpoint with DB connection for measuring DB latency"""
     start = time.time()
     conn = get_db()
     cur = conn.cursor()
-    cur.execute("SELECT 1")
+    cur.execute("SELECT 1 AS result")
     result = cur.fetchone()
     cur.close()
     db_time = (time.time() - start) * 1000
-    return {"status": "ok", "db_time_ms": f"{db_time:.1f}", "result": result[0]}
+    return {"status": "ok", "db_time_ms": f"{db_time:.1f}", "result": result["result"]}
+
+@bp.route("/metrics")
+def metrics_page():
+    """Prometheus scrape endpoint; gauges describe the serving worker"""
+    router = get_router().stats()
+    gauges = (
+        metrics.gauge_lines("db_endpoint_up", "Endpoint usable for checkouts", [
+            ({"endpoint": e["name"], "role": e["role"]}, int(e["healthy"]))
+            for e in router["endpoints"]
+        ])
+        + metrics.gauge_lines("db_endpoint_selected", "Endpoint currently chosen for its role", [
+            ({"endpoint": e["name"], "role": e["role"]}, int(e["selected"]))
+            for e in router["endpoints"]
+        ])
+        + metrics.gauge_lines("db_replica_lag_seconds", "Replay lag at the last probe", [
+            ({"endpoint": e["name"]}, e["lag_seconds"])
+            for e in router["endpoints"]
+        ])
+        + metrics.gauge_lines("fragment_cache_entries", "Rendered fragments held by this worker", [
+            ({}, fragment_cache.stats()["entries"]),
+        ])
+        + metrics.gauge_lines("log_records_dropped", "Log records dropped on a full queue", [
+            ({}, dropped_records()),
+        ])
+        + metrics.gauge_lines("rate_limit_buckets", "Rate limit buckets held by this worker", [
+            ({}, rate_limiter.stats()["buckets"]),
+        ])
+    )
+    return Response(metrics.render(gauges), content_type=metrics.CONTENT_TYPE)
 
-@app.route("/")
+@bp.route("/ping-db/endpoints")
+def ping_db_endpoints():
+    """Per-endpoint latency histograms and health from the connection router"""
+    # Unauthenticated, like /metrics: no hostnames or driver errors
+    return get_router().public_stats()
+
+@bp.route("/")
 def auth():
     return render_template("auth.html")
 
-@app.route("/register", methods=["POST"])
+@bp.route("/register", methods=["POST"])
 def register():
     username = request.form.get("username")
     password = request.form.get("password")
@@ -330,7 +506,7 @@ def register():
 
     if password != confirm:
         flash("Passwords do not match")
-        return redirect(url_for("auth"))
+        return redirect(url_for("main.auth"))
 
     conn = get_db()
     cur = conn.cursor()
@@ -344,24 +520,27 @@ def register():
     if exists:
         cur.close()
         flash("User already exists")
-        return redirect(url_for("auth"))
+        return redirect(url_for("main.auth"))
 
-    user_id = str(uuid.uuid4())
+    user_id = new_id()
     now = datetime.now().isoformat()
+    cur.close()
 
-    cur.execute("""
-        INSERT INTO users (id, name, password, created_at)
-        VALUES (%s, %s, %s, %s)
-    """, (user_id, username, password, now))
+    try:
+        password_hash = hash_password(password)
+    except PasswordHasherBusy:
+        log.warning("password_hasher_busy", action="register")
+        flash("We're busy right now, please try again in a moment")
+        return redirect(url_for("main.auth"))
 
+    create_user(conn, user_id, username, password_hash, now)
     conn.commit()
-    cur.close()
 
     flash("Successfully registered! Please login.")
-    return redirect(url_for("auth"))
+    return redirect(url_for("main.auth"))
 
 
-@app.route("/login", methods=["POST"])
+@bp.route("/login", methods=["POST"])
 def login():
     username = request.form.get("username")
     password = request.form.get("password")
@@ -377,23 +556,39 @@ def login():
 
     if not user:
         flash("User not found")
-        return redirect(url_for("auth"))
+        return redirect(url_for("main.auth"))
+
+    try:
+        matches, rehash = verify_password(user["password"], password)
+        if rehash:
+            # Legacy plain text or an older cost: upgrade while we have the
+            # password, unless it changed in the meantime
+            cur = conn.cursor()
+            cur.execute(
+                "UPDATE users SET password = %s WHERE id = %s AND password = %s",
+                (hash_password(password), user["id"], user["password"])
+            )
+            cur.close()
+            conn.commit()
+    except PasswordHasherBusy:
+        log.warning("password_hasher_busy", action="login")
+        flash("We're busy right now, please try again in a moment")
+        return redirect(url_for("main.auth"))
 
-    # TEMP plain-text check
-    if password != user["password"]:
+    if not matches:
         flash("Invalid credentials")
-        return redirect(url_for("auth"))
+        return redirect(url_for("main.auth"))
 
     # ✅ SET SESSION HERE
     session.clear()
     session["user_id"] = user["id"]
     session.permanent = True  # Make session persistent
     
-    print("LOGIN OK → session user_id:", session["user_id"])
+    log.info("login", user_id=session["user_id"])
 
-    return redirect(url_for("dashboard"))
+    return redirect(url_for("main.dashboard"))
 
-@app.route("/forgot", methods=["POST"])
+@bp.route("/forgot", methods=["POST"])
 def forgot():
     username = request.form.get("username")  # assuming username=name
 
@@ -411,10 +606,10 @@ def forgot():
     else:
         flash("User not found")
 
-    return redirect(url_for("auth"))
+    return redirect(url_for("main.auth"))
 
 
-@app.before_request
+@bp.before_app_request
 def load_current_user():
     user_id = session.get("user_id")
     
@@ -437,15 +632,12 @@ def load_current_user():
             g.current_user = user
             
         except Exception as e:
-            print(f">>> ❌ Error loading user in before_request: {e}")
+            log.warning("load_user_failed", user_id=user_id, error=str(e))
             # Don't fail the entire request, just log the error
             g.current_user = None
 
-    print("REQUEST:", request.path,
-          "| session:", session.get("user_id"),
-          "| g.current_user:", bool(g.current_user))
-
-@app.route("/profile")
+@bp.route("/profile")
+@read_only
 @login_required
 def profile():
     user = g.current_user
@@ -461,9 +653,9 @@ def profile():
         cur.close()
 
     if not user:
-        return redirect(url_for("auth"))
+        return redirect(url_for("main.auth"))
 
-    public_id = make_public_id(user["id"])
+    public_id = user["public_id"]
     
     # Calculate real stats
     conn = get_db()
@@ -478,36 +670,29 @@ def profile():
     """, (user["id"], user["id"]))
     trips_count = cur.fetchone()["count"]
     
-    # Get task completion rate
-    cur.execute("""
-        SELECT COUNT(*) as count FROM tasks t
-        JOIN days d ON t.day_id = d.id
-        JOIN trips tr ON d.trip_id = tr.id
-        LEFT JOIN trip_members tm ON tr.id = tm.trip_id
-        WHERE (tr.owner_id = %s OR tm.user_id = %s) AND t.is_deleted = false
-    """, (user["id"], user["id"]))
-    total_tasks = cur.fetchone()["count"]
-    
+    # Task completion rate: the user's own, tasks on their trips they answered YES to
     cur.execute("""
-        SELECT COUNT(DISTINCT t.id) as count FROM tasks t
-        JOIN days d ON t.day_id = d.id
-        JOIN trips tr ON d.trip_id = tr.id
-        LEFT JOIN trip_members tm ON tr.id = tm.trip_id
-        JOIN task_status_events tse ON t.id = tse.task_id
-        WHERE (tr.owner_id = %s OR tm.user_id = %s) AND t.is_deleted = false AND tse.status = %s
-    """, (user["id"], user["id"], 'YES'))
-    completed_tasks = cur.fetchone()["count"]
+        SELECT COUNT(*) AS total,
+            COUNT(*) FILTER (WHERE EXISTS (
+                SELECT 1 FROM task_status_current tsc
+                WHERE tsc.task_id = t.id AND tsc.user_id = %(user_id)s AND tsc.status = 'YES'
+            )) AS completed
+        FROM tasks t
+        JOIN trips tr ON tr.id = t.trip_id
+        WHERE t.is_deleted = false
+        AND (tr.owner_id = %(user_id)s OR EXISTS (
+            SELECT 1 FROM trip_members tm
+            WHERE tm.trip_id = tr.id AND tm.user_id = %(user_id)s
+        ))
+    """, {"user_id": user["id"]})
+    row = cur.fetchone()
+    total_tasks, completed_tasks = row["total"], row["completed"]
     
     task_completion_rate = f"{int((completed_tasks / total_tasks * 100) if total_tasks > 0 else 0)}%"
     
-    # Get friend count
-    cur.execute(
-        "SELECT COUNT(*) as count FROM friends WHERE user_id = %s",
-        (user["id"],)
-    )
-    friends_count = cur.fetchone()["count"]
-    
     cur.close()
+
+    friends_count = friend_count(conn, user["id"])
     
     stats = {
         "trips_completed": trips_count,
@@ -538,7 +723,9 @@ def csv_to_trip_json(csv_file):
     
     # Use csv.reader with proper quoting to handle commas in values
     try:
-        reader = csv.DictReader(lines, quoting=csv.QUOTE_ALL)
+        # From the text, not the lines, so quoted newlines (exported
+        # descriptions) survive
+        reader = csv.DictReader(io.StringIO(content, newline=""), quoting=csv.QUOTE_ALL)
         rows = []
         for row_num, row in enumerate(reader, 2):  # Start at 2 since row 1 is header
             # Skip completely empty rows
@@ -653,95 +840,87 @@ def csv_to_trip_json(csv_file):
     }
 
 
-@app.route("/import-trip", methods=["POST"])
+@bp.route("/import-trip", methods=["POST"])
 def import_trip():
-    print(">>> IMPORT ROUTE HIT", flush=True)
+    started = time.perf_counter()
     file = request.files.get("trip_file")
 
     if not file or not file.filename:
         flash("No file uploaded")
-        return redirect(url_for("import_trips_page"))
-    
-    print(f">>> Processing file: {file.filename}", flush=True)
+        return redirect(url_for("main.import_trips_page"))
     
+    fmt = os.path.splitext(file.filename)[1].lstrip(".").lower() or "none"
+
     # Handle CSV files
     if file.filename.endswith(".csv"):
         try:
-            print(">>> Parsing CSV...", flush=True)
             data = csv_to_trip_json(file)
-            print(f">>> CSV parsed successfully: {data.get('trip_name')}", flush=True)
         except ValueError as e:
-            print(f">>> CSV Error: {str(e)}", flush=True)
+            metrics.imports.inc(format=fmt, outcome="rejected")
+            log.info("trip_import_rejected", filename=file.filename, error=str(e))
             flash(f"CSV Error: {str(e)}")
-            return redirect(url_for("import_trips_page"))
+            return redirect(url_for("main.import_trips_page"))
         except Exception as e:
-            print(f">>> Unexpected CSV error: {str(e)}", flush=True)
+            metrics.imports.inc(format=fmt, outcome="rejected")
+            log.exception("trip_import_parse_failed", filename=file.filename)
             flash(f"Failed to parse CSV: {str(e)}")
-            return redirect(url_for("import_trips_page"))
+            return redirect(url_for("main.import_trips_page"))
     elif file.filename.endswith(".json"):
         try:
-            print(">>> Parsing JSON...", flush=True)
             data = json.load(file)
-            print(f">>> JSON parsed successfully", flush=True)
         except Exception as e:
-            print(f">>> JSON Error: {str(e)}", flush=True)
+            metrics.imports.inc(format=fmt, outcome="rejected")
+            log.info("trip_import_rejected", filename=file.filename, error=str(e))
             flash(f"Failed to parse JSON: {str(e)}")
-            return redirect(url_for("import_trips_page"))
+            return redirect(url_for("main.import_trips_page"))
     else:
-        print(f">>> Invalid file format: {file.filename}", flush=True)
+        metrics.imports.inc(format="other", outcome="rejected")
         flash("Invalid file format. Please upload a CSV or JSON file.")
-        return redirect(url_for("import_trips_page"))
+        return redirect(url_for("main.import_trips_page"))
 
     # At this point, 'data' is in the canonical JSON structure (from CSV or JSON)
     try:
-        print(">>> Starting database operations...", flush=True)
         trip_id = uid()
         trip_name = data.get("trip_name")
         start_date = data.get("start_date")
         end_date = data.get("end_date")
         
-        print(f">>> Trip details: {trip_name}, {start_date} to {end_date}", flush=True)
-        
         # Check current user
         if not hasattr(g, 'current_user') or not g.current_user:
-            print(">>> No current user found, using fallback", flush=True)
             owner_id = "user_1"  # Fallback user
         else:
             owner_id = g.current_user["id"]
-            print(f">>> Using current user: {owner_id}", flush=True)
 
         conn = get_db()
         cur = conn.cursor()
         now = datetime.now().isoformat()
 
         # Insert trip
-        print(">>> Inserting trip...", flush=True)
         cur.execute("""
             INSERT INTO trips (id, name, start_date, end_date, owner_id, created_at)
             VALUES (%s, %s, %s, %s, %s, %s)
         """, (trip_id, trip_name, start_date, end_date, owner_id, now))
 
         # Insert owner as member
-        print(">>> Adding trip member...", flush=True)
         cur.execute("""
             INSERT INTO trip_members (trip_id, user_id, role, joined_at)
             VALUES (%s, %s, %s, %s)
         """, (trip_id, owner_id, "owner", now))
 
         # Insert days & tasks
-        print(f">>> Processing {len(data.get('days', []))} days...", flush=True)
         for day_idx, day in enumerate(data.get("days", [])):
             day_id = uid()
             day_date = day["date"]
-            
-            print(f">>> Processing day {day_idx + 1}: {day_date} with {len(day.get('tasks', []))} tasks", flush=True)
 
             cur.execute("""
                 INSERT INTO days (id, trip_id, date)
                 VALUES (%s, %s, %s)
             """, (day_id, trip_id, day_date))
 
-            for idx, task in enumerate(day.get("tasks", [])):
+            day_tasks = day.get("tasks", [])
+            order_keys = keys_between(None, None, len(day_tasks))
+
+            for idx, task in enumerate(day_tasks):
                 task_id = uid()
 
                 cur.execute("""
@@ -750,9 +929,9 @@ def import_trip():
                         title, description,
                         start_time, end_time,
                         lat, lng,
-                        order_index, created_at
+                        order_index, order_key, created_at
                     )
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                 """, (
                     task_id,
                     trip_id,
@@ -764,23 +943,62 @@ def import_trip():
                     task.get("lat"),
                     task.get("lng"),
                     idx,
+                    order_keys[idx],
                     now
                 ))
 
         #conn.commit()
         cur.close()
-        
-        print(">>> Trip imported successfully!", flush=True)
+
+        task_count = sum(len(day.get("tasks", [])) for day in data.get("days", []))
+        metrics.imports.inc(format=fmt, outcome="imported")
+        metrics.import_tasks.inc(task_count)
+        metrics.import_seconds.observe(time.perf_counter() - started, format=fmt)
+        log.info("trip_imported", trip_id=trip_id, user_id=owner_id,
+                 days=len(data.get("days", [])), tasks=task_count)
         flash("Trip imported successfully")
-        return redirect(url_for("dashboard"))
+        return redirect(url_for("main.dashboard"))
         
     except Exception as e:
-        print(f">>> Database error: {str(e)}", flush=True)
+        metrics.imports.inc(format=fmt, outcome="failed")
+        log.exception("trip_import_failed")
         flash(f"Database error: {str(e)}")
-        return redirect(url_for("import_trips_page"))
+        return redirect(url_for("main.import_trips_page"))
+
+
+def export_response(fmt, filename, trip_id=None):
+    # Streamed on the export's own connection (trip_export.py)
+    return Response(
+        export_stream(fmt, g.current_user["id"], trip_id, role=request_role()),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}.{fmt}"',
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
+@bp.route("/trip/<trip_id>/export.<fmt>")
+@read_only
+@login_required
+def export_trip(trip_id, fmt):
+    if fmt not in EXPORT_FORMATS:
+        return "Unknown export format", 404
+    if not user_trip(get_db(), trip_id, g.current_user["id"]):
+        return "Trip not found", 404
+    return export_response(fmt, f"trip-{trip_id}", trip_id)
+
+
+@bp.route("/trips/export.<fmt>")
+@read_only
+@login_required
+def export_trips(fmt):
+    if fmt not in EXPORT_FORMATS:
+        return "Unknown export format", 404
+    return export_response(fmt, "trips")
 
 
-@app.route("/trip/<trip_id>/delete", methods=["POST"])
+@bp.route("/trip/<trip_id>/delete", methods=["POST"])
 @login_required
 def delete_trip(trip_id):
     conn = get_db()
@@ -796,7 +1014,7 @@ def delete_trip(trip_id):
     if not trip:
         cur.close()
         flash("Trip not found or you don't have permission to delete it")
-        return redirect(url_for("trips_page"))
+        return redirect(url_for("main.trips_page"))
     
     try:
         # Delete in order to respect foreign key constraints
@@ -819,13 +1037,19 @@ def delete_trip(trip_id):
         # 3. Delete transport groups
         cur.execute("DELETE FROM transport_groups WHERE trip_id = %s", (trip_id,))
         
-        # 4. Delete task status events
+        # 4. Delete task status events and their compacted state
         cur.execute("""
             DELETE FROM task_status_events 
             WHERE task_id IN (
                 SELECT id FROM tasks WHERE trip_id = %s
             )
         """, (trip_id,))
+        cur.execute("""
+            DELETE FROM task_status_current
+            WHERE task_id IN (
+                SELECT id FROM tasks WHERE trip_id = %s
+            )
+        """, (trip_id,))
         
         # 5. Delete task assignments
         cur.execute("""
@@ -853,29 +1077,24 @@ def delete_trip(trip_id):
         conn.commit()
         
         flash(f"Trip '{trip['name']}' has been deleted successfully")
-        return redirect(url_for("trips_page"))
+        return redirect(url_for("main.trips_page"))
         
     except Exception as e:
         conn.rollback()
+        log.exception("trip_delete_failed", trip_id=trip_id)
         flash(f"Error deleting trip: {str(e)}")
-        return redirect(url_for("trips_page"))
-        print(f">>> Database error: {str(e)}", flush=True)
-        flash(f"Database error: {str(e)}")
-        return redirect(url_for("import_trips_page"))
+        return redirect(url_for("main.trips_page"))
 
 
-@app.route("/dashboard")
+@bp.route("/dashboard")
+@read_only
 @login_required
 def dashboard():
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM trips WHERE owner_id = %s ORDER BY created_at DESC", 
-                        (g.current_user["id"],))
-    trips = cur.fetchall()
-    cur.close()
-    return render_template("dashboard.html", trips=trips)
+    # The dashboard only links to /trips; it doesn't list them itself
+    return render_template("dashboard.html")
 
-@app.route("/analytics")
+@bp.route("/analytics")
+@read_only
 @login_required
 def analytics():
     scope = request.args.get("scope", "overall")
@@ -898,7 +1117,8 @@ def analytics():
 
     return data
 
-@app.route("/analytics-ui")
+@bp.route("/analytics-ui")
+@read_only
 @login_required
 def analytics_ui():
     conn = get_db()
@@ -915,70 +1135,62 @@ def analytics_ui():
     cur.close()
     return render_template("analytics.html", trips=trips)
 
-@app.route("/trips")
+@bp.route("/trips")
+@read_only
 @login_required
 def trips_page():
-    conn = get_db()
-    cur = conn.cursor()
-    # Get trips where user is owner OR member
-    cur.execute("""
-        SELECT DISTINCT t.*, tm.role
-        FROM trips t
-        LEFT JOIN trip_members tm ON t.id = tm.trip_id
-        WHERE t.owner_id = %s OR tm.user_id = %s
-        ORDER BY t.created_at DESC
-    """, (g.current_user["id"], g.current_user["id"]))
-    trips = cur.fetchall()
-    cur.close()
-    return render_template("trips.html", trips=trips)
+    # First page only; the rest is fetched from /trips/more on scroll
+    trips, has_more = user_trips_page(get_db(), g.current_user["id"])
+    return render_template("trips.html", trips=trips, next_cursor=trips_cursor(trips, has_more))
+
+@bp.route("/trips/more")
+@read_only
+@login_required
+def trips_more():
+    try:
+        after = decode_cursor(2)
+    except ApiError as e:
+        return jsonify({"error": e.message}), e.status
+    if not after:
+        return jsonify({"error": "cursor is required"}), 400
+
+    trips, has_more = user_trips_page(get_db(), g.current_user["id"], after=after)
+    return jsonify({
+        "html": render_template("fragments/trip_cards.html", trips=trips),
+        "next_cursor": trips_cursor(trips, has_more),
+    })
+
+def trips_cursor(trips, has_more):
+    if not has_more:
+        return None
+    return encode_cursor([trips[-1]["created_at"], trips[-1]["id"]])
 
-@app.route("/import-trips")
+@bp.route("/import-trips")
 @login_required
 def import_trips_page():
     return render_template("import_trips.html")
 
-@app.route("/friends")
+@bp.route("/friends")
 @login_required
 def friends_page():
     try:
         user_id = g.current_user["id"]
         conn = get_db()
-        cur = conn.cursor()
-
-        # Get friends list
-        cur.execute("""
-            SELECT u.id, u.name
-            FROM friends f
-            JOIN users u ON u.id = f.friend_id
-            WHERE f.user_id = %s
-        """, (user_id,))
-        friends = cur.fetchall()
-        
-        # Get pending friend requests
-        cur.execute("""
-            SELECT fr.id, fr.sender_id, u.name as sender_name, fr.message, fr.created_at
-            FROM friend_requests fr
-            JOIN users u ON u.id = fr.sender_id
-            WHERE fr.receiver_id = %s AND fr.status = %s
-        """, (user_id, 'pending'))
-        pending = cur.fetchall()
-
-        cur.close()
 
         return render_template(
             "friends.html",
-            friends=friends,
-            pending=pending,
+            friends=friends_of(conn, user_id),
+            pending=pending_requests(conn, user_id),
             current_user=g.current_user,
-            public_id=make_public_id(g.current_user["id"])
+            public_id=g.current_user["public_id"]
         )
-    except Exception as e:
-        print(f"Error in friends_page: {e}")
+    except Exception:
+        log.exception("friends_page_failed")
         flash("Error loading friends page. Please try again.", "error")
         return redirect("/dashboard")
 
 
-@app.route("/friends/add", methods=["POST"])
+@bp.route("/friends/add", methods=["POST"])
 @login_required
 def add_friend():
     try:
@@ -991,128 +1203,70 @@ def add_friend():
             return redirect("/friends")
 
         conn = get_db()
-        
-        # Resolve public ID to actual user ID
-        receiver_id = resolve_public_id(friend_public_id, conn)
-        
-        if not receiver_id:
-            flash("User not found. Please check the Member ID and try again.", "error")
-            return redirect("/friends")
-
-        if sender_id == receiver_id:
-            flash("You cannot add yourself as a friend", "error")
-            return redirect("/friends")
+        now = datetime.now().isoformat()
 
-        cur = conn.cursor()
-        
-        # Check if already friends
-        cur.execute("""
-            SELECT 1 FROM friends
-            WHERE user_id = %s AND friend_id = %s
-        """, (sender_id, receiver_id))
-        already_friends = cur.fetchone()
+        # One statement checks and inserts (accepting instead if they
+        # already asked us)
+        outcome, receiver_id = send_friend_request(
+            conn, uid(), sender_id, friend_public_id, message, now
+        )
 
-        if already_friends:
-            cur.close()
+        if outcome == friend_graph.NOT_FOUND:
+            flash("User not found. Please check the Member ID and try again.", "error")
+        elif outcome == friend_graph.SELF:
+            flash("You cannot add yourself as a friend", "error")
+        elif outcome == friend_graph.ALREADY_FRIENDS:
             flash("You are already friends with this person!", "info")
-            return redirect("/friends")
-
-        # Check if request already exists
-        cur.execute("""
-            SELECT 1 FROM friend_requests
-            WHERE sender_id = %s AND receiver_id = %s AND status = %s
-        """, (sender_id, receiver_id, 'pending'))
-        request_exists = cur.fetchone()
-
-        if request_exists:
-            cur.close()
+        elif outcome == friend_graph.ALREADY_SENT:
             flash("Friend request already sent to this person!", "info")
-            return redirect("/friends")
-
-        # Create friend request
-        request_id = uid()
-        now = datetime.now().isoformat()
-
-        cur.execute("""
-            INSERT INTO friend_requests (id, sender_id, receiver_id, message, status, created_at)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """, (request_id, sender_id, receiver_id, message, 'pending', now))
-
-        conn.commit()
-        cur.close()
-
-        flash(f"Friend request sent successfully! 🎉", "success")
+        elif outcome == friend_graph.ACCEPTED:
+            bump_versions(conn, [friends_scope(sender_id), friends_scope(receiver_id)])
+            conn.commit()
+            flash("They had already sent you a request, so you are now friends! 🎉", "success")
+        else:
+            conn.commit()
+            flash(f"Friend request sent successfully! 🎉", "success")
         return redirect("/friends")
         
-    except Exception as e:
-        print(f"Error in add_friend: {e}")
+    except Exception:
+        log.exception("friend_request_failed")
         flash("Error sending friend request. Please try again.", "error")
         return redirect("/friends")
 
 
 
 
-@app.route("/friends/accept/<sender_id>")
+@bp.route("/friends/accept/<sender_id>")
 @login_required
 def accept_friend(sender_id):
     user_id = g.current_user["id"]
     conn = get_db()
-    cur = conn.cursor()
     now = datetime.now().isoformat()
 
     try:
-        # Check if friend request exists
-        cur.execute("""
-            SELECT id FROM friend_requests
-            WHERE sender_id = %s AND receiver_id = %s AND status = %s
-        """, (sender_id, user_id, 'pending'))
-        request_exists = cur.fetchone()
-        
-        if not request_exists:
+        # Flips the request and links both directions in one statement;
+        # a concurrent second accept finds nothing pending
+        if not accept_friend_request(conn, sender_id, user_id, now):
             flash("Friend request not found or already processed", "error")
-            cur.close()
             return redirect("/friends")
-        
-        # Check if they're already friends (prevent duplicates)
-        cur.execute("""
-            SELECT 1 FROM friends
-            WHERE user_id = %s AND friend_id = %s
-        """, (user_id, sender_id))
-        already_friends = cur.fetchone()
-        
-        if not already_friends:
-            # Add both directions to friends table
-            cur.execute("""
-                INSERT INTO friends (user_id, friend_id, created_at)
-                VALUES (%s, %s, %s)
-            """, (user_id, sender_id, now))
-
-            cur.execute("""
-                INSERT INTO friends (user_id, friend_id, created_at)
-                VALUES (%s, %s, %s)
-            """, (sender_id, user_id, now))
 
-        # Update friend request status
-        cur.execute("""
-            UPDATE friend_requests
-            SET status = %s, responded_at = %s
-            WHERE sender_id = %s AND receiver_id = %s
-        """, ('accepted', now, sender_id, user_id))
+        # The invite dropdown on both users' trip pages changes
+        bump_versions(conn, [friends_scope(user_id), friends_scope(sender_id)])
 
         conn.commit()
-        cur.close()
+        mark_write()
 
         flash("Friend request accepted! 🎉", "success")
         return redirect("/friends")
         
-    except Exception as e:
+    except Exception:
         conn.rollback()
-        print(f"Error accepting friend request: {e}")
+        log.exception("friend_accept_failed", sender_id=sender_id)
         flash("Error processing friend request. Please try again.", "error")
         return redirect("/friends")
 
 
-@app.route("/friends/reject/<sender_id>")
+@bp.route("/friends/reject/<sender_id>")
 @login_required
 def reject_friend(sender_id):
     user_id = g.current_user["id"]
@@ -1120,41 +1274,24 @@ def reject_friend(sender_id):
     now = datetime.now().isoformat()
 
     try:
-        # Check if friend request exists
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT id FROM friend_requests
-            WHERE sender_id = %s AND receiver_id = %s AND status = 'pending'
-        """, (sender_id, user_id))
-        request_exists = cur.fetchone()
-        cur.close()
-        
-        if not request_exists:
+        if not reject_friend_request(conn, sender_id, user_id, now):
             flash("Friend request not found or already processed", "error")
             return redirect("/friends")
 
-        # Update friend request status to rejected
-        cur = conn.cursor()
-        cur.execute("""
-            UPDATE friend_requests
-            SET status = 'rejected', responded_at = %s
-            WHERE sender_id = %s AND receiver_id = %s
-        """, (now, sender_id, user_id))
-        cur.close()
-
         conn.commit()
+        mark_write()
 
         flash("Friend request declined", "info")
         return redirect("/friends")
         
-    except Exception as e:
+    except Exception:
         conn.rollback()
-        print(f"Error rejecting friend request: {e}")
+        log.exception("friend_reject_failed", sender_id=sender_id)
         flash("Error processing friend request. Please try again.", "error")
         return redirect("/friends")
 
 
-@app.route("/trip/<trip_id>/invite-friend", methods=["POST"])
+@bp.route("/trip/<trip_id>/invite-friend", methods=["POST"])
 @login_required
 def invite_friend_to_trip(trip_id):
     conn = get_db()
@@ -1171,64 +1308,47 @@ def invite_friend_to_trip(trip_id):
         flash("Trip not found or you don't have permission", "error")
         return redirect("/trips")
     
-    friend_public_id = request.form.get("friend_id", "").strip()
-    
-    if not friend_public_id:
-        flash("Please select a friend to invite", "error")
-        return redirect(f"/trip/{trip_id}")
-    
-    # Resolve public ID to user ID
-    friend_id = resolve_public_id(friend_public_id, conn)
-    
-    if not friend_id:
-        flash("Friend not found", "error")
-        return redirect(f"/trip/{trip_id}")
-    
-    # Check if already a member
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT 1 FROM trip_members 
-        WHERE trip_id = %s AND user_id = %s
-    """, (trip_id, friend_id))
-    existing_member = cur.fetchone()
     cur.close()
-    
-    if existing_member:
-        flash("This friend is already a member of this trip", "info")
+
+    friend_public_ids = [p.strip() for p in request.form.getlist("friend_id") if p.strip()]
+
+    if not friend_public_ids:
+        flash("Please select a friend to invite", "error")
         return redirect(f"/trip/{trip_id}")
-    
-    # Add friend as trip member
+
+    # Add every selected friend in one statement; non-friends and
+    # existing members are skipped
     now = datetime.now().isoformat()
-    
+
     try:
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO trip_members (trip_id, user_id, role, joined_at)
-            VALUES (%s, %s, 'member', %s)
-        """, (trip_id, friend_id, now))
-        cur.close()
-        conn.commit()
-        
+        added = invite_friends_to_trip(
+            conn, trip_id, g.current_user["id"], friend_public_ids, now
+        )
+        for friend_id in added:
+            publish(conn, trip_id, None, "members", action="added", user_id=friend_id)
         conn.commit()
-        
-        # Get friend name for message
-        cur = conn.cursor()
-        cur.execute("SELECT name FROM users WHERE id = %s", (friend_id,))
-        friend = cur.fetchone()
-        cur.close()
-        friend_name = friend["name"] if friend else "Friend"
-        
-        flash(f"{friend_name} has been added to the trip! 🎉", "success")
+
+        if not added:
+            flash("Those friends are already members of this trip", "info")
+        elif len(added) == 1:
+            cur = conn.cursor()
+            cur.execute("SELECT name FROM users WHERE id = %s", (added[0],))
+            friend = cur.fetchone()
+            cur.close()
+            friend_name = friend["name"] if friend else "Friend"
+            flash(f"{friend_name} has been added to the trip! 🎉", "success")
+        else:
+            flash(f"{len(added)} friends have been added to the trip! 🎉", "success")
         return redirect(f"/trip/{trip_id}")
-        
-    except Exception as e:
+
+    except Exception:
         conn.rollback()
-        print(f"Error inviting friend to trip: {e}")
+        log.exception("trip_invite_failed", trip_id=trip_id)
         flash("Error adding friend to trip. Please try again.", "error")
         return redirect(f"/trip/{trip_id}")
 
 
-@app.route("/trip/<trip_id>/remove-member/<user_id>", methods=["POST"])
+@bp.route("/trip/<trip_id>/remove-member/<user_id>", methods=["POST"])
 @login_required
 def remove_trip_member(trip_id, user_id):
     conn = get_db()
@@ -1258,29 +1378,30 @@ def remove_trip_member(trip_id, user_id):
             WHERE trip_id = %s AND user_id = %s
         """, (trip_id, user_id))
         cur.close()
-        conn.commit()
-        
+
+        publish(conn, trip_id, None, "members", action="removed", user_id=user_id)
         conn.commit()
         
         flash("Member removed from trip", "info")
         return redirect(f"/trip/{trip_id}")
         
-    except Exception as e:
+    except Exception:
         conn.rollback()
-        print(f"Error removing trip member: {e}")
+        log.exception("trip_member_remove_failed", trip_id=trip_id, user_id=user_id)
         flash("Error removing member. Please try again.", "error")
         return redirect(f"/trip/{trip_id}")
 
 
-@app.route("/task/<task_id>/edit", methods=["GET", "POST"])
+@bp.route("/task/<task_id>/edit", methods=["GET", "POST"])
 def edit_task(task_id):
     conn = get_db()
     cur = conn.cursor()
 
-    cur.execute(
-        "SELECT * FROM tasks WHERE id = %s",
-        (task_id,)
-    )
+    cur.execute(f"""
+        SELECT {TASK_FIELDS_SQL}
+        FROM tasks t JOIN days d ON d.id = t.day_id
+        WHERE t.id = %s
+    """, (task_id,))
     task = cur.fetchone()
 
     if not task:
@@ -1314,12 +1435,14 @@ def edit_task(task_id):
             WHERE id = %s
         """, (title, start_time, end_time, lat, lng, task_id))
         cur.close()
-        conn.commit()
 
+        publish(conn, trip["id"], day["id"], "task", action="edited",
+                task_id=task_id, title=title,
+                start_time=start_time, end_time=end_time)
         conn.commit()
 
         return redirect(
-            url_for("day_view", trip_id=trip["id"], day_id=day["id"])
+            url_for("main.day_view", trip_id=trip["id"], day_id=day["id"])
         )
 
     return render_template(
@@ -1329,7 +1452,7 @@ def edit_task(task_id):
         day=day
     )
 
-@app.route("/task/<task_id>/add", methods=["GET", "POST"])
+@bp.route("/task/<task_id>/add", methods=["GET", "POST"])
 def add_task(task_id):
     pos = request.args.get("pos", "after")
 
@@ -1369,43 +1492,44 @@ def add_task(task_id):
         lat = request.form.get("lat")
         lng = request.form.get("lng")
 
-        base_index = ref_task["order_index"]
+        new_task_id = uid()
 
-        if pos == "before":
-            new_index = base_index - 0.5
-        else:
-            new_index = base_index + 0.5
+        with locked_day(conn, day["id"]):
+            new_key = key_for_insert(conn, day["id"], ref_task["id"], pos)
 
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO tasks (
-                id, trip_id, day_id,
-                title, description,
-                start_time, end_time,
-                lat, lng,
-                order_index, created_at
-            )
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
-            uid(),
-            trip["id"],
-            day["id"],
-            title,
-            "",
-            start_time,
-            end_time,
-            lat,
-            lng,
-            new_index,
-            datetime.now().isoformat()
-        ))
-        cur.close()
-        conn.commit()
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO tasks (
+                    id, trip_id, day_id,
+                    title, description,
+                    start_time, end_time,
+                    lat, lng,
+                    order_key, created_at
+                )
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, (
+                new_task_id,
+                trip["id"],
+                day["id"],
+                title,
+                "",
+                start_time,
+                end_time,
+                lat,
+                lng,
+                new_key,
+                datetime.now().isoformat()
+            ))
+            cur.close()
 
-        conn.commit()
+            publish(conn, trip["id"], day["id"], "task", action="added",
+                    task_id=new_task_id)
+
+        if len(new_key) > MAX_KEY_LENGTH:
+            schedule_rebalance(day["id"])
 
         return redirect(
-            url_for("day_view", trip_id=trip["id"], day_id=day["id"])
+            url_for("main.day_view", trip_id=trip["id"], day_id=day["id"])
         )
 
     return render_template(
@@ -1416,7 +1540,7 @@ def add_task(task_id):
         position=pos
     )
 
-@app.route("/task/<task_id>/delete", methods=["POST", "GET"])
+@bp.route("/task/<task_id>/delete", methods=["POST", "GET"])
 def delete_task(task_id):
     conn = get_db()
     cur = conn.cursor()
@@ -1437,20 +1561,25 @@ def delete_task(task_id):
         "UPDATE tasks SET is_deleted = true WHERE id = %s",
         (task_id,)
     )
-    conn.commit()
     cur.close()
 
+    publish(conn, task["trip_id"], task["day_id"], "task", action="deleted",
+            task_id=task_id)
+    conn.commit()
+    mark_write()
+
     if request.method == "POST" or request.headers.get('Accept') == 'application/json':
         return jsonify({"success": True, "message": "Task deleted successfully"})
     else:
         # For GET requests, redirect back to day view
         return redirect(
-            url_for("day_view",
+            url_for("main.day_view",
                     trip_id=task["trip_id"],
                     day_id=task["day_id"])
         )
 
-@app.route("/task/<task_id>/status/<status>", methods=["POST"])
+@bp.route("/task/<task_id>/status/<status>", methods=["POST"])
+@login_required
 def update_task_status(task_id, status):
     if status not in ("YES", "NO", "SKIPPED"):
         return {"success": False, "error": "Invalid status"}, 400
@@ -1468,26 +1597,19 @@ def update_task_status(task_id, status):
         cur.close()
         return {"success": False, "error": "Task not found"}, 404
 
-    # Insert status event instead of updating task directly
-    cur.execute("""
-        INSERT INTO task_status_events (id, task_id, user_id, status, responded_at)
-        VALUES (%s, %s, %s, %s, %s)
-    """, (
-        uid(),
-        task_id,
-        g.current_user["id"],
-        status,
-        datetime.now().isoformat()
-    ))
     cur.close()
-    conn.commit()
 
+    # Append to the event log and fold into the current state
+    record_status(conn, task_id, g.current_user["id"], status)
+    publish(conn, task["trip_id"], task["day_id"], "status",
+            task_id=task_id, user_id=g.current_user["id"], status=status)
     conn.commit()
 
     return {"success": True, "status": status}
 
 
-@app.route("/task/<task_id>/status/reset", methods=["POST"])
+@bp.route("/task/<task_id>/status/reset", methods=["POST"])
+@login_required
 def reset_task_status(task_id):
     conn = get_db()
 
@@ -1502,25 +1624,73 @@ def reset_task_status(task_id):
     if not task:
         return {"success": False, "error": "Task not found"}, 404
 
-    # Delete all status events for this task
+    # Log a RESET event; clears only this member's current status
+    reset_status(conn, task_id, g.current_user["id"])
+    publish(conn, task["trip_id"], task["day_id"], "status",
+            task_id=task_id, user_id=g.current_user["id"], status=None)
+    conn.commit()
+
+    return {"success": True}
+
+
+@bp.route("/task/<task_id>/notes", methods=["GET", "POST"])
+@login_required
+def task_notes(task_id):
+    user_id = g.current_user["id"]
+    conn = get_db()
     cur = conn.cursor()
-    cur.execute(
-        "DELETE FROM task_status_events WHERE task_id = %s",
-        (task_id,)
-    )
+    cur.execute("""
+        SELECT x.* FROM tasks x
+        JOIN trips t ON t.id = x.trip_id
+        WHERE x.id = %s
+        AND (t.owner_id = %s OR EXISTS (
+            SELECT 1 FROM trip_members tm
+            WHERE tm.trip_id = t.id AND tm.user_id = %s
+        ))
+    """, (task_id, user_id, user_id))
+    task = cur.fetchone()
     cur.close()
-    conn.commit()
 
-    conn.commit()
+    if not task:
+        return "Task not found", 404
 
-    return {"success": True}
+    if request.method == "POST":
+        content = request.form.get("content", "")
+        # Autosave asks for JSON; the Save button expects a page
+        wants_json = request.accept_mimetypes.best == "application/json"
+
+        try:
+            revision = save_note(conn, task_id, user_id, content)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            log.exception("task_notes_save_failed", task_id=task_id)
+            if wants_json:
+                return {"success": False, "error": "Could not save notes"}, 409
+            flash("Error saving notes. Please try again.", "error")
+            return redirect(url_for("main.task_notes", task_id=task_id))
+
+        if wants_json:
+            return {"success": True, "revision": revision}
+        flash("Notes saved", "success")
+        return redirect(url_for("main.task_notes", task_id=task_id))
+
+    note = get_note(conn, task_id)
+    return render_template(
+        "task_notes.html",
+        task=task,
+        note=note,
+        history=note_history(conn, note)
+    )
 
 
-@app.route("/trip/<trip_id>")
+@bp.route("/trip/<trip_id>")
+@read_only
 @login_required
 def trip_view(trip_id):
     conn = get_db()
     cur = conn.cursor()
+    user_id = g.current_user["id"]
 
     # Check if user is owner or member of the trip
     cur.execute("""
@@ -1528,13 +1698,20 @@ def trip_view(trip_id):
         FROM trips t
         LEFT JOIN trip_members tm ON t.id = tm.trip_id
         WHERE t.id = %s AND (t.owner_id = %s OR tm.user_id = %s)
-    """, (trip_id, g.current_user["id"], g.current_user["id"]))
+    """, (trip_id, user_id, user_id))
     trip = cur.fetchone()
 
     if not trip:
         cur.close()
         return "Trip not found", 404
 
+    versions = get_versions(conn, [trip_scope(trip_id), friends_scope(user_id)])
+    etag, last_modified = page_validators(versions, user_id, date.today())
+    cached = not_modified(etag, last_modified)
+    if cached:
+        cur.close()
+        return cached
+
     cur.execute("""
         SELECT * FROM days
         WHERE trip_id = %s
@@ -1552,25 +1729,33 @@ def trip_view(trip_id):
     """, (trip_id,))
     members = cur.fetchall()
 
-    # Get user's friends (for invitation dropdown) with public IDs
-    cur.execute("""
-        SELECT u.id, u.name
-        FROM friends f
-        JOIN users u ON u.id = f.friend_id
-        WHERE f.user_id = %s
-    """, (g.current_user["id"],))
-    friends = cur.fetchall()
     cur.close()
-    
-    # Convert to list with public IDs
-    friends_with_public_ids = []
-    for friend in friends:
-        friends_with_public_ids.append({
-            'id': friend['id'],
-            'public_id': make_public_id(friend['id']),
-            'name': friend['name']
-        })
 
+    # Friends not on the trip yet, for the invite form
+    friends = invitable_friends(conn, user_id, trip_id)
+
+    past_days, today_day, upcoming_days = split_days(days)
+
+    member_list_html = fragment_cache.render(
+        ("trip-members", trip_id, versions[trip_scope(trip_id)][0]),
+        "fragments/trip_members.html",
+        members=members
+    )
+
+    response = make_response(render_template(
+        "trip.html",
+        trip=trip,
+        past_days=past_days,
+        today_day=today_day,
+        upcoming_days=upcoming_days,
+        members=members,
+        member_list_html=member_list_html,
+        friends=friends
+    ))
+    return with_validators(response, etag, last_modified)
+
+def split_days(days):
+    """(past_days, today_day, upcoming_days) relative to today"""
     today = date.today()
 
     past_days = []
@@ -1591,17 +1776,10 @@ def trip_view(trip_id):
         else:
             upcoming_days.append(day)
 
-    return render_template(
-        "trip.html",
-        trip=trip,
-        past_days=past_days,
-        today_day=today_day,
-        upcoming_days=upcoming_days,
-        members=members,
-        friends=friends_with_public_ids
-    )
+    return past_days, today_day, upcoming_days
 
-@app.route("/trip/<trip_id>/day/<day_id>")
+
+@bp.route("/trip/<trip_id>/day/<day_id>")
 @login_required
 def day_view(trip_id, day_id):
     conn = get_db()
@@ -1628,6 +1806,18 @@ def day_view(trip_id, day_id):
     if not trip or not day:
         return "Not found", 404
 
+    user_id = g.current_user["id"]
+    versions = get_versions(conn, [trip_scope(trip_id), day_scope(day_id)])
+    day_version = versions[day_scope(day_id)][0]
+
+    # Today's page carries live ETAs, so only other days are revalidated
+    is_today = str(day["date"]) == date.today().isoformat()
+    if not is_today:
+        etag, last_modified = page_validators(versions, user_id, date.today())
+        cached = not_modified(etag, last_modified)
+        if cached:
+            return cached
+
     # Get trip members
     cur = conn.cursor()
     cur.execute("""
@@ -1644,57 +1834,63 @@ def day_view(trip_id, day_id):
     ensure_transport_groups(trip_id, day_id)
 
     cur = conn.cursor()
-    cur.execute("""
-        SELECT * FROM tasks
-        WHERE day_id = %s AND (is_deleted IS NULL OR is_deleted = false)
-        ORDER BY order_index ASC
-    """, (day_id,))
+    cur.execute(DAY_TASKS_SQL, (day_id,))
     tasks = cur.fetchall()
     cur.close()
 
-    # Get task status from task_status_events
-    task_statuses = {}
-    if tasks:
-        task_ids = [task['id'] for task in tasks]
-        cur = conn.cursor()
-        cur.execute(f"""
-            SELECT DISTINCT task_id, status
-            FROM task_status_events
-            WHERE task_id IN ({','.join(['%s' for _ in task_ids])})
-            AND responded_at = (
-                SELECT MAX(responded_at) 
-                FROM task_status_events tse2 
-                WHERE tse2.task_id = task_status_events.task_id
-            )
-        """, task_ids)
-        status_events = cur.fetchall()
-        cur.close()
-        
-        for event in status_events:
-            task_statuses[event['task_id']] = event['status']
+    # Per-member statuses and group rollup for every task, one query
+    task_statuses = day_member_statuses(conn, day_id)
+
+    active_groups = get_active_transport_groups(trip_id, day_id)
+    last_locations = {
+        group["group"]["id"]: get_last_location(group["group"]["id"])
+        for group in active_groups
+    }
+
+    processed_tasks = build_day_tasks(
+        day, tasks, task_statuses, active_groups, last_locations, user_id
+    )
+
+    # The task list shows this member's own answers, so it is per user
+    task_list_html = fragment_cache.render(
+        ("day-tasks", day_id, day_version, user_id),
+        "fragments/day_tasks.html",
+        tasks=processed_tasks
+    )
 
+    response = make_response(render_template(
+        "day.html",
+        trip=trip,
+        day=day,
+        tasks=processed_tasks,
+        task_list_html=task_list_html,
+        active_groups=active_groups
+    ))
+    if is_today:
+        return response
+    return with_validators(response, etag, last_modified)
+
+
+def build_day_tasks(day, tasks, task_statuses, active_groups, last_locations, user_id):
+    """
+    Per-task display flags for day.html. Pure: callers fetch the rows, so
+    the sync and async day views share it.
+    """
     now = datetime.now()
 
+    # Convert day["date"] to string for comparison if it's a date object
+    if isinstance(day["date"], str):
+        day_date_str = day["date"]
+    else:
+        day_date_str = day["date"].isoformat()
+
     # compute today flag and lateness info
-    today_str = date.today().isoformat()
-    active_groups = get_active_transport_groups(trip_id, day_id)
+    is_today = (day_date_str == date.today().isoformat())
 
     processed_tasks = []
     for task in tasks:
-        # Convert day["date"] to string for comparison if it's a date object
-        if isinstance(day["date"], str):
-            day_date_str = day["date"]
-        else:
-            day_date_str = day["date"].isoformat()
-            
-        start_dt = datetime.strptime(
-            f"{day_date_str} {task['start_time']}",
-            "%Y-%m-%d %H:%M"
-        )
-
-        is_past = now > (start_dt + timedelta(hours=4))
-
-        is_today = (day_date_str == today_str)
+        starts_at = task["starts_at"]
+        is_past = starts_at is not None and now > starts_at + timedelta(hours=4)
 
         # default
         late_minutes = 0
@@ -1702,7 +1898,9 @@ def day_view(trip_id, day_id):
         if is_today:
             lateness_vals = []
             for group in active_groups:
-                eta = calculate_eta(group['group'], task)
+                eta = eta_from_location(
+                    group['group'], task, last_locations.get(group['group']['id'])
+                )
                 if eta:
                     _, eta_minutes = eta
                     lm = lateness_minutes(task, eta_minutes)
@@ -1713,39 +1911,25 @@ def day_view(trip_id, day_id):
                 positive = [v for v in lateness_vals if v > 0]
                 late_minutes = min(positive) if positive else 0
 
-        # Check task status from events
-        task_status = task_statuses.get(task['id'], None)
+        # This member's own answer drives the buttons; the group
+        # rollup shows how far everyone else is
+        group = task_statuses.get(task['id'])
+        task_status = group["members"].get(user_id) if group else None
         is_completed = (task_status == 'YES')
         is_skipped = (task_status == 'SKIPPED')
 
-        # format status_updated_at for display
-        status_ts = dict(task).get("status_updated_at")
-        status_display = None
-        if status_ts:
-            try:
-                status_dt = datetime.fromisoformat(status_ts)
-                status_display = status_dt.strftime("%Y-%m-%d %H:%M")
-            except Exception:
-                status_display = status_ts
-
         processed_tasks.append({
             **task,
             "is_past": is_past,
             "is_today": is_today,
             "late_minutes": late_minutes,
-            "status_updated_at": status_display,
             "completed": is_completed,
             "skipped": is_skipped,
-            "status": task_status
+            "status": task_status,
+            "group": group
         })
 
-    return render_template(
-        "day.html",
-        trip=trip,
-        day=day,
-        tasks=processed_tasks,
-        active_groups=active_groups
-    )
+    return processed_tasks
 
 
 def get_active_transport_groups(trip_id, day_id):
@@ -1950,25 +2134,71 @@ def haversine_km(lat1, lon1, lat2, lon2):
     return 2 * R * math.atan2(math.sqrt(a), math.sqrt(1 - a))
 
 
+# Only members of the group, or of the group's trip, may move it; the
+# membership check and the insert are one statement
+RECORD_LOCATION_SQL = """
+    INSERT INTO location_updates
+    (id, user_id, transport_group_id, lat, lng, recorded_at)
+    SELECT %(id)s, %(user_id)s, tg.id, %(lat)s, %(lng)s, %(recorded_at)s
+    FROM transport_groups tg
+    WHERE tg.id = %(group_id)s AND (
+        EXISTS (
+            SELECT 1 FROM transport_group_members gm
+            WHERE gm.transport_group_id = tg.id AND gm.user_id = %(user_id)s
+        )
+        OR EXISTS (
+            SELECT 1 FROM trips t
+            LEFT JOIN trip_members tm ON t.id = tm.trip_id
+            WHERE t.id = tg.trip_id
+            AND (t.owner_id = %(user_id)s OR tm.user_id = %(user_id)s)
+        )
+    )
+"""
+
+
+def location_params(user_id, group_id, lat, lng):
+    return {
+        "id": uid(),
+        "user_id": user_id,
+        "group_id": group_id,
+        "lat": lat,
+        "lng": lng,
+        "recorded_at": datetime.now().isoformat(),
+    }
+
+
 def record_location(user_id, group_id, lat, lng):
+    """Store a member's position; False if they may not post for the group"""
     conn = get_db()
-    now = datetime.now().isoformat()
 
     cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO location_updates
-        (id, user_id, transport_group_id, lat, lng, recorded_at)
-        VALUES (%s, %s, %s, %s, %s, %s)
-    """, (
-        uid(),
-        user_id,
-        group_id,
-        lat,
-        lng,
-        now
-    ))
+    cur.execute(RECORD_LOCATION_SQL, location_params(user_id, group_id, lat, lng))
+    recorded = cur.rowcount == 1
     cur.close()
+
+    if not recorded:
+        return False
+
+    # Let day pages recompute ETAs for this group
+    publish_location(conn, group_id, lat, lng)
     conn.commit()
+    return True
+
+
+@bp.route("/group/<group_id>/location", methods=["POST"])
+@login_required
+def ingest_location(group_id):
+    """Location ping from a member's device: {"lat": .., "lng": ..}"""
+    payload = request.get_json(silent=True) or {}
+    try:
+        lat = float(payload["lat"])
+        lng = float(payload["lng"])
+    except (KeyError, TypeError, ValueError):
+        return {"success": False, "error": "lat and lng are required"}, 400
+
+    if not record_location(g.current_user["id"], group_id, lat, lng):
+        return {"success": False, "error": "Group not found"}, 404
+    return {"success": True}
 
 
 def get_last_location(group_id):
@@ -1992,8 +2222,11 @@ def calculate_eta(group, task):
     group: transport_groups row
     task: tasks row (must have lat, lng, start_time)
     """
-    last_loc = get_last_location(group["id"])
+    return eta_from_location(group, task, get_last_location(group["id"]))
 
+
+def eta_from_location(group, task, last_loc):
+    """(distance_km, eta_minutes) from a known group location, or None"""
     if not last_loc or not dict(task).get("lat") or not dict(task).get("lng"):
         return None
 
@@ -2032,33 +2265,24 @@ def save_eta_snapshot(group_id, task_id, distance_km, eta_minutes):
 
 
 def lateness_minutes(task, eta_minutes):
-    # task may not include date directly; attempt to use task['date'] else fetch day
-    task_date = task.get("date")
-
-    if not task_date:
+    # Rows from DAY_TASKS_SQL carry starts_at; fetch it for any other row
+    if "starts_at" in task:
+        task_time = task["starts_at"]
+    else:
         conn = get_db()
         cur = conn.cursor()
-        cur.execute(
-            "SELECT * FROM days WHERE id = %s", (task["day_id"],)
-        )
-        day = cur.fetchone()
+        cur.execute("""
+            SELECT d.date + t.start_time AS starts_at
+            FROM tasks t JOIN days d ON d.id = t.day_id
+            WHERE t.id = %s
+        """, (task["id"],))
+        row = cur.fetchone()
         cur.close()
-        task_date = day["date"] if day else None
+        task_time = row["starts_at"] if row else None
 
-    if not task_date:
+    if task_time is None:
         return 0
 
-    # Convert task_date to string if it's a date object
-    if isinstance(task_date, str):
-        task_date_str = task_date
-    else:
-        task_date_str = task_date.isoformat()
-
-    task_time = datetime.strptime(
-        f"{task_date_str} {task['start_time']}",
-        "%Y-%m-%d %H:%M"
-    )
-
     arrival_time = datetime.now() + timedelta(minutes=eta_minutes)
 
     if arrival_time <= task_time:
@@ -2067,7 +2291,8 @@ def lateness_minutes(task, eta_minutes):
     return int((arrival_time - task_time).total_seconds() / 60)
 
 
-@app.route("/task/<task_id>/arrive/<decision>")
+@bp.route("/task/<task_id>/arrive/<decision>")
+@login_required
 def arrive_decision(task_id, decision):
     if decision not in ("YES", "NO", "SKIPPED"):
         return "Invalid decision", 400
@@ -2086,62 +2311,308 @@ def arrive_decision(task_id, decision):
     if not task:
         return "Task not found", 404
 
-    # Record event (history)
+    # Record event; task_status_current is the current status
+    record_status(conn, task_id, g.current_user["id"], decision, now)
+    publish(conn, task["trip_id"], task["day_id"], "status",
+            task_id=task_id, user_id=g.current_user["id"], status=decision)
+    conn.commit()
+    mark_write()
+
+    return redirect(
+        url_for(
+            "main.day_view",
+            trip_id=task["trip_id"],
+            day_id=task["day_id"]
+        )
+    )
+
+
+@bp.route("/trip/<trip_id>/events")
+@bp.route("/trip/<trip_id>/day/<day_id>/events")
+@login_required
+def trip_events(trip_id, day_id=None):
+    """Server-Sent Events stream of status, task and location changes"""
+    conn = get_db()
     cur = conn.cursor()
     cur.execute("""
-        INSERT INTO task_status_events
-        (id, task_id, user_id, status, responded_at)
-        VALUES (%s, %s, %s, %s, %s)
-    """, (
-        uid(),
-        task_id,
-        "user_1",
-        decision,
-        now
-    ))
+        SELECT DISTINCT t.id
+        FROM trips t
+        LEFT JOIN trip_members tm ON t.id = tm.trip_id
+        WHERE t.id = %s AND (t.owner_id = %s OR tm.user_id = %s)
+    """, (trip_id, g.current_user["id"], g.current_user["id"]))
+    trip = cur.fetchone()
     cur.close()
 
-    # Update current task status
+    if not trip:
+        return {"success": False, "error": "Trip not found"}, 404
+
+    # The stream outlives the request context on purpose: the request's
+    # DB connection is released by teardown, the stream only holds a queue
+    return Response(
+        event_stream(trip_id, day_id),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# ---------------- CHAT ----------------
+
+def user_trip(conn, trip_id, user_id):
     cur = conn.cursor()
     cur.execute("""
-        UPDATE tasks
-        SET status = %s, status_updated_at = %s
-        WHERE id = %s
-    """, (
-        decision,
-        now,
-        task_id
-    ))
+        SELECT t.* FROM trips t
+        WHERE t.id = %s AND (t.owner_id = %s OR EXISTS (
+            SELECT 1 FROM trip_members tm
+            WHERE tm.trip_id = t.id AND tm.user_id = %s
+        ))
+    """, (trip_id, user_id, user_id))
+    trip = cur.fetchone()
     cur.close()
+    return trip
+
+def json_row(message):
+    return {k: jsonable(v) for k, v in message.items()}
+
+def chat_page(conn, thread, before=None):
+    messages, has_more = chat.messages_page(conn, thread["id"], before=before)
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor([messages[-1]["created_at"], messages[-1]["id"]])
+    return {
+        "thread": json_row(thread),
+        "messages": [json_row(m) for m in messages],
+        "next_cursor": next_cursor,
+    }
+
+def chat_post(conn, thread):
+    data = request.get_json(silent=True) or request.form
+    message = (data.get("message") or "").strip()
+    if not message:
+        return {"success": False, "error": "Message is empty"}, 400
+    if len(message) > chat.MAX_MESSAGE_LENGTH:
+        return {"success": False, "error": "Message is too long"}, 400
+
+    posted = chat.post_message(conn, thread, g.current_user["id"], message)
+    # The sender has seen everything up to their own message
+    chat.mark_read(conn, thread["id"], g.current_user["id"])
     conn.commit()
+    return {"success": True, "message": json_row(posted)}, 201
+
+@bp.route("/trip/<trip_id>/chat", methods=["GET", "POST"])
+@login_required
+def trip_chat(trip_id):
+    """Latest page of the trip's thread, or post to it"""
+    conn = get_db()
+    if not user_trip(conn, trip_id, g.current_user["id"]):
+        return {"success": False, "error": "Trip not found"}, 404
+
+    thread = chat.trip_thread(conn, trip_id)
+    if request.method == "POST":
+        return chat_post(conn, thread)
+    return jsonify(chat_page(conn, thread))
 
+@bp.route("/task/<task_id>/chat", methods=["GET", "POST"])
+@login_required
+def task_chat(task_id):
+    """Latest page of the task's thread, or post to it"""
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute("SELECT id, trip_id, day_id FROM tasks WHERE id = %s", (task_id,))
+    task = cur.fetchone()
+    cur.close()
+    if not task or not user_trip(conn, task["trip_id"], g.current_user["id"]):
+        return {"success": False, "error": "Task not found"}, 404
+
+    thread = dict(chat.task_thread(conn, task["trip_id"], task_id), day_id=task["day_id"])
+    if request.method == "POST":
+        return chat_post(conn, thread)
+    return jsonify(chat_page(conn, thread))
+
+@bp.route("/chat/<thread_id>/messages")
+@read_only
+@login_required
+def chat_messages(thread_id):
+    """Older messages, one keyset page per ?cursor="""
+    conn = get_db()
+    thread = chat.thread_for_user(conn, thread_id, g.current_user["id"])
+    if not thread:
+        return {"success": False, "error": "Thread not found"}, 404
+    try:
+        before = decode_cursor(2)
+    except ApiError as e:
+        return jsonify({"error": e.message}), e.status
+    return jsonify(chat_page(conn, thread, before))
+
+@bp.route("/chat/<thread_id>/read", methods=["POST"])
+@login_required
+def chat_read(thread_id):
+    conn = get_db()
+    if not chat.thread_for_user(conn, thread_id, g.current_user["id"]):
+        return {"success": False, "error": "Thread not found"}, 404
+    chat.mark_read(conn, thread_id, g.current_user["id"])
     conn.commit()
+    return {"success": True}
 
-    return redirect(
-        url_for(
-            "day_view",
-            trip_id=task["trip_id"],
-            day_id=task["day_id"]
-        )
+@bp.route("/chat/unread")
+@read_only
+@login_required
+def chat_unread():
+    rows = chat.unread_counts(get_db(), g.current_user["id"])
+    return jsonify({"threads": [json_row(r) for r in rows]})
+
+
+def schedule_rebalance(day_id):
+    """Re-key a day on a background thread once its keys grow too long"""
+    def run():
+        conn = get_db()  # no app context here -> dedicated connection
+        try:
+            rebalance_day(conn, day_id)
+        except Exception:
+            log.exception("order_key_rebalance_failed", day_id=day_id)
+        finally:
+            conn.close()
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+@bp.route("/trip/<trip_id>/day/<day_id>/reorder", methods=["POST"])
+@login_required
+def reorder_day(trip_id, day_id):
+    """
+    Apply a whole new task order for a day in one statement.
+    Body: {"order": [task_id, ...]} listing every task of the day.
+    """
+    payload = request.get_json(silent=True) or {}
+    order = payload.get("order")
+
+    if not isinstance(order, list) or len(set(order)) != len(order):
+        return {"success": False, "error": "order must be a list of task ids"}, 400
+
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT DISTINCT t.id
+        FROM trips t
+        LEFT JOIN trip_members tm ON t.id = tm.trip_id
+        WHERE t.id = %s AND (t.owner_id = %s OR tm.user_id = %s)
+    """, (trip_id, g.current_user["id"], g.current_user["id"]))
+    trip = cur.fetchone()
+
+    cur.close()
+    if not trip:
+        return {"success": False, "error": "Trip not found"}, 404
+
+    # Check the order against the day's tasks under the lock, so a task
+    # added meanwhile fails the check instead of keeping a clashing key
+    with locked_day(conn, day_id):
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT id FROM tasks
+            WHERE day_id = %s AND trip_id = %s
+            AND (is_deleted IS NULL OR is_deleted = false)
+        """, (day_id, trip_id))
+        task_ids = {row["id"] for row in cur.fetchall()}
+        cur.close()
+
+        if set(order) != task_ids:
+            return {"success": False, "error": "order must list every task of the day"}, 400
+
+        apply_order(conn, day_id, order)
+        publish(conn, trip_id, day_id, "task", action="reordered")
+
+    return {"success": True, "count": len(order)}
+
+
+@bp.route("/trip/<trip_id>/day/<day_id>/optimize", methods=["GET", "POST"])
+@login_required
+def optimize_day_route(trip_id, day_id):
+    """
+    GET proposes a travel-time-minimising order for the day's tasks.
+    POST applies the proposal by re-keying the day in one statement.
+    """
+    conn = get_db()
+
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT DISTINCT t.id
+        FROM trips t
+        LEFT JOIN trip_members tm ON t.id = tm.trip_id
+        WHERE t.id = %s AND (t.owner_id = %s OR tm.user_id = %s)
+    """, (trip_id, g.current_user["id"], g.current_user["id"]))
+    trip = cur.fetchone()
+    cur.close()
+
+    if not trip:
+        return {"success": False, "error": "Trip not found"}, 404
+
+    mode = request.args.get("mode")
+    if not mode:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT mode_id FROM transport_groups
+            WHERE trip_id = %s AND day_id = %s
+            ORDER BY created_at ASC
+            LIMIT 1
+        """, (trip_id, day_id))
+        group = cur.fetchone()
+        cur.close()
+        mode = group["mode_id"] if group and group["mode_id"] else "walk"
+
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT id, lat, lng, start_time, end_time FROM tasks
+        WHERE day_id = %s AND trip_id = %s
+        AND (is_deleted IS NULL OR is_deleted = false)
+        ORDER BY order_key ASC
+    """, (day_id, trip_id))
+    tasks = cur.fetchall()
+    cur.close()
+
+    proposal = optimize_day(
+        tasks,
+        MODE_SPEED_KMPH.get(mode, 30),
+        dwell_minutes=request.args.get("dwell", 0, type=int)
     )
+    proposal["mode"] = mode
 
+    if request.method == "GET" or not proposal["changed"]:
+        return {"success": True, "applied": False, **proposal}
 
-@app.route("/user/<user_id>")
+    with locked_day(conn, day_id):
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT id FROM tasks
+            WHERE day_id = %s AND trip_id = %s
+            AND (is_deleted IS NULL OR is_deleted = false)
+        """, (day_id, trip_id))
+        task_ids = {row["id"] for row in cur.fetchall()}
+        cur.close()
+
+        if set(proposal["order"]) != task_ids:
+            return {"success": False, "error": "the day changed, optimize again"}, 409
+
+        apply_order(conn, day_id, proposal["order"])
+        publish(conn, trip_id, day_id, "task", action="reordered")
+
+    return {"success": True, "applied": True, **proposal}
+
+
+@bp.route("/user/<user_id>")
 def user_profile(user_id):
     # placeholder for user profile
     return f"User: {user_id}"
 
-@app.route("/logout")
+@bp.route("/logout")
 def logout():
     session.clear()
     flash("You have been logged out.", "info")
-    return redirect(url_for("auth"))
+    return redirect(url_for("main.auth"))
 
-@app.route('/favicon.ico')
+@bp.route('/favicon.ico')
 def favicon():
     return '', 204  # Return empty response with no content status
 
-@app.route("/trip/<trip_id>/day/<day_id>/add-task", methods=["GET", "POST"])
+@bp.route("/trip/<trip_id>/day/<day_id>/add-task", methods=["GET", "POST"])
 @login_required
 def add_task_to_day(trip_id, day_id):
     conn = get_db()
@@ -2166,7 +2637,7 @@ def add_task_to_day(trip_id, day_id):
     
     if not trip or not day:
         flash("Trip or day not found", "error")
-        return redirect(url_for("trips"))
+        return redirect(url_for("main.trips_page"))
     
     if request.method == "POST":
         title = request.form.get("title")
@@ -2188,66 +2659,68 @@ def add_task_to_day(trip_id, day_id):
             lat = None
             lng = None
         
-        # Get the next order index
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT MAX(order_index) as max_order FROM tasks WHERE day_id = %s", (day_id,)
-        )
-        result = cur.fetchone()
-        last_order = result['max_order'] if result and result['max_order'] is not None else 0
-        cur.close()
-        order_index = last_order + 1
-        
-        # Create the task
+        # Append after the day's last task
         task_id = uid()
-        cur = conn.cursor()
-        cur.execute(
-            """
-            INSERT INTO tasks (id, trip_id, day_id, title, description, start_time, end_time, lat, lng, order_index, created_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """,
-            (task_id, trip_id, day_id, title, description, start_time, end_time, lat, lng, order_index, datetime.now().isoformat())
-        )
-        cur.close()
-        conn.commit()
+        with locked_day(conn, day_id):
+            order_key = key_between(last_key(conn, day_id), None)
+
+            # Create the task
+            cur = conn.cursor()
+            cur.execute(
+                """
+                INSERT INTO tasks (id, trip_id, day_id, title, description, start_time, end_time, lat, lng, order_key, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """,
+                (task_id, trip_id, day_id, title, description, start_time, end_time, lat, lng, order_key, datetime.now().isoformat())
+            )
+            cur.close()
+
+            publish(conn, trip_id, day_id, "task", action="added", task_id=task_id)
         
         flash("Task added successfully!", "success")
-        return redirect(url_for("day_view", trip_id=trip_id, day_id=day_id))
+        return redirect(url_for("main.day_view", trip_id=trip_id, day_id=day_id))
     
     return render_template("add_task.html", trip=trip, day=day)
 
+@bp.cli.command("compact-status")
+@click.option("--days", default=30, show_default=True,
+              help="Only compact events older than this many days")
+def compact_status_command(days):
+    """Collapse superseded task status events into summary rows."""
+    conn = get_db()
+    try:
+        removed = compact_events(conn, days)
+    finally:
+        conn.close()
+    click.echo(f">>> Compacted task status events: {removed} rows removed")
+
+
+@bp.cli.command("calibrate-passwords")
+@click.option("--target-ms", default=100.0, show_default=True,
+              help="Longest acceptable time for one hash on this machine.")
+def calibrate_passwords_command(target_ms):
+    """Time scrypt costs here and suggest PASSWORD_SCRYPT_LOG2N."""
+    results, chosen = passwords.calibrate(target_ms)
+    threads = passwords.hash_threads()
+    for log2_n, ms in results:
+        mib = 128 * passwords.DEFAULT_R * (1 << log2_n) / 2**20
+        click.echo(f">>> N=2^{log2_n:<3} {ms:8.1f} ms  {mib:6.0f} MiB  "
+                   f"~{threads * 1000 / ms:6.0f} logins/s on {threads} thread(s)")
+    click.echo(f">>> PASSWORD_SCRYPT_LOG2N={chosen}")
+
+
+@bp.cli.command("migrate")
+def migrate_command():
+    """Create or upgrade the database schema."""
+    init_db()
+    click.echo(">>> Database schema is up to date")
+
+
 if __name__ == "__main__":
-    with app.app_context():
-        # Test connection speed before starting server
-        print(">>> Testing database connection speed...")
-        from db import test_connection_speed
-        connection_result = test_connection_speed()
-        
-        if connection_result is None:
-            print(">>> ⚠️  Database connection test failed, but continuing to start server...")
-            print(">>> 🔄 The app may still work if database connectivity improves")
-        
-        try:
-            # Initialize the database
-            print(">>> Initializing database...")
-            init_db()
-            
-            # Ensure is_deleted column exists for tasks
-            conn = get_db()
-            try:
-                cur = conn.cursor()
-                cur.execute("ALTER TABLE tasks ADD COLUMN is_deleted INTEGER DEFAULT 0")
-                cur.close()
-                conn.commit()
-                print("Added is_deleted column to tasks table")
-            except:
-                pass  # Column already exists
-                
-        except Exception as e:
-            print(f">>> ⚠️  Database initialization failed: {e}")
-            print(">>> 🔄 Server will start anyway - try accessing the app to trigger reconnection")
-    
-    print(">>> Starting Flask server with optimized settings...")
+    app = create_app()
+
+    click.echo(">>> Starting Flask server with optimized settings...")
+    click.echo(">>> New database? Run `flask --app app migrate` first")
     # Optimize Flask development server for better performance on Windows
     app.run(
         debug=True,
@@ -0,0 +1,233 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+
+
+# ------------------ Structured logging ------------------
+#
+# Every log line is one JSON object. Records are handed to a bounded
+# in-memory queue and written to stdout by a QueueListener thread, so a
+# request never waits on a contended stdout; when the queue is full the
+# record is dropped and counted instead of blocking.
+#
+# Each request produces one "request" record, sampled per endpoint for
+# high-volume routes (LOG_SAMPLE_RATES). Slow requests and server errors
+# are always logged, and slow ones carry the request's query profile: the
+# number of queries, their total time and the slowest statements.
+#
+# Usage:  log = get_logger(__name__);  log.info("db_connect", ms=12.5)
+
+LOGGER_NAME = "tripplanner"
+QUEUE_SIZE = 10000
+DEFAULT_SLOW_REQUEST_MS = 500
+PROFILE_TOP_QUERIES = 10
+SQL_PREVIEW_CHARS = 200
+
+# Fraction of requests logged per endpoint; unlisted endpoints log all
+DEFAULT_SAMPLE_RATES = {
+    "main._ping": 0.0,
+    "main.metrics_page": 0.0,
+    "main.ping": 0.01,
+    "main.ingest_location": 0.01,
+    "main.update_task_status": 0.1,
+    "main.trip_events": 0.1,
+}
+
+# LogRecord attributes that aren't user fields
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        entry.update({k: v for k, v in vars(record).items() if k not in _RESERVED and k != "fields"})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class StructuredLogger(logging.LoggerAdapter):
+    """Keyword arguments become fields of the JSON record"""
+
+    def process(self, msg, kwargs):
+        passthrough = {k: kwargs.pop(k) for k in ("exc_info", "stack_info", "stacklevel") if k in kwargs}
+        passthrough["extra"] = {"fields": kwargs}
+        return msg, passthrough
+
+
+_tracebacks = logging.Formatter()
+
+
+def get_logger(name):
+    return StructuredLogger(logging.getLogger(f"{LOGGER_NAME}.{name}"), {})
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Resolve args and tracebacks now (they may not survive the
+        # thread hop) but leave the JSON formatting to the writer thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _tracebacks.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_lock = threading.Lock()
+_handler = None
+_listener = None
+_settings = {
+    "sample_rates": dict(DEFAULT_SAMPLE_RATES),
+    "slow_request_ms": DEFAULT_SLOW_REQUEST_MS,
+}
+
+
+def configure_logging(level="INFO", sample_rates=None, slow_request_ms=DEFAULT_SLOW_REQUEST_MS,
+                      stream=None):
+    """Route the app's loggers through the background JSON writer (idempotent)"""
+    global _handler, _listener
+    _settings["sample_rates"] = {**DEFAULT_SAMPLE_RATES, **(sample_rates or {})}
+    _settings["slow_request_ms"] = slow_request_ms
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(level)
+    logger.propagate = False
+
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            logger.removeHandler(_handler)
+
+        writer = logging.StreamHandler(stream or sys.stdout)
+        writer.setFormatter(JsonFormatter())
+        _handler = DroppingQueueHandler(queue.Queue(maxsize=QUEUE_SIZE))
+        _listener = logging.handlers.QueueListener(_handler.queue, writer)
+        _listener.start()
+        logger.addHandler(_handler)
+
+
+def flush_logging():
+    """Write out everything queued so far (tests, shutdown)"""
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener.start()
+
+
+@atexit.register
+def _stop_listener():
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+
+
+def dropped_records():
+    return _handler.dropped if _handler is not None else 0
+
+
+def parse_sample_rates(raw):
+    """'main.ping=0.01,api.list_trips=0.5' -> {endpoint: rate}"""
+    rates = {}
+    for item in (raw or "").split(","):
+        endpoint, _, rate = item.partition("=")
+        if endpoint.strip() and rate.strip():
+            rates[endpoint.strip()] = float(rate)
+    return rates
+
+
+# ---------------- query profile ----------------
+
+class QueryProfile:
+    """Timings of the queries run while handling one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.connect_ms = 0.0
+        self._slowest = []
+
+    def record(self, sql, ms, rows):
+        self.count += 1
+        self.total_ms += ms
+        self._slowest.append((ms, sql, rows))
+        if len(self._slowest) > PROFILE_TOP_QUERIES * 2:
+            self._slowest.sort(key=lambda q: q[0], reverse=True)
+            del self._slowest[PROFILE_TOP_QUERIES:]
+
+    def summary(self):
+        slowest = sorted(self._slowest, key=lambda q: q[0], reverse=True)[:PROFILE_TOP_QUERIES]
+        return {
+            "query_count": self.count,
+            "query_ms": round(self.total_ms, 1),
+            "connect_ms": round(self.connect_ms, 1),
+            "slowest_queries": [
+                {"ms": round(ms, 1), "rows": rows, "sql": " ".join(str(sql).split())[:SQL_PREVIEW_CHARS]}
+                for ms, sql, rows in slowest
+            ],
+        }
+
+
+# ---------------- per-request records ----------------
+
+request_log = get_logger("request")
+
+
+def should_sample(endpoint):
+    rate = _settings["sample_rates"].get(endpoint, 1.0)
+    return rate >= 1.0 or (rate > 0 and random.random() < rate)
+
+
+def log_request(method, path, endpoint, status, duration_ms, user_id=None, profile=None):
+    slow = duration_ms >= _settings["slow_request_ms"]
+    if not (slow or status >= 500 or should_sample(endpoint)):
+        return
+
+    fields = {
+        "method": method,
+        "path": path,
+        "endpoint": endpoint,
+        "status": status,
+        "ms": round(duration_ms, 1),
+        "user_id": user_id,
+    }
+    if profile is not None:
+        if slow:
+            fields.update(profile.summary())
+        else:
+            fields["query_count"] = profile.count
+            fields["query_ms"] = round(profile.total_ms, 1)
+            fields["connect_ms"] = round(profile.connect_ms, 1)
+
+    if slow:
+        request_log.warning("slow_request", **fields)
+    elif status >= 500:
+        request_log.error("request", **fields)
+    else:
+        request_log.info("request", **fields)
@@ -0,0 +1,479 @@
+"""
+Async serving mode.
+
+    hypercorn asgi:application --workers 2
+
+The hot routes (trip and day pages, /analytics, task status updates and
+location ingest) are served by a Quart app on one event loop with a
+psycopg 3 async pool, so a slow database round-trip no longer blocks a
+worker thread. Every other path falls through to the regular Flask app
+via asgiref's WSGI adapter. `gunicorn "app:create_app()"` remains the
+sync fallback.
+"""
+import asyncio
+import time
+from datetime import date, datetime
+from functools import wraps
+
+from asgiref.wsgi import WsgiToAsgi
+from quart import (
+    Blueprint, Quart, flash, g, make_response, redirect, render_template, request, session,
+    url_for
+)
+from werkzeug.exceptions import MethodNotAllowed, NotFound
+from werkzeug.routing import Map, RequestRedirect, Rule
+
+import app as sync_app
+import metrics
+from app_logging import log_request
+from db_async import close_async_pool, fetchall, fetchone, get_async_pool
+from fragment_cache import (
+    aget_versions, anot_modified, day_scope, fragment_cache, friends_scope, page_validators,
+    trip_scope, with_validators
+)
+from friend_graph import INVITABLE_FRIENDS_SQL
+from ids import new_id, normalize_url_ids
+from live_updates import apublish, apublish_location
+from task_status import aday_member_statuses, arecord_status, areset_status, task_completion_sql
+
+
+def uid():
+    return new_id()
+
+
+TRIP_ACCESS_SQL = """
+    SELECT DISTINCT t.*
+    FROM trips t
+    LEFT JOIN trip_members tm ON t.id = tm.trip_id
+    WHERE t.id = %s AND (t.owner_id = %s OR tm.user_id = %s)
+"""
+
+
+def create_async_app(flask_app):
+    qapp = Quart(__name__, template_folder="templates", static_folder="static")
+    qapp.secret_key = flask_app.secret_key
+    qapp.config["PERMANENT_SESSION_LIFETIME"] = flask_app.config["PERMANENT_SESSION_LIFETIME"]
+
+    @qapp.before_serving
+    async def open_pool():
+        await get_async_pool()
+
+    @qapp.after_serving
+    async def close_pool():
+        await close_async_pool()
+
+    # Same blueprint name as the Flask app, so endpoint names line up
+    bp = Blueprint("main", __name__)
+    bp.url_value_preprocessor(normalize_url_ids)
+
+    @bp.before_app_request
+    async def load_current_user():
+        g.start_time = time.perf_counter()
+        g.current_user = None
+        user_id = session.get("user_id")
+        if user_id:
+            g.current_user = await fetchone(
+                "SELECT * FROM users WHERE id = %s", (user_id,)
+            )
+
+    # Same request records and metrics as the Flask app; the async pool's
+    # queries aren't profiled, so these carry timing only
+    @bp.after_app_request
+    async def log_request_time(response):
+        if hasattr(g, "start_time"):
+            duration = time.perf_counter() - g.start_time
+            current_user = g.get("current_user")
+            log_request(
+                request.method, request.path, request.endpoint, response.status_code,
+                duration * 1000,
+                user_id=current_user["id"] if current_user else None,
+            )
+            metrics.observe_request(
+                request.endpoint, request.method, response.status_code, duration
+            )
+        return response
+
+    # Same read-your-writes stamp as db.mark_write(), so the user's next
+    # @read_only request on the Flask side stays on the primary
+    @bp.after_app_request
+    async def remember_writes(response):
+        if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+            session["db_wrote_at"] = time.time()
+        return response
+
+    def login_required(fn):
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if not g.current_user:
+                await flash("Please login first")
+                return redirect(url_for("main.auth"))
+            return await fn(*args, **kwargs)
+        return wrapper
+
+    async def trip_for_user(trip_id):
+        user_id = g.current_user["id"]
+        return await fetchone(TRIP_ACCESS_SQL, (trip_id, user_id, user_id))
+
+    # ---------------- TRIP / DAY PAGES ----------------
+
+    async def page_versions(scopes):
+        pool = await get_async_pool()
+        async with pool.connection() as conn:
+            return await aget_versions(conn, scopes)
+
+    # Same fragment cache and ETag/Last-Modified as the Flask views
+    # (fragment_cache.py), so both serving modes answer revalidations
+    # with a 304 and reuse each other's version counters
+
+    @bp.route("/trip/<trip_id>")
+    @login_required
+    async def trip_view(trip_id):
+        user_id = g.current_user["id"]
+
+        trip, versions = await asyncio.gather(
+            trip_for_user(trip_id),
+            page_versions([trip_scope(trip_id), friends_scope(user_id)]),
+        )
+
+        if not trip:
+            return "Trip not found", 404
+
+        etag, last_modified = page_validators(versions, user_id, date.today())
+        cached = anot_modified(etag, last_modified)
+        if cached:
+            return cached
+
+        # Independent reads run concurrently on separate pooled connections
+        days, members, friends = await asyncio.gather(
+            fetchall("""
+                SELECT * FROM days
+                WHERE trip_id = %s
+                ORDER BY date ASC
+            """, (trip_id,)),
+            fetchall("""
+                SELECT tm.user_id, tm.role, tm.joined_at, u.name
+                FROM trip_members tm
+                JOIN users u ON tm.user_id = u.id
+                WHERE tm.trip_id = %s
+                ORDER BY tm.role DESC, tm.joined_at ASC
+            """, (trip_id,)),
+            fetchall(INVITABLE_FRIENDS_SQL, (user_id, trip_id)),
+        )
+
+        past_days, today_day, upcoming_days = sync_app.split_days(days)
+
+        member_list_html = await fragment_cache.arender(
+            ("trip-members", trip_id, versions[trip_scope(trip_id)][0]),
+            "fragments/trip_members.html",
+            members=members
+        )
+
+        response = await make_response(await render_template(
+            "trip.html",
+            trip=trip,
+            past_days=past_days,
+            today_day=today_day,
+            upcoming_days=upcoming_days,
+            members=members,
+            member_list_html=member_list_html,
+            friends=friends
+        ))
+        return with_validators(response, etag, last_modified)
+
+    async def ensure_transport_groups(trip_id, day_id):
+        pool = await get_async_pool()
+        async with pool.connection() as conn:
+            async with conn.transaction():
+                cur = await conn.execute("""
+                    SELECT 1 FROM transport_groups
+                    WHERE trip_id = %s AND day_id = %s
+                    LIMIT 1
+                """, (trip_id, day_id))
+                if await cur.fetchone():
+                    return
+
+                group_id = uid()
+                await conn.execute("""
+                    INSERT INTO transport_groups
+                    (id, trip_id, day_id, task_id, mode_id, label, leader_id, created_at)
+                    SELECT %s, %s, %s, NULL, 'walk', NULL, user_id, %s
+                    FROM trip_members
+                    WHERE trip_id = %s AND role = 'owner'
+                    LIMIT 1
+                """, (group_id, trip_id, day_id, datetime.now().isoformat(), trip_id))
+                await conn.execute("""
+                    INSERT INTO transport_group_members
+                    (transport_group_id, user_id, effective_mode_id)
+                    SELECT %s, user_id, NULL FROM trip_members
+                    WHERE trip_id = %s
+                """, (group_id, trip_id))
+
+    async def day_statuses(day_id):
+        pool = await get_async_pool()
+        async with pool.connection() as conn:
+            return await aday_member_statuses(conn, day_id)
+
+    @bp.route("/trip/<trip_id>/day/<day_id>")
+    @login_required
+    async def day_view(trip_id, day_id):
+        trip, day, versions = await asyncio.gather(
+            trip_for_user(trip_id),
+            fetchone(
+                "SELECT * FROM days WHERE id = %s AND trip_id = %s",
+                (day_id, trip_id)
+            ),
+            page_versions([trip_scope(trip_id), day_scope(day_id)]),
+        )
+
+        if not trip or not day:
+            return "Not found", 404
+
+        user_id = g.current_user["id"]
+
+        # Today's page carries live ETAs, so only other days are revalidated
+        is_today = str(day["date"]) == date.today().isoformat()
+        if not is_today:
+            etag, last_modified = page_validators(versions, user_id, date.today())
+            cached = anot_modified(etag, last_modified)
+            if cached:
+                return cached
+
+        await ensure_transport_groups(trip_id, day_id)
+
+        tasks, task_statuses, groups, locations = await asyncio.gather(
+            fetchall(sync_app.DAY_TASKS_SQL, (day_id,)),
+            day_statuses(day_id),
+            fetchall("""
+                SELECT * FROM transport_groups
+                WHERE trip_id = %s AND day_id = %s
+            """, (trip_id, day_id)),
+            fetchall("""
+                SELECT DISTINCT ON (lu.transport_group_id)
+                    lu.transport_group_id, lu.lat, lu.lng
+                FROM location_updates lu
+                JOIN transport_groups tg ON tg.id = lu.transport_group_id
+                WHERE tg.trip_id = %s AND tg.day_id = %s
+                ORDER BY lu.transport_group_id, lu.recorded_at DESC
+            """, (trip_id, day_id)),
+        )
+
+        active_groups = [{'group': group} for group in groups]
+        last_locations = {loc["transport_group_id"]: loc for loc in locations}
+
+        processed_tasks = sync_app.build_day_tasks(
+            day, tasks, task_statuses, active_groups, last_locations, user_id
+        )
+
+        task_list_html = await fragment_cache.arender(
+            ("day-tasks", day_id, versions[day_scope(day_id)][0], user_id),
+            "fragments/day_tasks.html",
+            tasks=processed_tasks
+        )
+
+        response = await make_response(await render_template(
+            "day.html",
+            trip=trip,
+            day=day,
+            tasks=processed_tasks,
+            task_list_html=task_list_html,
+            active_groups=active_groups
+        ))
+        if is_today:
+            return response
+        return with_validators(response, etag, last_modified)
+
+    # ---------------- ANALYTICS ----------------
+
+    async def completion_stats(where_clause, params):
+        row = await fetchone(
+            task_completion_sql(where_clause), params
+        )
+        return sync_app.completion_result(row)
+
+    async def average_delay(task_filter_sql, params):
+        row = await fetchone(
+            sync_app.AVERAGE_DELAY_SQL.format(task_filter_sql=task_filter_sql), params
+        )
+        return sync_app.average_from_row(row)
+
+    @bp.route("/analytics")
+    @login_required
+    async def analytics():
+        scope = request.args.get("scope", "overall")
+        trip_id = request.args.get("trip_id")
+        day_id = request.args.get("day_id")
+        user_id = g.current_user["id"]
+
+        if scope == "overall":
+            rows = await fetchall("""
+                SELECT DISTINCT t.id
+                FROM trips t
+                LEFT JOIN trip_members tm ON t.id = tm.trip_id
+                WHERE t.owner_id = %s OR tm.user_id = %s
+            """, (user_id, user_id))
+            trip_ids = [r["id"] for r in rows]
+
+            if not trip_ids:
+                return {"tasks": {"total": 0, "completed": 0, "skipped": 0, "unanswered": 0}}
+
+            stats, avg_delay = await asyncio.gather(
+                completion_stats("AND trip_id = ANY(%s::uuid[])", (trip_ids,)),
+                average_delay("AND trip_id = ANY(%s::uuid[])", (trip_ids,)),
+            )
+            return {
+                "trip_count": len(trip_ids),
+                "tasks": stats,
+                "average_delay_minutes": avg_delay
+            }
+
+        if scope == "trip" and trip_id:
+            stats, avg_delay, buckets, days = await asyncio.gather(
+                completion_stats("AND trip_id = %s", (trip_id,)),
+                average_delay("AND trip_id = %s", (trip_id,)),
+                fetchone(sync_app.DELAY_BUCKETS_SQL, (trip_id,)),
+                fetchone(
+                    "SELECT COUNT(*) AS count FROM days WHERE trip_id = %s",
+                    (trip_id,)
+                ),
+            )
+            return {
+                "days": days["count"],
+                "tasks": stats,
+                "average_delay_minutes": avg_delay,
+                "delay_windows": sync_app.buckets_from_row(buckets)
+            }
+
+        if scope == "day" and day_id:
+            stats, avg_delay = await asyncio.gather(
+                completion_stats("AND day_id = %s", (day_id,)),
+                average_delay("AND day_id = %s", (day_id,)),
+            )
+            return {"tasks": stats, "average_delay_minutes": avg_delay}
+
+        return {"error": "Invalid analytics scope"}, 400
+
+    # ---------------- STATUS / LOCATION WRITES ----------------
+
+    @bp.route("/task/<task_id>/status/<status>", methods=["POST"])
+    @login_required
+    async def update_task_status(task_id, status):
+        if status not in ("YES", "NO", "SKIPPED"):
+            return {"success": False, "error": "Invalid status"}, 400
+
+        user_id = g.current_user["id"]
+        pool = await get_async_pool()
+        async with pool.connection() as conn:
+            cur = await conn.execute(
+                "SELECT trip_id, day_id FROM tasks WHERE id = %s", (task_id,)
+            )
+            task = await cur.fetchone()
+            if not task:
+                return {"success": False, "error": "Task not found"}, 404
+
+            await arecord_status(conn, task_id, user_id, status)
+            await apublish(conn, task["trip_id"], task["day_id"], "status",
+                           task_id=task_id, user_id=user_id, status=status)
+
+        return {"success": True, "status": status}
+
+    @bp.route("/task/<task_id>/status/reset", methods=["POST"])
+    @login_required
+    async def reset_task_status(task_id):
+        user_id = g.current_user["id"]
+        pool = await get_async_pool()
+        async with pool.connection() as conn:
+            cur = await conn.execute(
+                "SELECT trip_id, day_id FROM tasks WHERE id = %s", (task_id,)
+            )
+            task = await cur.fetchone()
+            if not task:
+                return {"success": False, "error": "Task not found"}, 404
+
+            await areset_status(conn, task_id, user_id)
+            await apublish(conn, task["trip_id"], task["day_id"], "status",
+                           task_id=task_id, user_id=user_id, status=None)
+
+        return {"success": True}
+
+    @bp.route("/group/<group_id>/location", methods=["POST"])
+    @login_required
+    async def ingest_location(group_id):
+        payload = await request.get_json(silent=True) or {}
+        try:
+            lat = float(payload["lat"])
+            lng = float(payload["lng"])
+        except (KeyError, TypeError, ValueError):
+            return {"success": False, "error": "lat and lng are required"}, 400
+
+        pool = await get_async_pool()
+        async with pool.connection() as conn:
+            cur = await conn.execute(
+                sync_app.RECORD_LOCATION_SQL,
+                sync_app.location_params(g.current_user["id"], group_id, lat, lng)
+            )
+            if cur.rowcount != 1:
+                return {"success": False, "error": "Group not found"}, 404
+            await apublish_location(conn, group_id, lat, lng)
+
+        return {"success": True}
+
+    qapp.register_blueprint(bp)
+
+    # Endpoints served by Flask still need to resolve in url_for() inside
+    # templates rendered here; the dispatcher never routes them to Quart.
+    async def served_by_wsgi(**kwargs):
+        return "Not found", 404
+
+    for rule in flask_app.url_map.iter_rules():
+        if rule.endpoint not in qapp.view_functions:
+            qapp.add_url_rule(
+                rule.rule, endpoint=rule.endpoint, view_func=served_by_wsgi,
+                methods=rule.methods
+            )
+
+    return qapp
+
+
+class HybridApp:
+    """Send hot routes to the async app, everything else to Flask (WSGI)"""
+
+    def __init__(self, async_app, wsgi_app, async_endpoints):
+        self.async_app = async_app
+        self.wsgi_app = WsgiToAsgi(wsgi_app)
+        self.async_routes = Map([
+            Rule(rule.rule, endpoint=rule.endpoint, methods=rule.methods)
+            for rule in async_app.url_map.iter_rules()
+            if rule.endpoint in async_endpoints
+        ])
+
+    def is_async(self, scope):
+        try:
+            self.async_routes.bind("").match(scope["path"], method=scope["method"])
+            return True
+        except (NotFound, MethodNotAllowed, RequestRedirect):
+            return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan" or (
+            scope["type"] == "http" and self.is_async(scope)
+        ):
+            return await self.async_app(scope, receive, send)
+        return await self.wsgi_app(scope, receive, send)
+
+
+ASYNC_ENDPOINTS = {
+    "main.trip_view",
+    "main.day_view",
+    "main.analytics",
+    "main.update_task_status",
+    "main.reset_task_status",
+    "main.ingest_location",
+}
+
+
+def create_asgi_app(config=None):
+    flask_app = sync_app.create_app(config)
+    return HybridApp(create_async_app(flask_app), flask_app, ASYNC_ENDPOINTS)
+
+
+application = create_asgi_app()
@@ -0,0 +1,498 @@
+"""
+Synthetic trip data at any volume, reproducible from a seed.
+
+    BENCH_DATABASE_URL=postgresql://localhost/tripplanner_bench \\
+        python benchmarks/datagen.py copy --scale large --seed 7 --reset
+    python benchmarks/datagen.py csv /tmp/trips --scale medium --seed 7
+
+`copy` streams users, friendships, trips, members, days, tasks, status
+events, transport groups and GPS traces into BENCH_DATABASE_URL (or
+--database-url, never DATABASE_URL) with COPY, a chunk of rows per table
+at a time, so memory stays flat however many rows are written. The
+database must be empty; --reset truncates it first.
+
+`csv` writes one import CSV per trip (the format csv_to_trip_json reads,
+so files can be fed to /import-trip), 1000 files per sub-directory. The
+import format only carries trips, days and tasks.
+
+Shapes are meant to look like real use. Users belong to friend circles
+and befriend and travel mostly within them; how many trips someone
+plans is skewed (most plan a few, some plan many). A trip visits one
+to three cities from a list of real ones, each day centres on a
+neighbourhood and its tasks cluster around it in time order. Members
+answer most tasks, sometimes changing their mind, and each day's
+transport group leaves a GPS trace along the route between tasks.
+
+Every entity gets its own RNG and id derived from (seed, kind, number),
+so a given trip is the same whatever scale it is generated at, and the
+same scale and seed always give the same rows, ids included. Users are
+named bench_000000, bench_000001, ... with the password "bench".
+"""
+import argparse
+import csv
+import hashlib
+import io
+import math
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import psycopg2  # noqa: E402
+
+import passwords  # noqa: E402
+from ordering import keys_between  # noqa: E402
+from task_status import STATUSES  # noqa: E402
+
+# Averages; the per-user and per-trip counts are drawn around them
+SCALES = {
+    "small": dict(users=50, circle_size=10, friends_per_user=5, trips_per_user=3,
+                  members_per_trip=3, days_per_trip=4, tasks_per_day=8,
+                  response_rate=0.7, gps_points_per_leg=4),
+    "medium": dict(users=500, circle_size=12, friends_per_user=8, trips_per_user=4,
+                   members_per_trip=4, days_per_trip=5, tasks_per_day=8,
+                   response_rate=0.7, gps_points_per_leg=6),
+    "large": dict(users=5000, circle_size=15, friends_per_user=10, trips_per_user=4,
+                  members_per_trip=4, days_per_trip=6, tasks_per_day=9,
+                  response_rate=0.7, gps_points_per_leg=8),
+    # ~100k trips, ~5M tasks, ~17M status events, ~150M GPS points
+    "xlarge": dict(users=25000, circle_size=15, friends_per_user=12, trips_per_user=4,
+                   members_per_trip=4, days_per_trip=6, tasks_per_day=9,
+                   response_rate=0.7, gps_points_per_leg=8),
+}
+
+PASSWORD = "bench"
+EPOCH = datetime(2026, 1, 1)
+COPY_CHUNK_ROWS = 20000
+CSV_FILES_PER_DIR = 1000
+KM_PER_DEGREE = 111.0
+
+# (name, lat, lng, relative popularity)
+CITIES = [
+    ("Paris", 48.8566, 2.3522, 10), ("London", 51.5074, -0.1278, 10),
+    ("Rome", 41.9028, 12.4964, 8), ("Barcelona", 41.3874, 2.1686, 8),
+    ("Amsterdam", 52.3676, 4.9041, 6), ("Berlin", 52.5200, 13.4050, 6),
+    ("Lisbon", 38.7223, -9.1393, 6), ("Prague", 50.0755, 14.4378, 5),
+    ("Vienna", 48.2082, 16.3738, 4), ("Istanbul", 41.0082, 28.9784, 6),
+    ("New York", 40.7128, -74.0060, 10), ("San Francisco", 37.7749, -122.4194, 5),
+    ("Mexico City", 19.4326, -99.1332, 5), ("Buenos Aires", -34.6037, -58.3816, 3),
+    ("Rio de Janeiro", -22.9068, -43.1729, 4), ("Tokyo", 35.6762, 139.6503, 9),
+    ("Kyoto", 35.0116, 135.7681, 5), ("Seoul", 37.5665, 126.9780, 5),
+    ("Bangkok", 13.7563, 100.5018, 7), ("Singapore", 1.3521, 103.8198, 6),
+    ("Bali", -8.4095, 115.1889, 5), ("Sydney", -33.8688, 151.2093, 5),
+    ("Cape Town", -33.9249, 18.4241, 3), ("Marrakesh", 31.6295, -7.9811, 4),
+]
+
+# (first hour, title) through a typical day; a day uses a run of these
+SLOTS = [
+    (8, "Breakfast"), (9, "Museum"), (10, "Old town walk"), (11, "Landmark"),
+    (12, "Lunch"), (13, "Market"), (14, "Gallery"), (15, "Park"),
+    (16, "Coffee"), (17, "Viewpoint"), (18, "Shopping"), (19, "Dinner"),
+    (21, "Drinks"), (22, "Night walk"),
+]
+
+TABLES = [
+    "users", "friends", "friend_requests", "trips", "trip_members", "days",
+    "tasks", "task_assignments", "task_status_events", "task_status_current",
+    "cache_versions", "transport_groups", "transport_group_members",
+    "eta_snapshots", "location_updates", "task_notes", "task_note_history",
+    "chat_threads", "chat_messages", "chat_members",
+]
+
+COLUMNS = {
+    "users": "id, name, password, email, created_at, public_id",
+    "friends": "user_id, friend_id, created_at",
+    "trips": "id, name, start_date, end_date, owner_id, created_at",
+    "trip_members": "trip_id, user_id, role, joined_at, trip_created_at",
+    "days": "id, trip_id, date",
+    "tasks": ("id, trip_id, day_id, title, description, start_time, end_time, "
+              "lat, lng, order_index, order_key, created_at"),
+    "task_status_events": "id, task_id, user_id, status, responded_at",
+    "transport_groups": "id, trip_id, day_id, task_id, mode_id, label, leader_id, created_at",
+    "transport_group_members": "transport_group_id, user_id, effective_mode_id",
+    "location_updates": "id, user_id, transport_group_id, lat, lng, recorded_at",
+}
+
+CSV_HEADER = ["trip_name", "trip_start", "trip_end", "day_date", "time", "title",
+              "description", "lat", "lng"]
+
+# Latest event per (task, user), as init_db's backfill does
+FOLD_STATUS_SQL = """
+    INSERT INTO task_status_current (task_id, user_id, status, responded_at, seq)
+    SELECT DISTINCT ON (task_id, user_id) task_id, user_id, status, responded_at, seq
+    FROM task_status_events
+    ORDER BY task_id, user_id, seq DESC
+    ON CONFLICT (task_id, user_id) DO NOTHING
+"""
+
+
+def user_name(i):
+    return f"bench_{i:06d}"
+
+
+# ---------------- generation ----------------
+
+class Dataset:
+    def __init__(self, scale, seed=42):
+        self.scale = scale
+        self.seed = seed
+        self.city_weights = [c[3] for c in CITIES]
+
+    def rng(self, kind, n):
+        return random.Random(f"{self.seed}:{kind}:{n}")
+
+    def uid(self, kind, n):
+        digest = hashlib.blake2b(f"{self.seed}:{kind}:{n}".encode(), digest_size=16).digest()
+        return str(uuid.UUID(bytes=digest, version=4))
+
+    def user_id(self, i):
+        return self.uid("user", i)
+
+    def circle(self, i):
+        size = self.scale["circle_size"]
+        start = i // size * size
+        return range(start, min(start + size, self.scale["users"]))
+
+    def users(self):
+        # One hash shared by every user: a login costs what a real one does,
+        # without hashing once per generated row
+        password = passwords.hash_password(PASSWORD)
+        for i in range(self.scale["users"]):
+            yield (self.user_id(i), user_name(i), password, f"{user_name(i)}@bench.invalid",
+                   EPOCH - timedelta(days=365) + timedelta(minutes=i), f"TP-{i:06X}")
+
+    def friends(self):
+        """Both directions of each friendship, every pair exactly once"""
+        users = self.scale["users"]
+        for i in range(users):
+            rng = self.rng("friends", i)
+            later = [j for j in self.circle(i) if j > i]
+            # Most friends are in the circle, an occasional one is anyone
+            want = min(len(later), max(0, round(rng.gauss(self.scale["friends_per_user"] / 2, 1))))
+            picked = rng.sample(later, want)
+            if users > i + len(later) + 1 and rng.random() < 0.3:
+                picked.append(rng.randrange(i + len(later) + 1, users))
+            for j in picked:
+                a, b = self.user_id(i), self.user_id(j)
+                yield (a, b, EPOCH)
+                yield (b, a, EPOCH)
+
+    def trip_counts(self):
+        """(owner index, trip number) for every trip, numbered from 1"""
+        number = 0
+        for i in range(self.scale["users"]):
+            rng = self.rng("owner", i)
+            # Skewed: many users plan one or two trips, a few plan dozens
+            count = min(int(rng.paretovariate(2.0) * self.scale["trips_per_user"] / 2), 60)
+            for _ in range(count):
+                number += 1
+                yield i, number
+
+    def trip(self, owner, number):
+        """{table: [rows]} for one trip and everything under it"""
+        s = self.scale
+        rng = self.rng("trip", number)
+        rows = {table: [] for table in COLUMNS}
+        trip_id = self.uid("trip", number)
+        owner_id = self.user_id(owner)
+        created_at = EPOCH + timedelta(minutes=number)
+
+        n_days = max(1, min(21, round(rng.gauss(s["days_per_trip"], s["days_per_trip"] / 3))))
+        start = (EPOCH + timedelta(days=rng.randrange(-180, 365))).date()
+        end = start + timedelta(days=n_days - 1)
+
+        # Longer trips may go on to one or two of the nearest other cities
+        cities = rng.choices(CITIES, weights=self.city_weights)
+        stops = min(rng.choice((1, 1, 1, 2, 2, 3)), 1 + n_days // 3)
+        if stops > 1:
+            nearby = sorted(CITIES, key=lambda c: (c[1] - cities[0][1]) ** 2 + (c[2] - cities[0][2]) ** 2)
+            cities += rng.sample(nearby[1:5], stops - 1)
+        name = f"{' & '.join(c[0] for c in cities)} {start.year}"
+        rows["trips"].append((trip_id, name, start, end, owner_id, created_at))
+
+        friends = [j for j in self.circle(owner) if j != owner]
+        n_members = max(0, min(len(friends), round(rng.gauss(s["members_per_trip"] - 1, 1))))
+        members = [owner_id] + [self.user_id(j) for j in rng.sample(friends, n_members)]
+        for k, user_id in enumerate(members):
+            role = "owner" if k == 0 else "member"
+            joined = created_at + timedelta(hours=k * rng.randrange(1, 48))
+            rows["trip_members"].append((trip_id, user_id, role, joined.isoformat(), created_at))
+
+        for d in range(n_days):
+            city = cities[d * len(cities) // n_days]
+            self._day(rng, rows, f"{number}:{d}", trip_id, owner_id, members,
+                      start + timedelta(days=d), city, created_at)
+        return rows
+
+    def _day(self, rng, rows, key, trip_id, owner_id, members, day_date, city, created_at):
+        s = self.scale
+        day_id = self.uid("day", key)
+        rows["days"].append((day_id, trip_id, day_date))
+
+        # A neighbourhood within a few km of the centre; tasks cluster around it
+        center_lat = city[1] + rng.gauss(0, 2.0) / KM_PER_DEGREE
+        center_lng = city[2] + rng.gauss(0, 2.0) / (KM_PER_DEGREE * math.cos(math.radians(city[1])))
+        n_tasks = max(1, min(len(SLOTS), round(rng.gauss(s["tasks_per_day"], 2))))
+        first_slot = rng.randrange(0, len(SLOTS) - n_tasks + 1)
+        order_keys = keys_between(None, None, n_tasks)
+        day_start = datetime.combine(day_date, datetime.min.time())
+
+        stops = []
+        for t in range(n_tasks):
+            hour, title = SLOTS[first_slot + t]
+            lat = center_lat + rng.gauss(0, 0.8) / KM_PER_DEGREE
+            lng = center_lng + rng.gauss(0, 0.8) / (KM_PER_DEGREE * math.cos(math.radians(lat)))
+            starts = day_start + timedelta(hours=hour, minutes=rng.choice((0, 15, 30)))
+            ends = starts + timedelta(minutes=rng.choice((30, 45, 60, 90)))
+            task_id = self.uid("task", f"{key}:{t}")
+            description = f"{title} in {city[0]}" if rng.random() < 0.5 else ""
+            rows["tasks"].append((
+                task_id, trip_id, day_id, f"{title}, {city[0]}", description,
+                starts.strftime("%H:%M"), ends.strftime("%H:%M"),
+                round(lat, 6), round(lng, 6), t, order_keys[t], created_at,
+            ))
+            stops.append((lat, lng, starts, ends))
+
+            for m, user_id in enumerate(members):
+                if rng.random() >= s["response_rate"]:
+                    continue
+                answered = starts - timedelta(minutes=rng.randrange(5, 24 * 60))
+                answers = 2 if rng.random() < 0.15 else 1
+                for a in range(answers):
+                    rows["task_status_events"].append((
+                        self.uid("event", f"{key}:{t}:{m}:{a}"), task_id, user_id,
+                        rng.choice(STATUSES), answered + timedelta(minutes=30 * a),
+                    ))
+
+        if len(members) < 2 or not s["gps_points_per_leg"]:
+            return
+        group_id = self.uid("group", key)
+        rows["transport_groups"].append((group_id, trip_id, day_id, self.uid("task", f"{key}:0"),
+                                         None, "Group", owner_id, created_at))
+        for user_id in members:
+            rows["transport_group_members"].append((group_id, user_id, None))
+
+        # Each member's phone reports along the leg between consecutive tasks
+        points = s["gps_points_per_leg"]
+        for leg, ((lat1, lng1, _, left), (lat2, lng2, arrive, _)) in enumerate(zip(stops, stops[1:])):
+            seconds = max(60, (arrive - left).total_seconds())
+            for p in range(points):
+                f = (p + 1) / (points + 1)
+                at = left + timedelta(seconds=seconds * f)
+                for m, user_id in enumerate(members):
+                    rows["location_updates"].append((
+                        self.uid("gps", f"{key}:{leg}:{p}:{m}"), user_id, group_id,
+                        round(lat1 + (lat2 - lat1) * f + rng.gauss(0, 0.00015), 6),
+                        round(lng1 + (lng2 - lng1) * f + rng.gauss(0, 0.00015), 6),
+                        at + timedelta(seconds=rng.randrange(0, 20)),
+                    ))
+
+
+# ---------------- COPY into Postgres ----------------
+
+def copy_value(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, float):
+        return repr(value)
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+class CopyWriter:
+    """Buffers rows per table and COPYs them a chunk at a time"""
+
+    def __init__(self, conn, chunk_rows=COPY_CHUNK_ROWS):
+        self.conn = conn
+        self.chunk_rows = chunk_rows
+        self.rows = {table: [] for table in COLUMNS}
+        self.counts = {table: 0 for table in COLUMNS}
+
+    def add(self, table, rows):
+        buffer = self.rows[table]
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) >= self.chunk_rows:
+                self.flush(table)
+
+    def flush(self, table=None):
+        for name in [table] if table else list(self.rows):
+            rows = self.rows[name]
+            if not rows:
+                continue
+            data = io.StringIO("".join(
+                "\t".join(copy_value(v) for v in row) + "\n" for row in rows
+            ))
+            cur = self.conn.cursor()
+            cur.copy_expert(f"COPY {name} ({COLUMNS[name]}) FROM STDIN", data)
+            cur.close()
+            self.counts[name] += len(rows)
+            rows.clear()
+
+
+def load(conn, dataset, progress=None):
+    """COPY the whole dataset into an empty schema; returns rows per table"""
+    out = CopyWriter(conn)
+    out.add("users", dataset.users())
+    out.add("friends", dataset.friends())
+    out.flush()
+
+    for owner, number in dataset.trip_counts():
+        for table, rows in dataset.trip(owner, number).items():
+            if rows:
+                out.add(table, rows)
+        if progress and number % 1000 == 0:
+            progress(number, out.counts)
+
+    # Events before the fold, so the fold sees them all
+    out.flush()
+    cur = conn.cursor()
+    cur.execute(FOLD_STATUS_SQL)
+    cur.close()
+    return out.counts
+
+
+def reset(conn):
+    cur = conn.cursor()
+    cur.execute(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY")
+    cur.close()
+
+
+def is_empty(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT EXISTS (SELECT 1 FROM users) OR EXISTS (SELECT 1 FROM trips)")
+    (populated,) = cur.fetchone()
+    cur.close()
+    return not populated
+
+
+def bench_database_url(url=None):
+    url = url or os.environ.get("BENCH_DATABASE_URL")
+    if not url:
+        sys.exit("Set BENCH_DATABASE_URL (or --database-url) to a scratch database")
+    return url
+
+
+def ensure_schema(url):
+    from app import create_app
+    from db import init_db
+
+    app = create_app({"DATABASE_URL": url, "DB_PROBE_INTERVAL": 0, "LOG_LEVEL": "WARNING"})
+    with app.app_context():
+        init_db()
+
+
+def seed_database(url, scale, seed, reset_first=False, progress=None):
+    """Schema, optional reset, COPY, ANALYZE; returns rows per table"""
+    ensure_schema(url)
+    conn = psycopg2.connect(url)
+    try:
+        if reset_first:
+            reset(conn)
+        elif not is_empty(conn):
+            sys.exit("The database already has users or trips; use --reset")
+        counts = load(conn, Dataset(scale, seed), progress)
+        conn.commit()
+        # Fresh statistics, so plans match what a long-lived database would use
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute("ANALYZE")
+        cur.close()
+    finally:
+        conn.close()
+    return counts
+
+
+# ---------------- import CSVs ----------------
+
+def write_trip_csv(path, rows):
+    trip = rows["trips"][0]
+    days = {day_id: day_date for day_id, _, day_date in rows["days"]}
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        for task in rows["tasks"]:
+            _, _, day_id, title, description, start_time, _, lat, lng, *_ = task
+            writer.writerow([trip[1], trip[2].isoformat(), trip[3].isoformat(),
+                             days[day_id].isoformat(), start_time, title, description,
+                             lat, lng])
+
+
+def write_csvs(directory, dataset, progress=None):
+    """One import CSV per trip; returns (files, task rows)"""
+    files = tasks = 0
+    for owner, number in dataset.trip_counts():
+        rows = dataset.trip(owner, number)
+        shard = os.path.join(directory, f"{(number - 1) // CSV_FILES_PER_DIR:04d}")
+        if (number - 1) % CSV_FILES_PER_DIR == 0:
+            os.makedirs(shard, exist_ok=True)
+        write_trip_csv(os.path.join(shard, f"trip_{number:07d}.csv"), rows)
+        files += 1
+        tasks += len(rows["tasks"])
+        if progress and number % 1000 == 0:
+            progress(number, {"files": files, "tasks": tasks})
+    return files, tasks
+
+
+# ---------------- CLI ----------------
+
+def scale_from_args(args):
+    scale = dict(SCALES[args.scale])
+    for override in args.set or ():
+        key, _, value = override.partition("=")
+        if key not in scale:
+            sys.exit(f"Unknown scale setting: {key}")
+        scale[key] = type(scale[key])(value)
+    return scale
+
+
+def add_scale_arguments(parser):
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--set", action="append", metavar="KEY=VALUE",
+                        help="override one scale setting, e.g. --set users=100")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("target", choices=("copy", "csv"))
+    parser.add_argument("directory", nargs="?", help="output directory, for csv")
+    add_scale_arguments(parser)
+    parser.add_argument("--reset", action="store_true", help="empty every table first (copy)")
+    args = parser.parse_args()
+
+    scale = scale_from_args(args)
+    started = time.perf_counter()
+
+    def progress(trips, counts):
+        rows = sum(counts.values())
+        print(f"  {trips} trips, {rows} rows, {rows / (time.perf_counter() - started):.0f} rows/s",
+              file=sys.stderr)
+
+    if args.target == "csv":
+        if not args.directory:
+            parser.error("csv needs an output directory")
+        os.makedirs(args.directory, exist_ok=True)
+        files, tasks = write_csvs(args.directory, Dataset(scale, args.seed), progress)
+        print(f"wrote {files} trip CSVs ({tasks} tasks) to {args.directory} "
+              f"in {time.perf_counter() - started:.1f}s")
+        return
+
+    counts = seed_database(bench_database_url(args.database_url), scale, args.seed,
+                           reset_first=args.reset, progress=progress)
+    print(f"loaded scale={args.scale} seed={args.seed} in {time.perf_counter() - started:.1f}s")
+    for table, count in counts.items():
+        print(f"  {table:<24} {count:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Login latency under a burst: --rate logins per second for --seconds.
+
+    python benchmarks/login_burst.py --rate 200 --seconds 5 --log2-n 14
+    python benchmarks/login_burst.py --url http://127.0.0.1:8000 --rate 200
+
+Arrivals are open-loop: login i is due at start + i / rate whether or not
+earlier ones have finished, and its latency counts from when it was due,
+so a backed-up hasher shows up as latency instead of a slower send rate.
+
+By default each login is a password check on this process's hashing
+pool (passwords.verify_password at the given cost), as many request
+threads would do at once in a gthread worker. With --url, bench users
+(benchmarks/datagen.py) sign in to a running server over HTTP. Exits
+non-zero when the p99 of completed logins exceeds --budget-ms or any
+login was turned away because the hashing queue was full.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import passwords  # noqa: E402
+from datagen import PASSWORD, user_name  # noqa: E402
+from routes import NoRedirect, percentile  # noqa: E402
+
+
+def local_login(stored):
+    def attempt(i):
+        try:
+            matches, _ = passwords.verify_password(stored, PASSWORD)
+        except passwords.PasswordHasherBusy:
+            return "busy"
+        return "ok" if matches else "rejected"
+    return attempt
+
+
+def http_login(base_url, users):
+    def attempt(i):
+        opener = urllib.request.build_opener(NoRedirect)
+        form = urllib.parse.urlencode({"username": user_name(i % users),
+                                       "password": PASSWORD}).encode()
+        try:
+            opener.open(base_url + "/login", data=form, timeout=60)
+            return "rejected"
+        except urllib.error.HTTPError as e:
+            if e.code in (302, 303):
+                # Success goes on to the dashboard, failure back to sign-in
+                location = e.headers.get("Location", "")
+                return "ok" if "dashboard" in location else "rejected"
+            return f"http {e.code}"
+    return attempt
+
+
+def burst(attempt, rate, seconds, request_threads):
+    total = int(rate * seconds)
+    latencies = {}
+    lock = threading.Lock()
+
+    def run(i, due):
+        outcome = attempt(i)
+        elapsed = (time.perf_counter() - due) * 1000
+        with lock:
+            latencies.setdefault(outcome, []).append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=request_threads) as pool:
+        for i in range(total):
+            due = started + i / rate
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(run, i, due)
+    elapsed = time.perf_counter() - started
+    return {outcome: sorted(values) for outcome, values in latencies.items()}, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rate", type=float, default=200, help="logins per second")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--budget-ms", type=float, default=500, help="p99 limit")
+    parser.add_argument("--request-threads", type=int, default=64,
+                        help="concurrent logins in flight (worker threads)")
+    parser.add_argument("--log2-n", type=int, default=passwords.DEFAULT_LOG2_N)
+    parser.add_argument("--hash-threads", type=int, default=None,
+                        help="hashing pool size (default: CPU count)")
+    parser.add_argument("--hash-queue", type=int, default=passwords.DEFAULT_QUEUE)
+    parser.add_argument("--url", help="sign in to a running server instead")
+    parser.add_argument("--users", type=int, default=50, help="bench users to rotate, with --url")
+    args = parser.parse_args()
+
+    if args.url:
+        attempt = http_login(args.url.rstrip("/"), args.users)
+        print(f"{args.url}: {args.rate:.0f} logins/s for {args.seconds:.0f}s")
+    else:
+        passwords.configure(log2_n=args.log2_n, threads=args.hash_threads, queue=args.hash_queue)
+        stored = passwords.hash_password(PASSWORD)
+        attempt = local_login(stored)
+        hash_ms = passwords.time_hash(args.log2_n)
+        threads = passwords.hash_threads()
+        print(f"scrypt N=2^{args.log2_n}: {hash_ms:.1f} ms/hash, {threads} hash thread(s), "
+              f"capacity ~{threads * 1000 / hash_ms:.0f} logins/s; "
+              f"offering {args.rate:.0f}/s for {args.seconds:.0f}s")
+
+    latencies, elapsed = burst(attempt, args.rate, args.seconds, args.request_threads)
+    print(f"{sum(map(len, latencies.values()))} logins in {elapsed:.2f}s: "
+          + ", ".join(f"{k}={len(v)}" for k, v in sorted(latencies.items())))
+
+    # Checked passwords, right or wrong; "busy" ones never reached the hasher
+    done = sorted(ms for outcome, values in latencies.items() if outcome != "busy"
+                  for ms in values)
+    if not done:
+        sys.exit("no login completed")
+    p99 = percentile(done, 99)
+    print(f"completed latency ms: p50={percentile(done, 50):.1f} p95={percentile(done, 95):.1f} "
+          f"p99={p99:.1f} max={done[-1]:.1f} (budget {args.budget_ms:.0f})")
+    sys.exit(0 if p99 <= args.budget_ms and "busy" not in latencies else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""
+Latency and query-count benchmark for the hot routes.
+
+    BENCH_DATABASE_URL=postgresql://localhost/tripplanner_bench \\
+        python benchmarks/routes.py --seed-db --scale small --requests 200
+    python benchmarks/routes.py --url http://127.0.0.1:8000 --concurrency 16
+    python benchmarks/routes.py --save-baseline     # after an accepted change
+
+Drives the dashboard, trip list, trip and day pages, analytics, trip
+import and the status endpoints as generated bench users (datagen.py)
+and reports p50/p95/p99 latency and queries per request for each.
+
+By default requests go through the Flask test client in this process, one
+at a time, so the numbers are the app's own cost with no server or
+network in between; query counts come from the request's query profile.
+With --url a running server is loaded by --concurrency threads over HTTP,
+and query counts come from the server's /metrics (set METRICS_DIR on
+multi-worker servers so the scrape covers every worker).
+
+Results are compared with benchmarks/baseline.json when it exists: a
+route whose p95 grew by more than --tolerance, or that runs more queries
+than before, is a regression and the exit status is 1.
+"""
+import argparse
+import http.cookiejar
+import io
+import json
+import math
+import os
+import re
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import psycopg2  # noqa: E402
+from psycopg2.extras import RealDictCursor  # noqa: E402
+
+import datagen  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+IMPORT_CSV = os.path.join(ROOT, "tests", "fixtures", "good_trip.csv")
+
+# p95 differences below this are noise, whatever the ratio
+NOISE_FLOOR_MS = 1.0
+
+# name -> (flask endpoint, method, path template); {trip}, {day} and
+# {task} are filled per request from the signed-in user's own data
+ROUTES = {
+    "dashboard": ("main.dashboard", "GET", "/dashboard"),
+    "trips": ("main.trips_page", "GET", "/trips"),
+    "trip": ("main.trip_view", "GET", "/trip/{trip}"),
+    "day": ("main.day_view", "GET", "/trip/{trip}/day/{day}"),
+    "analytics": ("main.analytics", "GET", "/analytics"),
+    "analytics_trip": ("main.analytics", "GET", "/analytics?scope=trip&trip_id={trip}"),
+    "status": ("main.update_task_status", "POST", "/task/{task}/status/YES"),
+    "status_reset": ("main.reset_task_status", "POST", "/task/{task}/status/reset"),
+    "import": ("main.import_trip", "POST", "/import-trip"),
+    "export": ("main.export_trip", "GET", "/trip/{trip}/export.csv"),
+}
+
+# One trip, day and task per sampled user, chosen the same way every run
+TARGETS_SQL = """
+    SELECT u.id AS user_id, u.name, t.id AS trip, d.id AS day, x.id AS task
+    FROM users u
+    JOIN LATERAL (
+        SELECT id FROM trips WHERE owner_id = u.id ORDER BY created_at, id LIMIT 1
+    ) t ON true
+    JOIN LATERAL (
+        SELECT id FROM days WHERE trip_id = t.id ORDER BY date, id LIMIT 1
+    ) d ON true
+    JOIN LATERAL (
+        SELECT id FROM tasks WHERE day_id = d.id ORDER BY order_key, id LIMIT 1
+    ) x ON true
+    WHERE u.name LIKE 'bench\\_%%'
+    ORDER BY u.name
+    LIMIT %s
+"""
+
+
+def load_targets(url, count):
+    conn = psycopg2.connect(url, cursor_factory=RealDictCursor)
+    try:
+        cur = conn.cursor()
+        cur.execute(TARGETS_SQL, (count,))
+        targets = cur.fetchall()
+        cur.close()
+    finally:
+        conn.close()
+    if not targets:
+        sys.exit("No bench users with trips found; run with --seed-db first")
+    return targets
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def import_file():
+    with open(IMPORT_CSV, "rb") as f:
+        return f.read()
+
+
+# ---------------- Flask test client ----------------
+
+def run_in_process(url, targets, routes, requests, warmup):
+    from flask import g
+
+    from app import create_app
+
+    app = create_app({
+        "DATABASE_URL": url,
+        "DB_PROBE_INTERVAL": 0,
+        "LOG_LEVEL": "ERROR",
+        "TESTING": True,
+    })
+    queries = []
+
+    @app.after_request
+    def capture_queries(response):
+        profile = g.get("query_profile")
+        queries.append(profile.count if profile is not None else None)
+        return response
+
+    client = app.test_client()
+    csv_bytes = import_file()
+    results = {}
+
+    for name in routes:
+        _, method, template = ROUTES[name]
+        timings, counts, errors = [], [], 0
+
+        for i in range(warmup + requests):
+            target = targets[i % len(targets)]
+            with client.session_transaction() as session:
+                session["user_id"] = target["user_id"]
+            path = template.format(**target)
+
+            kwargs = {}
+            if name == "import":
+                kwargs["data"] = {"trip_file": (io.BytesIO(csv_bytes), "bench_trip.csv")}
+                kwargs["content_type"] = "multipart/form-data"
+
+            queries.clear()
+            started = time.perf_counter()
+            # buffered: streamed bodies (export) are read inside the timing
+            response = client.open(path, method=method, buffered=True, **kwargs)
+            elapsed = (time.perf_counter() - started) * 1000
+
+            if i < warmup:
+                continue
+            timings.append(elapsed)
+            if queries and queries[-1] is not None:
+                counts.append(queries[-1])
+            if response.status_code >= 400:
+                errors += 1
+
+        results[name] = summarize(timings, counts, errors)
+    return results
+
+
+# ---------------- HTTP load ----------------
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def multipart(field, filename, data):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        "Content-Type: text/csv\r\n\r\n"
+    ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def http_session(base_url, name):
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar), NoRedirect)
+    form = urllib.parse.urlencode({"username": name, "password": datagen.PASSWORD}).encode()
+    try:
+        opener.open(base_url + "/login", data=form, timeout=30)
+    except urllib.error.HTTPError as e:
+        if e.code >= 400:
+            raise
+    return opener
+
+
+def http_request(opener, base_url, method, path, body=None, content_type=None):
+    request = urllib.request.Request(base_url + path, data=body, method=method)
+    if content_type:
+        request.add_header("Content-Type", content_type)
+    started = time.perf_counter()
+    try:
+        with opener.open(request, timeout=60) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return (time.perf_counter() - started) * 1000, status
+
+
+def scrape_queries(base_url):
+    """{endpoint: (requests, queries)} from the server's /metrics"""
+    with urllib.request.urlopen(base_url + "/metrics", timeout=30) as response:
+        text = response.read().decode()
+    totals = defaultdict(lambda: [0, 0])
+    for line in text.splitlines():
+        match = re.match(r'tripplanner_(request_duration_seconds_count|request_queries_total)'
+                         r'\{endpoint="([^"]+)"[^}]*\} (\S+)', line)
+        if match:
+            kind, endpoint, value = match.groups()
+            totals[endpoint][0 if kind.startswith("request_duration") else 1] += float(value)
+    return totals
+
+
+def run_over_http(base_url, targets, routes, requests, warmup, concurrency):
+    openers = [http_session(base_url, t["name"]) for t in targets]
+    csv_bytes = import_file()
+    results = {}
+
+    for name in routes:
+        endpoint, method, template = ROUTES[name]
+
+        def one(i):
+            target_index = i % len(targets)
+            body = content_type = None
+            if name == "import":
+                body, content_type = multipart("trip_file", "bench_trip.csv", csv_bytes)
+            elif method == "POST":
+                body = b""
+            return http_request(openers[target_index], base_url, method,
+                                template.format(**targets[target_index]), body, content_type)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, range(warmup)))
+            before = scrape_queries(base_url)
+            samples = list(pool.map(one, range(requests)))
+            after = scrape_queries(base_url)
+
+        served = after[endpoint][0] - before[endpoint][0]
+        ran = after[endpoint][1] - before[endpoint][1]
+        # Query counts are per endpoint; only exact when nothing else hit it
+        counts = [ran / served] if served else []
+        timings = [ms for ms, _ in samples]
+        errors = sum(1 for _, status in samples if status >= 400)
+        results[name] = summarize(timings, counts, errors)
+    return results
+
+
+# ---------------- report ----------------
+
+def summarize(timings, counts, errors):
+    timings = sorted(timings)
+    return {
+        "requests": len(timings),
+        "errors": errors,
+        "p50": percentile(timings, 50),
+        "p95": percentile(timings, 95),
+        "p99": percentile(timings, 99),
+        "queries": sum(counts) / len(counts) if counts else None,
+    }
+
+
+def fmt(value, spec=".1f"):
+    return "-" if value is None else format(value, spec)
+
+
+def compare(results, baseline, tolerance):
+    """Regression messages for routes slower or chattier than the baseline"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("routes", {}).get(name)
+        if not base:
+            continue
+        if result["p95"] is not None and base.get("p95") is not None:
+            allowed = max(base["p95"] * (1 + tolerance), base["p95"] + NOISE_FLOOR_MS)
+            if result["p95"] > allowed:
+                regressions.append(f"{name}: p95 {result['p95']:.1f} ms > {allowed:.1f} ms "
+                                   f"(baseline {base['p95']:.1f} ms)")
+        if result["queries"] is not None and base.get("queries") is not None:
+            if result["queries"] > base["queries"] + 0.5:
+                regressions.append(f"{name}: {result['queries']:.1f} queries/request "
+                                   f"(baseline {base['queries']:.1f})")
+    return regressions
+
+
+def report(results, baseline):
+    base_routes = (baseline or {}).get("routes", {})
+    print(f"{'route':<16}{'n':>6}{'err':>5}{'p50':>9}{'p95':>9}{'p99':>9}"
+          f"{'queries':>9}{'base p95':>10}")
+    for name, r in results.items():
+        base = base_routes.get(name, {})
+        print(f"{name:<16}{r['requests']:>6}{r['errors']:>5}{fmt(r['p50']):>9}"
+              f"{fmt(r['p95']):>9}{fmt(r['p99']):>9}{fmt(r['queries']):>9}"
+              f"{fmt(base.get('p95')):>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    datagen.add_scale_arguments(parser)
+    parser.add_argument("--seed-db", action="store_true",
+                        help="reset and seed the bench database first")
+    parser.add_argument("--url", help="load a running server instead of the test client")
+    parser.add_argument("--routes", default=",".join(ROUTES),
+                        help="comma-separated subset of: " + ", ".join(ROUTES))
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per route")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--users", type=int, default=20, help="distinct users to sign in as")
+    parser.add_argument("--concurrency", type=int, default=8, help="threads, with --url")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed p95 growth over the baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    routes = [r.strip() for r in args.routes.split(",") if r.strip()]
+    unknown = [r for r in routes if r not in ROUTES]
+    if unknown:
+        sys.exit(f"Unknown routes: {', '.join(unknown)}")
+
+    db_url = datagen.bench_database_url(args.database_url)
+    if args.seed_db:
+        datagen.seed_database(db_url, datagen.scale_from_args(args), args.seed, reset_first=True)
+
+    targets = load_targets(db_url, args.users)
+    if args.url:
+        results = run_over_http(args.url.rstrip("/"), targets, routes, args.requests,
+                                args.warmup, args.concurrency)
+    else:
+        results = run_in_process(db_url, targets, routes, args.requests, args.warmup)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    mode = "http" if args.url else "client"
+    meta = {"scale": args.scale, "set": args.set or [], "seed": args.seed, "mode": mode}
+    report(results, baseline)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"meta": meta, "routes": results}, f, indent=2, sort_keys=True)
+        print(f"baseline saved to {args.baseline}")
+        return
+
+    if baseline is None:
+        print("no baseline to compare with (--save-baseline to record one)")
+        return
+    if baseline.get("meta") != meta:
+        print(f"warning: baseline was recorded with {baseline.get('meta')}, this run is {meta}")
+
+    regressions = compare(results, baseline, args.tolerance)
+    for line in regressions:
+        print("REGRESSION " + line)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
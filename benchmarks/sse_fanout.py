@@ -0,0 +1,81 @@
+"""
+Fan-out benchmark for live day updates.
+
+    python benchmarks/sse_fanout.py --subscribers 500 --events 200
+    python benchmarks/sse_fanout.py --subscribers 500 --in-process
+
+Each subscriber is drained by its own thread, like one SSE stream per
+thread in a gthread worker. By default events go through pg_notify and the
+worker's single LISTEN connection (needs DATABASE_URL); --in-process skips
+Postgres and measures the per-worker fan-out cost alone.
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import live_updates  # noqa: E402
+
+
+def run(subscribers, events, in_process):
+    hub = live_updates.LiveUpdates()
+    if in_process:
+        hub._ensure_listener = lambda: None
+
+    latencies = []
+    lock = threading.Lock()
+
+    def drain(q):
+        for _ in range(events):
+            event = q.get(timeout=30)
+            elapsed = (time.time() - event["sent"]) * 1000
+            with lock:
+                latencies.append(elapsed)
+
+    readers = []
+    for _ in range(subscribers):
+        _, q = hub.subscribe("bench-trip", "bench-day")
+        reader = threading.Thread(target=drain, args=(q,), daemon=True)
+        reader.start()
+        readers.append(reader)
+
+    conn = None
+    if not in_process:
+        import psycopg2
+        conn = psycopg2.connect(os.environ["DATABASE_URL"])
+        conn.autocommit = True
+        time.sleep(1)  # let the listener connect
+
+    started = time.perf_counter()
+    for i in range(events):
+        if in_process:
+            hub.dispatch({"type": "status", "trip_id": "bench-trip",
+                          "day_id": "bench-day", "sent": time.time()})
+        else:
+            live_updates.publish(conn, "bench-trip", "bench-day", "status",
+                                 task_id=f"task-{i}", sent=time.time())
+        time.sleep(0.001)
+    for reader in readers:
+        reader.join(timeout=60)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"subscribers={subscribers} events={events} "
+          f"deliveries={len(latencies)} in {elapsed:.2f}s")
+    if latencies:
+        print(f"latency ms: p50={statistics.median(latencies):.2f} "
+              f"p95={latencies[int(len(latencies) * 0.95) - 1]:.2f} "
+              f"p99={latencies[int(len(latencies) * 0.99) - 1]:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subscribers", type=int, default=500)
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--in-process", action="store_true")
+    args = parser.parse_args()
+    run(args.subscribers, args.events, args.in_process)
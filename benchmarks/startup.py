@@ -0,0 +1,62 @@
+"""
+Worker boot time: fresh interpreter -> `import app` -> create_app().
+
+    python benchmarks/startup.py --runs 15 --budget-ms 200
+
+This is what every gunicorn/hypercorn worker pays on fork or restart.
+Each run is a new process so module caches don't hide import cost; the
+bare interpreter start-up is measured separately and subtracted. Exits
+non-zero when the median boot exceeds --budget-ms (200 ms, the
+production target).
+
+A bare `import flask` is reported alongside, so a failing run shows
+whether the time went to the framework or to this repo. The repo's
+share is kept small by importing drivers (psycopg2, psycopg, quart)
+only where they are first used, not at module level.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BOOT = "import app; app.create_app()"
+
+
+def time_run(code, env):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def median_ms(code, runs, env):
+    return statistics.median(time_run(code, env) for _ in range(runs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=200,
+                        help="limit on the median worker boot")
+    args = parser.parse_args()
+
+    # No DATABASE_URL: booting must not need (or touch) the database
+    env = {k: v for k, v in os.environ.items() if k != "DATABASE_URL"}
+
+    baseline = median_ms("pass", args.runs, env)
+    framework = median_ms("import flask", args.runs, env) - baseline
+    worker = median_ms(BOOT, args.runs, env) - baseline
+
+    print(f"interpreter start-up: {baseline:7.1f} ms (subtracted)")
+    print(f"  import flask:       {framework:7.1f} ms")
+    print(f"  app on top of it:   {worker - framework:7.1f} ms")
+    print(f"worker boot:          {worker:7.1f} ms (budget {args.budget_ms:.0f} ms)")
+
+    sys.exit(0 if worker <= args.budget_ms else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Index size and join speed with TEXT ids versus native uuid.
+
+    BENCH_DATABASE_URL=postgresql://localhost/tripplanner_bench \\
+        python benchmarks/uuid_keys.py --scale large --repeat 5
+
+Empties the bench database, puts every id column back to TEXT (the
+schema before db.migrate_uuid_keys), loads a synthetic dataset
+(datagen.py) and measures:
+
+  - the size of each table's indexes, rebuilt first so both sides are
+    measured freshly packed;
+  - whole-dataset joins along the key columns (median of --repeat);
+  - --lookups day pages (tasks joined to their day) by id, one query each.
+
+Then it runs the online migration itself, timed, and measures again.
+Finally it inserts --insert-rows keys into scratch tables to compare
+random (v4) with time-ordered (v7) uuids as a primary key: the v7 index
+stays packed because every insert lands on its rightmost page.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import psycopg2  # noqa: E402
+from psycopg2.extras import RealDictCursor  # noqa: E402
+
+import datagen  # noqa: E402
+from app import DAY_TASKS_SQL  # noqa: E402
+from db import UUID_COLUMNS, migrate_uuid_keys  # noqa: E402
+
+TABLES = [table for table, _, _ in UUID_COLUMNS]
+
+JOINS = {
+    "trip_days_tasks": """
+        SELECT COUNT(*) FROM trips t
+        JOIN days d ON d.trip_id = t.id
+        JOIN tasks x ON x.day_id = d.id
+    """,
+    "member_statuses": """
+        SELECT COUNT(*) FROM trip_members tm
+        JOIN tasks x ON x.trip_id = tm.trip_id
+        JOIN task_status_current c ON c.task_id = x.id AND c.user_id = tm.user_id
+    """,
+    "friends_trips": """
+        SELECT COUNT(*) FROM friends f
+        JOIN users u ON u.id = f.friend_id
+        JOIN trips t ON t.owner_id = u.id
+    """,
+    "group_locations": """
+        SELECT COUNT(*) FROM location_updates l
+        JOIN transport_group_members m
+            ON m.transport_group_id = l.transport_group_id AND m.user_id = l.user_id
+    """,
+}
+
+INDEX_SIZES_SQL = """
+    SELECT c.relname AS table_name, SUM(pg_relation_size(i.indexrelid)) AS bytes
+    FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indrelid
+    WHERE c.relname = ANY(%s)
+    GROUP BY c.relname
+"""
+
+
+def connect(url):
+    conn = psycopg2.connect(url, cursor_factory=RealDictCursor)
+    conn.autocommit = True
+    return conn
+
+
+def prepare_text_schema(url, scale, seed):
+    """Empty schema with TEXT ids, loaded with the dataset; returns rows per table"""
+    datagen.ensure_schema(url)
+    conn = connect(url)
+    cur = conn.cursor()
+    datagen.reset(conn)
+    for table, _, columns in UUID_COLUMNS:
+        cur.execute(f"ALTER TABLE {table} " + ", ".join(
+            f"ALTER COLUMN {column} TYPE text" for column in columns
+        ))
+
+    conn.autocommit = False
+    counts = datagen.load(conn, datagen.Dataset(scale, seed))
+    conn.commit()
+    conn.autocommit = True
+    cur.close()
+    conn.close()
+    return counts
+
+
+def index_sizes(cur):
+    cur.execute(INDEX_SIZES_SQL, (TABLES,))
+    return {row["table_name"]: row["bytes"] for row in cur.fetchall()}
+
+
+def timed_ms(cur, sql, params=()):
+    started = time.perf_counter()
+    cur.execute(sql, params)
+    cur.fetchall()
+    return (time.perf_counter() - started) * 1000
+
+
+def measure(url, repeat, lookups):
+    conn = connect(url)
+    cur = conn.cursor()
+    for table in TABLES:
+        cur.execute(f"REINDEX TABLE {table}")
+    cur.execute("VACUUM ANALYZE")
+
+    result = {"index_bytes": index_sizes(cur), "join_ms": {}}
+    for name, sql in JOINS.items():
+        timed_ms(cur, sql)  # warm the cache
+        result["join_ms"][name] = statistics.median(timed_ms(cur, sql) for _ in range(repeat))
+
+    cur.execute("SELECT id::text AS id FROM days ORDER BY md5(id::text) LIMIT %s", (lookups,))
+    day_ids = [row["id"] for row in cur.fetchall()]
+    for day_id in day_ids:
+        timed_ms(cur, DAY_TASKS_SQL, (day_id,))
+    result["lookup_ms"] = sum(timed_ms(cur, DAY_TASKS_SQL, (day_id,)) for day_id in day_ids)
+
+    cur.close()
+    conn.close()
+    return result
+
+
+def insert_keys(url, rows):
+    """{version: (seconds, index bytes)} for rows primary keys of each kind"""
+    conn = connect(url)
+    cur = conn.cursor()
+    out = {}
+    for version, function in (("v4", "gen_random_uuid()"), ("v7", "uuid_v7()")):
+        cur.execute(f"DROP TABLE IF EXISTS bench_keys_{version}")
+        cur.execute(f"CREATE TABLE bench_keys_{version} (id uuid PRIMARY KEY)")
+        started = time.perf_counter()
+        # Many small inserts, as the app makes them, not one sorted bulk load
+        for _ in range(0, rows, 1000):
+            cur.execute(f"INSERT INTO bench_keys_{version} SELECT {function} "
+                        f"FROM generate_series(1, 1000)")
+        seconds = time.perf_counter() - started
+        cur.execute(f"SELECT pg_relation_size('bench_keys_{version}_pkey') AS bytes")
+        out[version] = (seconds, cur.fetchone()["bytes"])
+        cur.execute(f"DROP TABLE bench_keys_{version}")
+    cur.close()
+    conn.close()
+    return out
+
+
+def change(before, after):
+    return f"{(after - before) / before * 100:+.0f}%" if before else ""
+
+
+def report(before, after, migration_seconds):
+    print(f"{'index size (MiB)':<26}{'text':>10}{'uuid':>10}{'change':>9}")
+    for table in TABLES:
+        b, a = before["index_bytes"].get(table, 0), after["index_bytes"].get(table, 0)
+        print(f"  {table:<24}{b / 2**20:>10.1f}{a / 2**20:>10.1f}{change(b, a):>9}")
+    b, a = sum(before["index_bytes"].values()), sum(after["index_bytes"].values())
+    print(f"  {'total':<24}{b / 2**20:>10.1f}{a / 2**20:>10.1f}{change(b, a):>9}")
+
+    print(f"{'joins (ms, median)':<26}{'text':>10}{'uuid':>10}{'change':>9}")
+    for name in JOINS:
+        b, a = before["join_ms"][name], after["join_ms"][name]
+        print(f"  {name:<24}{b:>10.1f}{a:>10.1f}{change(b, a):>9}")
+    b, a = before["lookup_ms"], after["lookup_ms"]
+    print(f"  {'day page lookups':<24}{b:>10.1f}{a:>10.1f}{change(b, a):>9}")
+    print(f"online migration: {migration_seconds:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    datagen.add_scale_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=5, help="runs of each join")
+    parser.add_argument("--lookups", type=int, default=1000, help="day pages fetched by id")
+    parser.add_argument("--insert-rows", type=int, default=200_000,
+                        help="keys inserted per uuid version (0 = skip)")
+    args = parser.parse_args()
+
+    url = datagen.bench_database_url(args.database_url)
+    counts = prepare_text_schema(url, datagen.scale_from_args(args), args.seed)
+    print(f"loaded scale={args.scale} seed={args.seed}: {sum(counts.values())} rows")
+
+    before = measure(url, args.repeat, args.lookups)
+    conn = connect(url)
+    started = time.perf_counter()
+    migrate_uuid_keys(conn)
+    migration_seconds = time.perf_counter() - started
+    conn.close()
+    after = measure(url, args.repeat, args.lookups)
+    report(before, after, migration_seconds)
+
+    if args.insert_rows:
+        print(f"{'primary key inserts':<26}{'seconds':>10}{'MiB':>10}")
+        for version, (seconds, size) in insert_keys(url, args.insert_rows).items():
+            print(f"  {version:<24}{seconds:>10.2f}{size / 2**20:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
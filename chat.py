@@ -0,0 +1,199 @@
+from ids import new_id
+from live_updates import CHANNEL, NOTIFY_PAYLOAD_BYTES
+
+
+# ------------------ Trip and task chat ------------------
+#
+# Every trip has one thread (task_id NULL) and every task can have one.
+# Messages are read newest first, a keyset page at a time on the
+# (thread_id, created_at DESC, id DESC) index, so the latest page of a
+# thread costs the same at ten messages or a million.
+#
+# Unread counts are never counted: chat_members keeps one counter per
+# (thread, member). Posting a message bumps every other trip member's
+# counter and NOTIFYs the trip's live event stream in the same statement
+# that inserts it; reading a thread resets the reader's counter.
+
+PAGE_SIZE = 50
+MAX_MESSAGE_LENGTH = 4000
+# The NOTIFY_PAYLOAD_BYTES limit applies to the JSON, where escaping can
+# make a message up to six times longer, so an oversized payload is sent
+# without the message text and the client fetches it
+
+# Found by index, inserted only the first time. Two first posts racing
+# can both miss; the loser sees nothing and looks again.
+TRIP_THREAD_SQL = """
+    WITH existing AS (
+        SELECT * FROM chat_threads WHERE trip_id = %(trip_id)s AND task_id IS NULL
+    ),
+    created AS (
+        INSERT INTO chat_threads (id, trip_id, task_id, created_at)
+        SELECT %(id)s, %(trip_id)s, NULL, now()
+        WHERE NOT EXISTS (SELECT 1 FROM existing)
+        ON CONFLICT (trip_id) WHERE task_id IS NULL DO NOTHING
+        RETURNING *
+    )
+    SELECT * FROM existing UNION ALL SELECT * FROM created
+"""
+
+TASK_THREAD_SQL = """
+    WITH existing AS (
+        SELECT * FROM chat_threads WHERE task_id = %(task_id)s
+    ),
+    created AS (
+        INSERT INTO chat_threads (id, trip_id, task_id, created_at)
+        SELECT %(id)s, %(trip_id)s, %(task_id)s, now()
+        WHERE NOT EXISTS (SELECT 1 FROM existing)
+        ON CONFLICT (task_id) WHERE task_id IS NOT NULL DO NOTHING
+        RETURNING *
+    )
+    SELECT * FROM existing UNION ALL SELECT * FROM created
+"""
+
+THREAD_FOR_USER_SQL = """
+    SELECT c.*, x.day_id
+    FROM chat_threads c
+    JOIN trips t ON t.id = c.trip_id
+    LEFT JOIN tasks x ON x.id = c.task_id
+    WHERE c.id = %s
+    AND (t.owner_id = %s OR EXISTS (
+        SELECT 1 FROM trip_members tm
+        WHERE tm.trip_id = t.id AND tm.user_id = %s
+    ))
+"""
+
+MESSAGES_PAGE_SQL = """
+    SELECT m.id, m.thread_id, m.sender_id, u.name AS sender_name,
+           m.message, m.message_type, m.created_at
+    FROM chat_messages m
+    LEFT JOIN users u ON u.id = m.sender_id
+    WHERE m.thread_id = %(thread_id)s {keyset}
+    ORDER BY m.created_at DESC, m.id DESC
+    LIMIT %(limit)s
+"""
+
+KEYSET_SQL = "AND (m.created_at, m.id) < (%(before_created_at)s::timestamp, %(before_id)s)"
+
+# Insert, bump the other members' unread counters and notify, in one go
+POST_MESSAGE_SQL = f"""
+    WITH msg AS (
+        INSERT INTO chat_messages (id, thread_id, sender_id, message, message_type, created_at)
+        VALUES (%(id)s, %(thread_id)s, %(sender_id)s, %(message)s, %(message_type)s, now())
+        RETURNING *
+    ),
+    unread AS (
+        INSERT INTO chat_members (thread_id, user_id, unread_count)
+        SELECT %(thread_id)s, tm.user_id, 1
+        FROM trip_members tm
+        WHERE tm.trip_id = %(trip_id)s AND tm.user_id <> %(sender_id)s
+        ON CONFLICT (thread_id, user_id)
+        DO UPDATE SET unread_count = chat_members.unread_count + 1
+    )
+    SELECT msg.*, pg_notify('{CHANNEL}', CASE
+        WHEN octet_length(note.payload::text) <= {NOTIFY_PAYLOAD_BYTES} THEN note.payload
+        ELSE note.payload || '{{"message": null}}'::jsonb
+    END::text)
+    FROM msg, LATERAL (
+        SELECT jsonb_build_object(
+            'type', 'chat', 'trip_id', %(trip_id)s::text, 'day_id', %(day_id)s::text,
+            'thread_id', msg.thread_id, 'task_id', %(task_id)s::text,
+            'id', msg.id, 'sender_id', msg.sender_id, 'message', msg.message,
+            'message_type', msg.message_type, 'created_at', msg.created_at
+        ) AS payload
+    ) note
+"""
+
+MARK_READ_SQL = """
+    INSERT INTO chat_members (thread_id, user_id, unread_count, last_read_at)
+    VALUES (%s, %s, 0, now())
+    ON CONFLICT (thread_id, user_id)
+    DO UPDATE SET unread_count = 0, last_read_at = now()
+"""
+
+UNREAD_SQL = """
+    SELECT cm.thread_id, c.trip_id, c.task_id, cm.unread_count
+    FROM chat_members cm
+    JOIN chat_threads c ON c.id = cm.thread_id
+    WHERE cm.user_id = %s AND cm.unread_count > 0
+"""
+
+
+def _thread(conn, sql, trip_id, task_id=None):
+    cur = conn.cursor()
+    try:
+        for _ in range(2):
+            cur.execute(sql, {"id": new_id(), "trip_id": trip_id, "task_id": task_id})
+            thread = cur.fetchone()
+            if thread:
+                return thread
+    finally:
+        cur.close()
+    raise RuntimeError("Could not create chat thread")
+
+
+def trip_thread(conn, trip_id):
+    return _thread(conn, TRIP_THREAD_SQL, trip_id)
+
+
+def task_thread(conn, trip_id, task_id):
+    return _thread(conn, TASK_THREAD_SQL, trip_id, task_id)
+
+
+def thread_for_user(conn, thread_id, user_id):
+    """The thread with its task's day_id, if user_id is on its trip"""
+    cur = conn.cursor()
+    cur.execute(THREAD_FOR_USER_SQL, (thread_id, user_id, user_id))
+    thread = cur.fetchone()
+    cur.close()
+    return thread
+
+
+def messages_page(conn, thread_id, limit=PAGE_SIZE, before=None):
+    """
+    (messages newest first, has_more). `before` = (created_at, id) of the
+    oldest message already shown.
+    """
+    params = {"thread_id": thread_id, "limit": limit + 1}
+    keyset = ""
+    if before:
+        keyset = KEYSET_SQL
+        params["before_created_at"], params["before_id"] = before
+
+    cur = conn.cursor()
+    cur.execute(MESSAGES_PAGE_SQL.format(keyset=keyset), params)
+    rows = cur.fetchall()
+    cur.close()
+    return rows[:limit], len(rows) > limit
+
+
+def post_message(conn, thread, sender_id, message, message_type="text"):
+    """Store a message; subscribers hear about it when conn commits"""
+    cur = conn.cursor()
+    cur.execute(POST_MESSAGE_SQL, {
+        "id": new_id(),
+        "thread_id": thread["id"],
+        "trip_id": thread["trip_id"],
+        "task_id": thread["task_id"],
+        "day_id": thread.get("day_id"),
+        "sender_id": sender_id,
+        "message": message,
+        "message_type": message_type,
+    })
+    row = cur.fetchone()
+    cur.close()
+    row.pop("pg_notify", None)
+    return row
+
+
+def mark_read(conn, thread_id, user_id):
+    cur = conn.cursor()
+    cur.execute(MARK_READ_SQL, (thread_id, user_id))
+    cur.close()
+
+
+def unread_counts(conn, user_id):
+    cur = conn.cursor()
+    cur.execute(UNREAD_SQL, (user_id,))
+    rows = cur.fetchall()
+    cur.close()
+    return rows
@@ -0,0 +1,199 @@
+import datetime
+import math
+import time
+
+
+# ------------------ Day route optimizer ------------------
+#
+# Reorders the geo-tagged tasks of a single day so the group spends less
+# time travelling between them. Tasks without coordinates keep their slot.
+# The order is built with nearest-neighbour and then improved with 2-opt,
+# rejecting any move that makes the day run later against the tasks'
+# start_time / end_time windows than the order we started from.
+
+EARTH_RADIUS_KM = 6371
+
+
+def parse_hhmm(value):
+    """TIME or 'HH:MM' -> minutes since midnight, None if missing or malformed"""
+    if not value:
+        return None
+    if isinstance(value, datetime.time):
+        return value.hour * 60 + value.minute
+    try:
+        hours, minutes = str(value).split(":")[:2]
+        return int(hours) * 60 + int(minutes)
+    except (ValueError, TypeError):
+        return None
+
+
+def travel_matrix(points, speed_kmph):
+    """
+    Pairwise travel time in minutes between (lat, lng) points.
+    Uses haversine distance; radians/cosines are computed once per point
+    so a 200-point day is ~20k cheap evaluations.
+    """
+    n = len(points)
+    rad = [(math.radians(lat), math.radians(lng)) for lat, lng in points]
+    cos_lat = [math.cos(phi) for phi, _ in rad]
+    minutes_per_km = 60.0 / speed_kmph
+
+    matrix = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        phi1, lam1 = rad[i]
+        row = matrix[i]
+        for j in range(i + 1, n):
+            phi2, lam2 = rad[j]
+            a = (
+                math.sin((phi2 - phi1) / 2) ** 2
+                + cos_lat[i] * cos_lat[j] * math.sin((lam2 - lam1) / 2) ** 2
+            )
+            km = 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+            row[j] = matrix[j][i] = km * minutes_per_km
+    return matrix
+
+
+def route_travel(route, matrix):
+    return sum(matrix[route[k]][route[k + 1]] for k in range(len(route) - 1))
+
+
+def route_lateness(route, matrix, windows, dwell_minutes=0):
+    """
+    Total minutes by which visits start after their window closes.
+    windows[i] is (open, close) in minutes or None when the task has no time.
+    The clock starts at the first task's window and waits for windows to open.
+    """
+    clock = None
+    late = 0.0
+    prev = None
+    for node in route:
+        if prev is not None and clock is not None:
+            clock += dwell_minutes + matrix[prev][node]
+        window = windows[node]
+        if window is not None:
+            opens, closes = window
+            if clock is None or clock < opens:
+                clock = opens
+            elif clock > closes:
+                late += clock - closes
+        prev = node
+    return late
+
+
+def nearest_neighbour(matrix, start=0):
+    n = len(matrix)
+    route = [start]
+    remaining = set(range(n))
+    remaining.discard(start)
+    current = start
+    while remaining:
+        row = matrix[current]
+        current = min(remaining, key=row.__getitem__)
+        remaining.discard(current)
+        route.append(current)
+    return route
+
+
+def two_opt(route, matrix, windows, dwell_minutes=0, max_seconds=1.0):
+    """
+    First-improvement 2-opt on an open path with a fixed first node.
+    The distance delta of a reversal is O(1); the O(n) window check only
+    runs for moves that already shorten the route.
+    """
+    deadline = time.perf_counter() + max_seconds
+    best_late = route_lateness(route, matrix, windows, dwell_minutes)
+    n = len(route)
+    improved = True
+
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(1, n - 1):
+            a, b = route[i - 1], route[i]
+            ab = matrix[a][b]
+            for j in range(i + 1, n):
+                c = route[j]
+                if j + 1 < n:
+                    d = route[j + 1]
+                    delta = matrix[a][c] + matrix[b][d] - ab - matrix[c][d]
+                else:
+                    delta = matrix[a][c] - ab
+                if delta >= -1e-9:
+                    continue
+                candidate = route[:i] + route[i:j + 1][::-1] + route[j + 1:]
+                late = route_lateness(candidate, matrix, windows, dwell_minutes)
+                if late <= best_late + 1e-9:
+                    route = candidate
+                    best_late = late
+                    improved = True
+                    b = route[i]
+                    ab = matrix[a][b]
+            if time.perf_counter() >= deadline:
+                break
+    return route
+
+
+def optimize_day(tasks, speed_kmph, dwell_minutes=0, max_seconds=1.0):
+    """
+    tasks: day's tasks in their current order (rows with id, lat, lng,
+    start_time, end_time).
+
+    Returns a dict with the proposed task id order, travel minutes before
+    and after, and the minutes saved. The first geo-tagged task stays the
+    starting point of the day.
+    """
+    geo_slots = [
+        idx for idx, task in enumerate(tasks)
+        if task.get("lat") is not None and task.get("lng") is not None
+    ]
+    current_ids = [task["id"] for task in tasks]
+
+    if len(geo_slots) < 3:
+        return {
+            "order": current_ids,
+            "changed": False,
+            "current_travel_minutes": 0,
+            "proposed_travel_minutes": 0,
+            "minutes_saved": 0,
+        }
+
+    geo_tasks = [tasks[idx] for idx in geo_slots]
+    matrix = travel_matrix(
+        [(float(t["lat"]), float(t["lng"])) for t in geo_tasks],
+        speed_kmph
+    )
+
+    windows = []
+    for task in geo_tasks:
+        opens = parse_hhmm(task.get("start_time"))
+        closes = parse_hhmm(task.get("end_time"))
+        if opens is None:
+            windows.append(None)
+        else:
+            windows.append((opens, max(opens, closes if closes is not None else opens)))
+
+    current = list(range(len(geo_tasks)))
+    current_travel = route_travel(current, matrix)
+    current_late = route_lateness(current, matrix, windows, dwell_minutes)
+
+    seed = nearest_neighbour(matrix, start=0)
+    if route_lateness(seed, matrix, windows, dwell_minutes) > current_late:
+        seed = current
+
+    proposed = two_opt(seed, matrix, windows, dwell_minutes, max_seconds)
+    proposed_travel = route_travel(proposed, matrix)
+
+    if proposed_travel >= current_travel - 0.5:
+        proposed = current
+        proposed_travel = current_travel
+
+    order = list(current_ids)
+    for slot, node in zip(geo_slots, proposed):
+        order[slot] = geo_tasks[node]["id"]
+
+    return {
+        "order": order,
+        "changed": order != current_ids,
+        "current_travel_minutes": round(current_travel, 1),
+        "proposed_travel_minutes": round(proposed_travel, 1),
+        "minutes_saved": round(current_travel - proposed_travel, 1),
+    }
@@ -1,15 +1,58 @@
 import os
+import re
 import time
 import socket
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import threading
 from datetime import datetime
-from flask import g
+from flask import current_app, g, has_app_context, has_request_context, request, session
+import metrics
+from app_logging import get_logger
+from db_router import PRIMARY, REPLICA, ConnectionRouter, Endpoint
+from friend_graph import backfill_public_ids
+from ordering import backfill_order_keys
+from trip_list import backfill_trip_created_at
+
+# Settings are read lazily: importing this module must not touch the
+# environment, the network or global socket state. create_app() calls
+# configure(); scripts that never do fall back to the environment.
+_settings = {
+    "url": None,
+    "replica_urls": (),
+    "network_tuning": False,
+    "probe_interval": 30,
+    "max_replica_lag": 5,
+    "read_your_writes_seconds": 5,
+}
+_router = None
+_router_lock = threading.Lock()
+
+log = get_logger("db")
+
+# Connections slower than this are logged
+SLOW_CONNECT_MS = 200
+
+
+def configure(url=None, replica_urls=(), network_tuning=False, probe_interval=30,
+              max_replica_lag=5, read_your_writes_seconds=5):
+    """Set connection settings. Nothing connects until get_db()."""
+    global _router
+    _settings["url"] = url
+    _settings["replica_urls"] = tuple(replica_urls or ())
+    _settings["network_tuning"] = network_tuning
+    _settings["probe_interval"] = probe_interval
+    _settings["max_replica_lag"] = max_replica_lag
+    _settings["read_your_writes_seconds"] = read_your_writes_seconds
+    _router = None
+    if network_tuning:
+        apply_network_tuning()
+
+
+def get_database_url():
+    url = _settings["url"] or os.environ.get("DATABASE_URL")
+    if not url:
+        raise RuntimeError("DATABASE_URL environment variable not set")
+    return url
 
-DATABASE_URL = os.environ.get("DATABASE_URL")
-
-if not DATABASE_URL:
-    raise RuntimeError("DATABASE_URL environment variable not set")
 
 # Generate unpooled connection URL for fallback
 def get_unpooled_url(pooled_url):
@@ -18,200 +61,227 @@ def get_unpooled_url(pooled_url):
         return pooled_url.replace('-pooler.', '.')
     return pooled_url
 
-UNPOOLED_DATABASE_URL = get_unpooled_url(DATABASE_URL)
-USE_UNPOOLED = False  # Will be set based on connection speed test
 
-# Windows-specific network optimizations
-def optimize_for_windows():
-    """Apply Windows-specific socket and DNS optimizations"""
-    try:
-        # Aggressive IPv4-first DNS resolution to avoid slow IPv6 lookups on Windows
-        original_getaddrinfo = socket.getaddrinfo
-        def fast_ipv4_getaddrinfo(host, port, family=0, socktype=0, proto=0, flags=0):
-            # Force IPv4 first, with very short timeout for IPv6 fallback
-            try:
-                # Try IPv4 with AI_ADDRCONFIG to use only configured address families
-                return original_getaddrinfo(host, port, socket.AF_INET, socktype, proto, socket.AI_ADDRCONFIG)
-            except (socket.gaierror, OSError):
-                # Quick fallback to default resolution
-                return original_getaddrinfo(host, port, family, socktype, proto, flags)
-        
-        socket.getaddrinfo = fast_ipv4_getaddrinfo
-        
-        # Additional socket optimizations for Windows
-        if hasattr(socket, 'TCP_NODELAY'):
-            socket.TCP_NODELAY = 1
-        if hasattr(socket, 'SO_KEEPALIVE'):
-            socket.SO_KEEPALIVE = 1
-            
-        print(">>> Applied Windows IPv4-first DNS optimization")
-        
-    except Exception as e:
-        print(f">>> Network optimization warning: {e}")
-
-# Apply optimizations immediately
-optimize_for_windows()
-
-print(">>> Using PostgreSQL database with Windows network optimizations")
-if '-pooler.' in DATABASE_URL:
-    print(">>> Pooled connection available:", DATABASE_URL.split('@')[1].split('/')[0])
-    print(">>> Unpooled fallback available:", UNPOOLED_DATABASE_URL.split('@')[1].split('/')[0])
-else:
-    print(">>> Direct connection:", DATABASE_URL.split('@')[1].split('/')[0])
-
-# Add connection health check function
-def test_connection_speed():
-    """Test database connection speed and auto-switch to unpooled if needed"""
-    global USE_UNPOOLED
-    
-    try:
-        # Test pooled connection first with longer timeout for initial connection
-        print(">>> Testing pooled connection...")
-        start = time.time()
-        conn = psycopg2.connect(
-            DATABASE_URL,
-            cursor_factory=RealDictCursor,
-            connect_timeout=15  # Increased from 5 to 15 seconds
-        )
-        conn.close()
-        pooled_speed = (time.time() - start) * 1000
-        print(f">>> Pooled connection: {pooled_speed:.1f}ms")
-        
-        # If pooled is too slow and we have an unpooled option, test it
-        if pooled_speed > 800 and UNPOOLED_DATABASE_URL != DATABASE_URL:
-            print(">>> Testing unpooled connection...")
-            start = time.time()
+_original_getaddrinfo = socket.getaddrinfo
+
+
+# Opt-in (DB_NETWORK_TUNING=1): helps Windows dev machines with slow IPv6 DNS
+def apply_network_tuning():
+    """Resolve hosts IPv4-first to avoid slow IPv6 lookups"""
+    if getattr(socket.getaddrinfo, "_ipv4_first", False):
+        return
+
+    def fast_ipv4_getaddrinfo(host, port, family=0, socktype=0, proto=0, flags=0):
+        try:
+            # Try IPv4 with AI_ADDRCONFIG to use only configured address families
+            return _original_getaddrinfo(host, port, socket.AF_INET, socktype, proto, socket.AI_ADDRCONFIG)
+        except (socket.gaierror, OSError):
+            # Quick fallback to default resolution
+            return _original_getaddrinfo(host, port, family, socktype, proto, flags)
+
+    fast_ipv4_getaddrinfo._ipv4_first = True
+    socket.getaddrinfo = fast_ipv4_getaddrinfo
+    log.info("network_tuning_applied", mode="ipv4_first")
+
+
+def remove_network_tuning():
+    socket.getaddrinfo = _original_getaddrinfo
+
+
+def get_router():
+    """
+    Per-process endpoint router: pooled + direct hostnames of the primary
+    and any read replicas. Probing starts on first use, i.e. after a
+    gunicorn fork, never at import.
+    """
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                database_url = get_database_url()
+                direct_url = get_unpooled_url(database_url)
+                endpoints = [Endpoint("direct", direct_url, PRIMARY)]
+                if direct_url != database_url:
+                    endpoints.insert(0, Endpoint("pooled", database_url, PRIMARY))
+                for i, replica_url in enumerate(_settings["replica_urls"], 1):
+                    endpoints.append(Endpoint(f"replica-{i}", replica_url, REPLICA))
+                router = ConnectionRouter(
+                    endpoints, max_replica_lag=_settings["max_replica_lag"]
+                )
+                router.start_probes(_settings["probe_interval"])
+                _router = router
+    return _router
+
+
+def get_active_database_url():
+    """URL of the endpoint the router currently prefers for the primary"""
+    return get_router().choose(PRIMARY).url
+
+
+def get_direct_database_url():
+    """Direct (non-pooler) URL, for LISTEN and other session state"""
+    return get_unpooled_url(get_database_url())
+
+
+# psycopg2 is imported on first connect, not at import time: booting a
+# worker (benchmarks/startup.py) should not pay for the driver
+_profiling_cursor = None
+
+
+def profiling_cursor():
+    """Cursor class that adds each query's time to the request's query profile"""
+    global _profiling_cursor
+    if _profiling_cursor is None:
+        from psycopg2.extras import RealDictCursor
+
+        class ProfilingCursor(RealDictCursor):
+            def execute(self, query, vars=None):
+                profile = g.get("query_profile") if has_app_context() else None
+                if profile is None:
+                    return super().execute(query, vars)
+                start = time.perf_counter()
+                try:
+                    return super().execute(query, vars)
+                finally:
+                    profile.record(query, (time.perf_counter() - start) * 1000, self.rowcount)
+
+        _profiling_cursor = ProfilingCursor
+    return _profiling_cursor
+
+
+def connect(role=PRIMARY, application_name="tripplanner_flask", max_retries=2):
+    """
+    Open a connection on the fastest healthy endpoint for role. Each
+    attempt feeds the router; a failed endpoint is skipped on retry.
+    """
+    import psycopg2
+
+    router = get_router()
+    failed = set()
+    retry_count = 0
+
+    while True:
+        endpoint = router.choose(role, exclude=failed)
+        start_time = time.time()
+        try:
             conn = psycopg2.connect(
-                UNPOOLED_DATABASE_URL,
-                cursor_factory=RealDictCursor,
-                connect_timeout=15  # Increased from 5 to 15 seconds
+                endpoint.url,
+                cursor_factory=profiling_cursor(),
+                # Realistic timeout for current network conditions
+                connect_timeout=5,
+                application_name=f"{application_name}_r{retry_count}",
+                # Simplified keepalive settings
+                keepalives=1,
             )
-            conn.close()
-            unpooled_speed = (time.time() - start) * 1000
-            print(f">>> Unpooled connection: {unpooled_speed:.1f}ms")
-            
-            # Auto-switch if unpooled is significantly faster
-            improvement = (pooled_speed - unpooled_speed) / pooled_speed * 100
-            if unpooled_speed < pooled_speed * 0.90:  # 10% improvement threshold
-                USE_UNPOOLED = True
-                print(f">>> 🚀 AUTO-SWITCHING to unpooled connection ({improvement:.1f}% faster: {unpooled_speed:.1f}ms vs {pooled_speed:.1f}ms)")
-                return unpooled_speed
-            else:
-                print(f">>> Staying with pooled connection (unpooled only {improvement:.1f}% faster)")
-        
-        if pooled_speed > 1000:
-            print(f">>> ⚠️  Connection: {pooled_speed:.1f}ms - Very slow, consider network optimization")
-        elif pooled_speed > 500:
-            print(f">>> 🔶 Connection: {pooled_speed:.1f}ms - Moderate latency detected")
-        else:
-            print(f">>> ✅ Connection: {pooled_speed:.1f}ms - Good performance")
-            
-        return pooled_speed
-        
-    except psycopg2.OperationalError as e:
-        if "timeout expired" in str(e):
-            print(f">>> ❌ Database connection timeout: Network connectivity issues detected")
-            print(f">>> 💡 Try: Check internet connection, VPN, or firewall settings")
-        else:
-            print(f">>> ❌ Database connection failed: {e}")
-        print(f">>> 🔄 Attempting to continue without speed test...")
-        return None
-    except Exception as e:
-        print(f">>> ❌ Connection test failed: {e}")
-        return None
+        except (psycopg2.OperationalError, psycopg2.DatabaseError) as e:
+            connection_time = (time.time() - start_time) * 1000
+            router.record_failure(endpoint.name, e)
+            failed.add(endpoint.name)
+            retry_count += 1
+
+            if retry_count > max_retries:
+                metrics.db_connect_failures.inc(endpoint=endpoint.name)
+                log.error("db_connect_failed", endpoint=endpoint.name,
+                          retries=max_retries, error=str(e)[:200])
+                raise  # Re-raise the last exception
+            metrics.db_connect_retries.inc(endpoint=endpoint.name)
+            log.warning("db_connect_retry", endpoint=endpoint.name, attempt=retry_count,
+                        max_retries=max_retries, ms=round(connection_time, 1),
+                        error=str(e)[:200])
+            time.sleep(0.1 * retry_count)  # Brief exponential backoff
+            continue
+
+        conn.autocommit = True  # Enable autocommit for better performance
+        connection_time = (time.time() - start_time) * 1000
+        router.record(endpoint.name, connection_time)
+        metrics.db_connect_seconds.observe(connection_time / 1000, endpoint=endpoint.name)
+
+        profile = g.get("query_profile") if has_app_context() else None
+        if profile is not None:
+            profile.connect_ms += connection_time
+        if connection_time > SLOW_CONNECT_MS:
+            log.warning("db_connect_slow", endpoint=endpoint.name,
+                        ms=round(connection_time, 1), retries=retry_count)
+        return conn
+
+
+# ------------------ Read-only routing ------------------
+#
+# Views decorated with @read_only get their request connection from a
+# replica (when one is configured, healthy and caught up). A user who
+# wrote something in the last read_your_writes_seconds stays on the
+# primary so they always see their own change. The write time is kept in
+# the session cookie, so it holds across workers.
+
+def read_only(fn):
+    """Mark a view as read-only: its queries may be served by a replica"""
+    fn.db_read_only = True
+    return fn
+
+
+def mark_write():
+    """Pin this user's reads to the primary for a few seconds"""
+    session["db_wrote_at"] = time.time()
 
-def get_active_database_url():
-    """Get the currently active database URL (pooled or unpooled)"""
-    return UNPOOLED_DATABASE_URL if USE_UNPOOLED else DATABASE_URL
+
+def recently_wrote():
+    wrote_at = session.get("db_wrote_at")
+    return bool(wrote_at) and time.time() - wrote_at < _settings["read_your_writes_seconds"]
+
+
+def request_role():
+    """REPLICA for read-only views unless the user just wrote, else PRIMARY"""
+    if not has_request_context() or request.endpoint is None:
+        return PRIMARY
+    view = current_app.view_functions.get(request.endpoint)
+    if getattr(view, "db_read_only", False) and not recently_wrote():
+        return REPLICA
+    return PRIMARY
 
 
 def get_db():
-    # Try to use g for connection reuse within request context
+    # Reuse one connection per request via g
     try:
         if "db_conn" not in g:
-            # Measure connection time with retry logic
-            max_retries = 2
-            retry_count = 0
-            
-            while retry_count <= max_retries:
-                start_time = time.time()
-                
-                try:
-                    # Use the optimal database URL (pooled or unpooled)
-                    active_url = get_active_database_url()
-                    connection_params = {
-                        'dsn': active_url,
-                        'cursor_factory': RealDictCursor,
-                        # Realistic timeout for current network conditions
-                        'connect_timeout': 5,
-                        'application_name': f'tripplanner_flask_r{retry_count}',
-                        # Simplified keepalive settings
-                        'keepalives': 1,
-                    }
-                    
-                    g.db_conn = psycopg2.connect(**connection_params)
-                    g.db_conn.autocommit = True  # Enable autocommit for better performance
-                    
-                    connection_time = (time.time() - start_time) * 1000
-                    
-                    # Enhanced logging with retry info
-                    retry_suffix = f" (retry {retry_count})" if retry_count > 0 else ""
-                    conn_type = "unpooled" if USE_UNPOOLED else "pooled"
-                    if connection_time > 1000:  # Very slow (>1 second)
-                        print(f">>> 🐌 VERY SLOW DB CONNECTION: {connection_time:.1f}ms{retry_suffix} ({conn_type}) - Network issue!")
-                    elif connection_time > 200:  # Slow  
-                        print(f">>> 🔶 SLOW DB CONNECTION: {connection_time:.1f}ms{retry_suffix} ({conn_type}) - High latency")
-                    elif connection_time > 50:   # Moderate
-                        print(f">>> 🔸 DB connection: {connection_time:.1f}ms{retry_suffix} ({conn_type})")
-                    else:
-                        print(f">>> ✅ Fast DB connection: {connection_time:.1f}ms{retry_suffix} ({conn_type})")
-                    
-                    break  # Success, exit retry loop
-                    
-                except (psycopg2.OperationalError, psycopg2.DatabaseError) as e:
-                    retry_count += 1
-                    connection_time = (time.time() - start_time) * 1000
-                    
-                    if retry_count > max_retries:
-                        print(f">>> ❌ DB CONNECTION FAILED after {max_retries} retries: {e}")
-                        raise  # Re-raise the last exception
-                    else:
-                        print(f">>> 🔄 DB connection retry {retry_count}/{max_retries} (failed in {connection_time:.1f}ms): {str(e)[:100]}...")
-                        time.sleep(0.1 * retry_count)  # Brief exponential backoff
-                
+            g.db_conn = connect(request_role())
         return g.db_conn
-        
+
     except RuntimeError:
-        # Outside application context (e.g., init_db)
-        start_time = time.time()
-        active_url = get_active_database_url()
-        conn = psycopg2.connect(
-            active_url,
-            cursor_factory=RealDictCursor,
-            connect_timeout=5,
-            keepalives=1,
-        )
-        conn.autocommit = True
-        
-        connection_time = (time.time() - start_time) * 1000
-        conn_type = "unpooled" if USE_UNPOOLED else "pooled"
-        if connection_time > 1000:
-            print(f">>> 🐌 Init DB connection (very slow): {connection_time:.1f}ms ({conn_type})")
-        elif connection_time > 200:
-            print(f">>> 🔶 Init DB connection (slow): {connection_time:.1f}ms ({conn_type})")
-        else:
-            print(f">>> Init DB connection: {connection_time:.1f}ms ({conn_type})")
-        return conn
+        # Outside application context (e.g., init_db, background threads)
+        return connect(application_name="tripplanner_script")
+
+
+# trip_members.trip_created_at follows its trip on every insert (trip_list.py)
+TRIP_CREATED_AT_TRIGGER_SQL = """
+    CREATE OR REPLACE FUNCTION trip_members_trip_created_at() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        -- Kept as given when the trip isn't there yet (a bulk load)
+        NEW.trip_created_at := COALESCE(
+            (SELECT created_at FROM trips WHERE id = NEW.trip_id), NEW.trip_created_at
+        );
+        RETURN NEW;
+    END $$;
+
+    DROP TRIGGER IF EXISTS trip_members_trip_created_at ON trip_members;
+    CREATE TRIGGER trip_members_trip_created_at
+    BEFORE INSERT OR UPDATE OF trip_id ON trip_members
+    FOR EACH ROW EXECUTE FUNCTION trip_members_trip_created_at()
+"""
 
 
 def init_db():
+    """Create/upgrade the schema. Idempotent; run with `flask migrate`."""
     conn = get_db()
     cur = conn.cursor()
 
+    # New ids made inside the database (ids.py makes the app's)
+    cur.execute(UUID_V7_FUNCTION_SQL)
+
     # ---------------- USERS ----------------
     cur.execute("""
         CREATE TABLE IF NOT EXISTS users (
-            id TEXT PRIMARY KEY,
+            id UUID PRIMARY KEY,
             name TEXT UNIQUE,
             password TEXT,
             email TEXT UNIQUE,
@@ -221,8 +291,8 @@ def init_db():
 
     cur.execute("""
         CREATE TABLE IF NOT EXISTS friends (
-            user_id TEXT,
-            friend_id TEXT,
+            user_id UUID,
+            friend_id UUID,
             created_at TIMESTAMP,
             PRIMARY KEY (user_id, friend_id)
         )
@@ -230,9 +300,9 @@ def init_db():
 
     cur.execute("""
         CREATE TABLE IF NOT EXISTS friend_requests (
-            id TEXT PRIMARY KEY,
-            sender_id TEXT,
-            receiver_id TEXT,
+            id UUID PRIMARY KEY,
+            sender_id UUID,
+            receiver_id UUID,
             message TEXT,
             status TEXT DEFAULT 'pending',
             created_at TIMESTAMP,
@@ -240,34 +310,86 @@ def init_db():
         )
     """)
 
+    # Shareable "TP-XXXXXX" id (friend_graph.py)
+    cur.execute("""
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS public_id TEXT
+    """)
+
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_users_public_id
+        ON users (public_id)
+    """)
+
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_friend_requests_receiver_pending
+        ON friend_requests (receiver_id, created_at)
+        WHERE status = 'pending'
+    """)
+
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_friend_requests_sender_pending
+        ON friend_requests (sender_id, created_at)
+        WHERE status = 'pending'
+    """)
+
+    # At most one pending request per direction; close older duplicates
+    # left by the old check-then-insert code before indexing
+    cur.execute("""
+        UPDATE friend_requests a
+        SET status = 'superseded'
+        FROM friend_requests b
+        WHERE a.status = 'pending' AND b.status = 'pending'
+        AND a.sender_id = b.sender_id AND a.receiver_id = b.receiver_id
+        AND (COALESCE(a.created_at, '-infinity'), a.id)
+            < (COALESCE(b.created_at, '-infinity'), b.id)
+    """)
+
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_friend_requests_one_pending
+        ON friend_requests (sender_id, receiver_id)
+        WHERE status = 'pending'
+    """)
+
     # ---------------- TRIPS ----------------
     cur.execute("""
         CREATE TABLE IF NOT EXISTS trips (
-            id TEXT PRIMARY KEY,
+            id UUID PRIMARY KEY,
             name TEXT,
             start_date DATE,
             end_date DATE,
-            owner_id TEXT,
+            owner_id UUID,
             created_at TIMESTAMP
         )
     """)
 
     cur.execute("""
         CREATE TABLE IF NOT EXISTS trip_members (
-            trip_id TEXT,
-            user_id TEXT,
+            trip_id UUID,
+            user_id UUID,
             role TEXT,
-            joined_at TEXT,
-            left_at TEXT,
+            joined_at TIMESTAMPTZ,
+            left_at TIMESTAMPTZ,
             PRIMARY KEY (trip_id, user_id)
         )
     """)
 
+    # The trip's created_at, so joined trips can be paged in index order
+    # (trip_list.py); filled in by trip_members_trip_created_at below
+    cur.execute("""
+        ALTER TABLE trip_members ADD COLUMN IF NOT EXISTS trip_created_at TIMESTAMP
+    """)
+
+    # Keyset pages of a user's trips (trip_list.py): owned trips in order
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_trips_owner_created
+        ON trips (owner_id, created_at DESC, id DESC)
+    """)
+
     # ---------------- DAYS ----------------
     cur.execute("""
         CREATE TABLE IF NOT EXISTS days (
-            id TEXT PRIMARY KEY,
-            trip_id TEXT,
+            id UUID PRIMARY KEY,
+            trip_id UUID,
             date DATE
         )
     """)
@@ -275,25 +397,39 @@ def init_db():
     # ---------------- TASKS ----------------
     cur.execute("""
         CREATE TABLE IF NOT EXISTS tasks (
-            id TEXT PRIMARY KEY,
-            trip_id TEXT,
-            day_id TEXT,
+            id UUID PRIMARY KEY,
+            trip_id UUID,
+            day_id UUID,
             title TEXT,
             description TEXT,
-            start_time TEXT,
-            end_time TEXT,
+            start_time TIME,
+            end_time TIME,
             lat REAL,
             lng REAL,
             order_index REAL,
+            order_key TEXT COLLATE "C",
             created_at TIMESTAMP,
             is_deleted BOOLEAN DEFAULT FALSE
         )
     """)
 
+    cur.execute("""
+        ALTER TABLE tasks ADD COLUMN IF NOT EXISTS order_key TEXT COLLATE "C"
+    """)
+
+    cur.execute("""
+        ALTER TABLE tasks ADD COLUMN IF NOT EXISTS is_deleted BOOLEAN DEFAULT FALSE
+    """)
+
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_tasks_day_order_key
+        ON tasks (day_id, order_key)
+    """)
+
     cur.execute("""
         CREATE TABLE IF NOT EXISTS task_assignments (
-            task_id TEXT,
-            user_id TEXT,
+            task_id UUID,
+            user_id UUID,
             required BOOLEAN,
             PRIMARY KEY (task_id, user_id)
         )
@@ -301,11 +437,60 @@ def init_db():
 
     cur.execute("""
         CREATE TABLE IF NOT EXISTS task_status_events (
-            id TEXT PRIMARY KEY,
-            task_id TEXT,
-            user_id TEXT,
+            id UUID PRIMARY KEY,
+            task_id UUID,
+            user_id UUID,
             status TEXT,
-            responded_at TIMESTAMP
+            responded_at TIMESTAMP,
+            seq BIGSERIAL,
+            is_summary BOOLEAN DEFAULT FALSE,
+            collapsed_count INTEGER
+        )
+    """)
+
+    cur.execute("ALTER TABLE task_status_events ADD COLUMN IF NOT EXISTS seq BIGSERIAL")
+    cur.execute("ALTER TABLE task_status_events ADD COLUMN IF NOT EXISTS is_summary BOOLEAN DEFAULT FALSE")
+    cur.execute("ALTER TABLE task_status_events ADD COLUMN IF NOT EXISTS collapsed_count INTEGER")
+
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_task_status_events_task_user_seq
+        ON task_status_events (task_id, user_id, seq)
+    """)
+
+    # Compacted state: latest event per (task, user)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS task_status_current (
+            task_id UUID,
+            user_id UUID,
+            status TEXT,
+            responded_at TIMESTAMP,
+            seq BIGINT,
+            PRIMARY KEY (task_id, user_id)
+        )
+    """)
+
+    cur.execute("""
+        INSERT INTO task_status_current (task_id, user_id, status, responded_at, seq)
+        SELECT DISTINCT ON (e.task_id, e.user_id)
+            e.task_id, e.user_id, e.status, e.responded_at, e.seq
+        FROM task_status_events e
+        WHERE e.status <> 'RESET'
+        AND e.seq > COALESCE((
+            SELECT MAX(r.seq) FROM task_status_events r
+            WHERE r.task_id = e.task_id AND r.user_id = e.user_id
+            AND r.status = 'RESET'
+        ), 0)
+        ORDER BY e.task_id, e.user_id, e.seq DESC
+        ON CONFLICT (task_id, user_id) DO NOTHING
+    """)
+
+    # ---------------- CACHE VERSIONS ----------------
+    # Bumped by writes; key rendered fragments and page ETags
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS cache_versions (
+            scope TEXT PRIMARY KEY,
+            version BIGINT NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
         )
     """)
 
@@ -321,21 +506,21 @@ def init_db():
 
     cur.execute("""
         CREATE TABLE IF NOT EXISTS transport_groups (
-            id TEXT PRIMARY KEY,
-            trip_id TEXT,
-            day_id TEXT,
-            task_id TEXT,
+            id UUID PRIMARY KEY,
+            trip_id UUID,
+            day_id UUID,
+            task_id UUID,
             mode_id TEXT,
             label TEXT,
-            leader_id TEXT,
+            leader_id UUID,
             created_at TIMESTAMP
         )
     """)
 
     cur.execute("""
         CREATE TABLE IF NOT EXISTS transport_group_members (
-            transport_group_id TEXT,
-            user_id TEXT,
+            transport_group_id UUID,
+            user_id UUID,
             effective_mode_id TEXT,
             PRIMARY KEY (transport_group_id, user_id)
         )
@@ -343,9 +528,9 @@ def init_db():
 
     cur.execute("""
         CREATE TABLE IF NOT EXISTS eta_snapshots (
-            id TEXT PRIMARY KEY,
-            task_id TEXT,
-            user_id TEXT,
+            id UUID PRIMARY KEY,
+            task_id UUID,
+            user_id UUID,
             eta_minutes INTEGER,
             created_at TIMESTAMP
         )
@@ -354,9 +539,9 @@ def init_db():
     # ---------------- LOCATION ----------------
     cur.execute("""
         CREATE TABLE IF NOT EXISTS location_updates (
-            id TEXT PRIMARY KEY,
-            user_id TEXT,
-            transport_group_id TEXT,
+            id UUID PRIMARY KEY,
+            user_id UUID,
+            transport_group_id UUID,
             lat REAL,
             lng REAL,
             recorded_at TIMESTAMP
@@ -366,43 +551,437 @@ def init_db():
     # ---------------- NOTES ----------------
     cur.execute("""
         CREATE TABLE IF NOT EXISTS task_notes (
-            id TEXT PRIMARY KEY,
-            task_id TEXT,
+            id UUID PRIMARY KEY,
+            task_id UUID,
             current_text TEXT,
-            updated_at TEXT
+            updated_at TIMESTAMPTZ
         )
     """)
 
     cur.execute("""
         CREATE TABLE IF NOT EXISTS task_note_history (
-            id TEXT PRIMARY KEY,
-            note_id TEXT,
+            id UUID PRIMARY KEY,
+            note_id UUID,
             text TEXT,
-            edited_by TEXT,
+            edited_by UUID,
             edited_at TIMESTAMP
         )
     """)
 
+    # Revisioned history: full text every few revisions, deltas between
+    # (task_notes.py)
+    cur.execute("""
+        ALTER TABLE task_notes ADD COLUMN IF NOT EXISTS revision INTEGER NOT NULL DEFAULT 0
+    """)
+
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_task_notes_task
+        ON task_notes (task_id)
+    """)
+
+    cur.execute("""
+        ALTER TABLE task_note_history
+        ADD COLUMN IF NOT EXISTS revision INTEGER,
+        ADD COLUMN IF NOT EXISTS delta TEXT
+    """)
+
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_task_note_history_revision
+        ON task_note_history (note_id, revision)
+    """)
+
     # ---------------- CHAT ----------------
     cur.execute("""
         CREATE TABLE IF NOT EXISTS chat_threads (
-            id TEXT PRIMARY KEY,
-            trip_id TEXT,
-            task_id TEXT,
+            id UUID PRIMARY KEY,
+            trip_id UUID,
+            task_id UUID,
             created_at TIMESTAMP
         )
     """)
 
     cur.execute("""
         CREATE TABLE IF NOT EXISTS chat_messages (
-            id TEXT PRIMARY KEY,
-            thread_id TEXT,
-            sender_id TEXT,
+            id UUID PRIMARY KEY,
+            thread_id UUID,
+            sender_id UUID,
             message TEXT,
             message_type TEXT,
             created_at TIMESTAMP
         )
     """)
 
+    # One thread per trip and per task; messages paged newest first
+    # (chat.py)
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_chat_threads_trip
+        ON chat_threads (trip_id) WHERE task_id IS NULL
+    """)
+
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_chat_threads_task
+        ON chat_threads (task_id) WHERE task_id IS NOT NULL
+    """)
+
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_chat_messages_thread_created
+        ON chat_messages (thread_id, created_at DESC, id DESC)
+    """)
+
+    # Per-member unread counters, bumped by each new message
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS chat_members (
+            thread_id UUID,
+            user_id UUID,
+            unread_count INTEGER NOT NULL DEFAULT 0,
+            last_read_at TIMESTAMP,
+            PRIMARY KEY (thread_id, user_id)
+        )
+    """)
+
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_chat_members_user_unread
+        ON chat_members (user_id) WHERE unread_count > 0
+    """)
+
+    # ---------------- TYPED TIMES AND KEYS ----------------
+    migrate_time_columns(conn)
+    migrate_uuid_keys(conn)
+
+    # Backfills run on the final column types
+    backfill_public_ids(conn)
+    backfill_order_keys(conn)
+
+    # ...and the trips they joined without owning, in the same order.
+    # The trigger copies created_at on every insert, COPY included.
+    cur.execute(TRIP_CREATED_AT_TRIGGER_SQL)
+    backfill_trip_created_at(conn)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_trip_members_user_trip_created
+        ON trip_members (user_id, trip_created_at DESC, trip_id DESC)
+        WHERE role IS DISTINCT FROM 'owner'
+    """)
+    cur.execute("DROP INDEX IF EXISTS idx_trip_members_user_joined")
+
+    # Per-trip time-of-day buckets (analytics) read start times from here
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_tasks_trip_start_time
+        ON tasks (trip_id, start_time)
+        WHERE is_deleted = false
+    """)
+
     conn.commit()
     conn.close()
+
+
+# ---------------- online column type changes ----------------
+#
+# ALTER COLUMN ... TYPE rewrites the whole table under an exclusive lock.
+# Instead, each table's text columns are moved to their real type as:
+#
+#   1. typed shadow columns (<column>_typed), kept in step with every
+#      write by a trigger;
+#   2. existing rows converted a primary key range at a time;
+#   3. every index over the old columns built again over the shadows,
+#      CONCURRENTLY, and primary key shadows proven NOT NULL by a
+#      validated CHECK, so the swap needn't scan the table;
+#   4. one short transaction, for all the tables together so joins
+#      never see both types, that drops the old columns and renames
+#      the shadows and their indexes into place.
+#
+# Each step checks what is already there, so a run that stopped part way
+# (say, on the swap's lock timeout) just carries on the next time.
+
+RETYPE_BATCH_SIZE = 5000
+
+# Text that doesn't convert: NULL for times, and for ids a uuid derived
+# from the text, so references to it still line up (ids.as_uuid)
+CONVERT_FALLBACK = {
+    "time": "NULL",
+    "timestamptz": "NULL",
+    "uuid": "md5(value)::uuid",
+}
+
+TEXT_TO_TYPE_FUNCTION_SQL = """
+    CREATE OR REPLACE FUNCTION text_to_{type}(value TEXT) RETURNS {type}
+    LANGUAGE plpgsql STABLE AS $$
+    BEGIN
+        RETURN NULLIF(btrim(value), '')::{type};
+    EXCEPTION WHEN others THEN
+        RETURN {fallback};
+    END $$
+"""
+
+SHADOW_TRIGGER_SQL = """
+    CREATE OR REPLACE FUNCTION {table}_retype() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        {assignments}
+        RETURN NEW;
+    END $$;
+
+    DROP TRIGGER IF EXISTS {table}_retype ON {table};
+    CREATE TRIGGER {table}_retype
+    BEFORE INSERT OR UPDATE OF {columns} ON {table}
+    FOR EACH ROW EXECUTE FUNCTION {table}_retype()
+"""
+
+# Batches are primary key ranges: the database finds where each one
+# ends, so they follow its collation, and the update walks the index
+BATCH_END_SQL = """
+    SELECT {key} FROM {table}
+    WHERE true {lower}
+    ORDER BY {key}
+    OFFSET %s LIMIT 1
+"""
+
+BACKFILL_RANGE_SQL = """
+    UPDATE {table}
+    SET {assignments}
+    WHERE true {lower} {upper}
+"""
+
+TABLE_INDEXES_SQL = """
+    SELECT c.relname AS name, pg_get_indexdef(i.indexrelid) AS definition,
+        i.indisprimary AS is_primary, i.indisvalid AS is_valid
+    FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indexrelid
+    WHERE i.indrelid = %s::regclass
+"""
+
+# Sent as one statement list, which Postgres runs as a single transaction.
+# Rather than queue every query behind a long-running one for the locks,
+# give up; the next run picks up from here.
+SWAP_SQL = """
+    SET LOCAL lock_timeout = '5s';
+    LOCK TABLE {tables} IN ACCESS EXCLUSIVE MODE;
+    {statements}
+"""
+
+SWAP_TABLE_SQL = """
+    DROP TRIGGER IF EXISTS {table}_retype ON {table};
+    DROP FUNCTION IF EXISTS {table}_retype();
+    ALTER TABLE {table} {drops};
+    {renames}
+"""
+
+
+def column_type(conn, table, column):
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s
+    """, (table, column))
+    row = cur.fetchone()
+    cur.close()
+    return row["data_type"] if row else None
+
+
+def _key_range(key, side, op):
+    """SQL and placeholders for (key) <op> (values), or nothing for an open end"""
+    if side is None:
+        return "", ()
+    return f"AND ({', '.join(key)}) {op} ({', '.join(['%s'] * len(key))})", tuple(side)
+
+
+def _shadow_index_sql(definition, name, columns):
+    """CREATE INDEX for the same index over the shadow columns"""
+    head, using, body = definition.partition(" USING ")
+    for column in columns:
+        body = re.sub(rf"\b{column}\b", f"{column}_typed", body)
+    head = head.replace(f" INDEX {name} ON ", f" INDEX CONCURRENTLY IF NOT EXISTS {name}_typed ON ", 1)
+    return head + using + body
+
+
+def prepare_retype(conn, table, columns, key, batch_size=RETYPE_BATCH_SIZE):
+    """
+    Steps 1-3 for text columns ({column: type}) of table; key is its
+    primary key as it stands. Returns the table's part of the swap.
+    """
+    cur = conn.cursor()
+    for type_ in set(columns.values()):
+        cur.execute(TEXT_TO_TYPE_FUNCTION_SQL.format(type=type_, fallback=CONVERT_FALLBACK[type_]))
+    cur.execute(f"ALTER TABLE {table} " + ", ".join(
+        f"ADD COLUMN IF NOT EXISTS {column}_typed {type_}" for column, type_ in columns.items()
+    ))
+    cur.execute(SHADOW_TRIGGER_SQL.format(
+        table=table,
+        columns=", ".join(columns),
+        assignments="\n        ".join(
+            f"NEW.{column}_typed := text_to_{type_}(NEW.{column});"
+            for column, type_ in columns.items()
+        ),
+    ))
+
+    # 2. existing rows
+    assignments = ", ".join(
+        f"{column}_typed = text_to_{type_}({column})" for column, type_ in columns.items()
+    )
+    start, rows = None, 0
+    while True:
+        lower, lower_params = _key_range(key, start, ">")
+        cur.execute(BATCH_END_SQL.format(table=table, key=", ".join(key), lower=lower),
+                    (*lower_params, batch_size - 1))
+        row = cur.fetchone()
+        end = [row[k] for k in key] if row else None
+        upper, upper_params = _key_range(key, end, "<=")
+        cur.execute(BACKFILL_RANGE_SQL.format(table=table, assignments=assignments,
+                                              lower=lower, upper=upper),
+                    (*lower_params, *upper_params))
+        rows += cur.rowcount
+        if end is None:
+            break
+        start = end
+
+    # 3. indexes over the shadows, and NOT NULL primary key shadows
+    cur.execute(TABLE_INDEXES_SQL, (table,))
+    indexes = [
+        index for index in cur.fetchall()
+        if not index["name"].endswith("_typed")
+        and any(re.search(rf"\b{column}\b", index["definition"].partition(" USING ")[2])
+                for column in columns)
+    ]
+    cur.execute(TABLE_INDEXES_SQL, (table,))
+    built = {index["name"]: index["is_valid"] for index in cur.fetchall()}
+    for index in indexes:
+        shadow = f"{index['name']}_typed"
+        if built.get(shadow) is False:
+            # Left invalid by an interrupted build
+            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {shadow}")
+        cur.execute(_shadow_index_sql(index["definition"], index["name"], columns))
+
+    primary = next((index for index in indexes if index["is_primary"]), None)
+    not_null = [column for column in columns if primary and column in key]
+    for column in not_null:
+        cur.execute(f"""
+            ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {column}_typed_not_null,
+            ADD CONSTRAINT {column}_typed_not_null CHECK ({column}_typed IS NOT NULL) NOT VALID
+        """)
+        cur.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {column}_typed_not_null")
+
+    cur.execute(f"""
+        SELECT {", ".join(
+            f"COUNT(*) FILTER (WHERE {column}_typed IS NULL AND NULLIF(btrim({column}), '') IS NOT NULL)"
+            f" AS {column}" for column in columns
+        )}
+        FROM {table}
+    """)
+    unconverted = {column: count for column, count in cur.fetchone().items() if count}
+
+    log.info("columns_prepared", table=table, columns=columns, rows=rows,
+             indexes=len(indexes), unconverted=unconverted)
+
+    # 4. this table's share of the swap
+    renames = [f"ALTER TABLE {table} RENAME COLUMN {column}_typed TO {column};" for column in columns]
+    renames += [f"ALTER INDEX {index['name']}_typed RENAME TO {index['name']};" for index in indexes]
+    if primary:
+        renames.append(f"ALTER TABLE {table} " + ", ".join(
+            [f"ALTER COLUMN {column} SET NOT NULL" for column in not_null]
+            + [f"ADD CONSTRAINT {primary['name']} PRIMARY KEY USING INDEX {primary['name']}"]
+            + [f"DROP CONSTRAINT {column}_typed_not_null" for column in not_null]
+        ) + ";")
+    cur.close()
+    return SWAP_TABLE_SQL.format(
+        table=table,
+        drops=", ".join(f"DROP COLUMN {column}" for column in columns),
+        renames="\n    ".join(renames),
+    )
+
+
+def retype_tables(conn, specs, batch_size=RETYPE_BATCH_SIZE):
+    """
+    Move the columns of specs ([(table, key, {column: type})]) that are
+    still text to their types; returns the tables changed.
+    """
+    pending = []
+    for table, key, columns in specs:
+        todo = {
+            column: type_ for column, type_ in columns.items()
+            if column_type(conn, table, column) == "text"
+        }
+        if todo:
+            pending.append((table, key, todo))
+    if not pending:
+        return []
+
+    statements = [prepare_retype(conn, table, columns, key, batch_size)
+                  for table, key, columns in pending]
+    tables = [table for table, _, _ in pending]
+    cur = conn.cursor()
+    cur.execute(SWAP_SQL.format(tables=", ".join(tables), statements="".join(statements)))
+    cur.close()
+    log.info("columns_retyped", tables=tables)
+    return tables
+
+
+# ---------------- TEXT -> TIME / TIMESTAMPTZ ----------------
+#
+# Older databases stored these as text ("09:30", datetime.isoformat()).
+# Naive timestamps are read in the database session's time zone.
+
+# (table, primary key, {column: type})
+TIME_COLUMNS = [
+    ("tasks", ("id",), {"start_time": "time", "end_time": "time"}),
+    ("trip_members", ("trip_id", "user_id"), {"joined_at": "timestamptz", "left_at": "timestamptz"}),
+    ("task_notes", ("id",), {"updated_at": "timestamptz"}),
+]
+
+
+def migrate_time_columns(conn, batch_size=RETYPE_BATCH_SIZE):
+    return retype_tables(conn, TIME_COLUMNS, batch_size)
+
+
+# ---------------- TEXT -> UUID keys ----------------
+#
+# Ids were str(uuid4()) in TEXT columns: 36-byte keys, compared as text
+# in every join. As uuid they are 16 bytes and compare as integers. The
+# app keeps handling ids as strings (psycopg2 returns uuid as text; the
+# async pool is told to, in db_async.py), and new ids are UUIDv7
+# (ids.py). transport_modes ids ("walk", ...) and mode_id columns stay
+# text; they are names, not uuids.
+
+# (table, primary key, {column: "uuid"})
+UUID_COLUMNS = [
+    (table, key, {column: "uuid" for column in columns})
+    for table, key, columns in [
+        ("users", ("id",), ("id",)),
+        ("friends", ("user_id", "friend_id"), ("user_id", "friend_id")),
+        ("friend_requests", ("id",), ("id", "sender_id", "receiver_id")),
+        ("trips", ("id",), ("id", "owner_id")),
+        ("trip_members", ("trip_id", "user_id"), ("trip_id", "user_id")),
+        ("days", ("id",), ("id", "trip_id")),
+        ("tasks", ("id",), ("id", "trip_id", "day_id")),
+        ("task_assignments", ("task_id", "user_id"), ("task_id", "user_id")),
+        ("task_status_events", ("id",), ("id", "task_id", "user_id")),
+        ("task_status_current", ("task_id", "user_id"), ("task_id", "user_id")),
+        ("transport_groups", ("id",), ("id", "trip_id", "day_id", "task_id", "leader_id")),
+        ("transport_group_members", ("transport_group_id", "user_id"),
+         ("transport_group_id", "user_id")),
+        ("eta_snapshots", ("id",), ("id", "task_id", "user_id")),
+        ("location_updates", ("id",), ("id", "user_id", "transport_group_id")),
+        ("task_notes", ("id",), ("id", "task_id")),
+        ("task_note_history", ("id",), ("id", "note_id", "edited_by")),
+        ("chat_threads", ("id",), ("id", "trip_id", "task_id")),
+        ("chat_messages", ("id",), ("id", "thread_id", "sender_id")),
+        ("chat_members", ("thread_id", "user_id"), ("thread_id", "user_id")),
+    ]
+]
+
+# UUIDv7 in SQL, for ids made inside the database (gen_random_uuid()
+# with the millisecond clock over its first 48 bits and version 7 set)
+UUID_V7_FUNCTION_SQL = """
+    CREATE OR REPLACE FUNCTION uuid_v7() RETURNS uuid
+    LANGUAGE sql VOLATILE AS $$
+        SELECT encode(set_bit(set_bit(overlay(uuid_send(gen_random_uuid())
+            PLACING substring(int8send((extract(epoch FROM clock_timestamp()) * 1000)::bigint) FROM 3)
+            FROM 1 FOR 6), 52, 1), 53, 1), 'hex')::uuid
+    $$
+"""
+
+
+def migrate_uuid_keys(conn, batch_size=RETYPE_BATCH_SIZE):
+    """
+    Everything but the swap runs alongside the old app version; after
+    the swap, queries passing ids as text[] need the new one.
+    """
+    return retype_tables(conn, UUID_COLUMNS, batch_size)
@@ -0,0 +1,67 @@
+import os
+
+from psycopg.rows import dict_row
+from psycopg.types.string import TextLoader
+from psycopg_pool import AsyncConnectionPool
+
+from db import get_active_database_url
+
+
+# ------------------ Async connection pool ------------------
+#
+# Used by the ASGI serving mode (asgi.py). One pool per worker process,
+# opened lazily on first use. Connections are autocommit with dict rows,
+# and uuid columns come back as text, matching what get_db() hands to
+# the sync routes.
+
+ASYNC_POOL_MIN_SIZE = int(os.environ.get("ASYNC_DB_POOL_MIN", 2))
+ASYNC_POOL_MAX_SIZE = int(os.environ.get("ASYNC_DB_POOL_MAX", 20))
+
+_pool = None
+
+
+async def configure_connection(conn):
+    conn.adapters.register_loader("uuid", TextLoader)
+
+
+async def get_async_pool():
+    global _pool
+    if _pool is None:
+        _pool = AsyncConnectionPool(
+            get_active_database_url(),
+            min_size=ASYNC_POOL_MIN_SIZE,
+            max_size=ASYNC_POOL_MAX_SIZE,
+            kwargs={
+                "autocommit": True,
+                "row_factory": dict_row,
+                "application_name": "tripplanner_asgi",
+                # Neon's pooler runs PgBouncer in transaction mode, which
+                # does not support server-side prepared statements
+                "prepare_threshold": None,
+            },
+            configure=configure_connection,
+            open=False,
+        )
+        await _pool.open()
+    return _pool
+
+
+async def close_async_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+async def fetchone(sql, params=()):
+    pool = await get_async_pool()
+    async with pool.connection() as conn:
+        cur = await conn.execute(sql, params)
+        return await cur.fetchone()
+
+
+async def fetchall(sql, params=()):
+    pool = await get_async_pool()
+    async with pool.connection() as conn:
+        cur = await conn.execute(sql, params)
+        return await cur.fetchall()
@@ -0,0 +1,297 @@
+import bisect
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+from app_logging import get_logger
+
+
+# ------------------ Connection endpoint router ------------------
+#
+# Neon gives every database a pooled (`-pooler.`) and a direct hostname,
+# and may have read replicas on top. Which one is fastest depends on the
+# network of the moment, so each process keeps a rolling latency
+# histogram per endpoint, fed by real checkouts (get_db) and by a
+# background probe, and picks the fastest healthy endpoint per checkout.
+#
+# Switching is damped: a challenger must beat the current endpoint's
+# median by SWITCH_MARGIN over at least MIN_SAMPLES samples, and not more
+# than once per SWITCH_COOLDOWN_SECONDS. An endpoint that fails
+# FAILURES_UNTIL_DOWN checks in a row is skipped until it answers again,
+# and a replica whose replay lag exceeds max_replica_lag is skipped until
+# it catches up.
+
+log = get_logger("db_router")
+
+PRIMARY = "primary"
+REPLICA = "replica"
+
+# Upper bounds (ms) of the histogram buckets; the last one is open-ended
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+WINDOW_SECONDS = 300
+WINDOW_SAMPLES = 512
+MIN_SAMPLES = 5
+SWITCH_MARGIN = 0.2
+SWITCH_COOLDOWN_SECONDS = 60
+FAILURES_UNTIL_DOWN = 3
+PROBE_TIMEOUT_SECONDS = 5
+MAX_REPLICA_LAG_SECONDS = 5
+# Left out of public_stats(): where the databases are, and raw psycopg2
+# errors, which can name roles and auth failures (db.connect logs them)
+PRIVATE_STATS_FIELDS = ("host", "last_error")
+
+# Zero when everything received has been replayed, so an idle replica
+# doesn't look like it is falling behind
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(
+            EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0
+        )
+    END
+"""
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(int(len(sorted_values) * p / 100), len(sorted_values) - 1)]
+
+
+class LatencyHistogram:
+    """Latency samples from the last WINDOW_SECONDS (at most WINDOW_SAMPLES)"""
+
+    def __init__(self, window_seconds=WINDOW_SECONDS, max_samples=WINDOW_SAMPLES):
+        self.window_seconds = window_seconds
+        self._samples = deque(maxlen=max_samples)
+
+    def add(self, ms, now=None):
+        self._samples.append((now if now is not None else time.monotonic(), ms))
+
+    def _recent(self, now=None):
+        cutoff = (now if now is not None else time.monotonic()) - self.window_seconds
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+        return sorted(ms for _, ms in self._samples)
+
+    def percentile(self, p, now=None):
+        return _percentile(self._recent(now), p)
+
+    def count(self, now=None):
+        return len(self._recent(now))
+
+    def snapshot(self, now=None):
+        values = self._recent(now)
+        buckets = [0] * (len(BUCKETS_MS) + 1)
+        for ms in values:
+            buckets[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+
+        labels = [f"le_{b}" for b in BUCKETS_MS] + ["inf"]
+        return {
+            "count": len(values),
+            "p50_ms": _percentile(values, 50),
+            "p90_ms": _percentile(values, 90),
+            "p99_ms": _percentile(values, 99),
+            "buckets": dict(zip(labels, buckets)),
+        }
+
+
+class Endpoint:
+    def __init__(self, name, url, role):
+        self.name = name
+        self.url = url
+        self.role = role
+        self.latency = LatencyHistogram()
+        self.failures = 0
+        self.last_error = None
+        self.last_checked = None
+        self.lag_seconds = None
+
+    @property
+    def healthy(self):
+        return self.failures < FAILURES_UNTIL_DOWN
+
+    @property
+    def host(self):
+        return urlsplit(self.url).hostname
+
+
+class ConnectionRouter:
+    def __init__(self, endpoints, max_replica_lag=MAX_REPLICA_LAG_SECONDS):
+        self.endpoints = {e.name: e for e in endpoints}
+        self.max_replica_lag = max_replica_lag
+        self._current = {}
+        self._switched_at = {}
+        self._lock = threading.Lock()
+        self._probe_thread = None
+
+    def record(self, name, ms):
+        endpoint = self.endpoints[name]
+        with self._lock:
+            endpoint.latency.add(ms)
+            endpoint.failures = 0
+            endpoint.last_checked = time.time()
+
+    def record_lag(self, name, lag_seconds):
+        with self._lock:
+            self.endpoints[name].lag_seconds = lag_seconds
+
+    def usable(self, endpoint):
+        if not endpoint.healthy:
+            return False
+        if endpoint.role == REPLICA and endpoint.lag_seconds is not None:
+            return endpoint.lag_seconds <= self.max_replica_lag
+        return True
+
+    def record_failure(self, name, error):
+        endpoint = self.endpoints[name]
+        with self._lock:
+            endpoint.failures += 1
+            endpoint.last_error = str(error)[:200]
+            endpoint.last_checked = time.time()
+
+    def choose(self, role=PRIMARY, exclude=()):
+        """
+        Endpoint to use for the next checkout. Replica lookups fall back to
+        the primary endpoints when no replica is healthy and caught up.
+        """
+        with self._lock:
+            candidates = [
+                e for e in self.endpoints.values()
+                if e.role == role and e.name not in exclude
+            ]
+            healthy = [e for e in candidates if self.usable(e)]
+            if healthy:
+                return self._pick(role, healthy)
+            if role == PRIMARY:
+                # Everything is down: keep trying rather than refuse
+                return self._current_endpoint(role) or (candidates or [None])[0]
+        return self.choose(PRIMARY, exclude)
+
+    def _current_endpoint(self, role):
+        name = self._current.get(role)
+        return self.endpoints.get(name) if name else None
+
+    def _pick(self, role, healthy):
+        now = time.monotonic()
+        current = self._current_endpoint(role)
+
+        if current not in healthy:
+            # First pick or failover: take the fastest known, else the first
+            choice = min(healthy, key=self._median_or_inf)
+            self._set_current(role, choice, now)
+            return choice
+
+        current_median = current.latency.percentile(50)
+        if current_median is None:
+            return current
+        if now - self._switched_at.get(role, 0) < SWITCH_COOLDOWN_SECONDS:
+            return current
+
+        challengers = [
+            e for e in healthy
+            if e is not current and e.latency.count() >= MIN_SAMPLES
+        ]
+        if challengers:
+            best = min(challengers, key=self._median_or_inf)
+            if best.latency.percentile(50) < current_median * (1 - SWITCH_MARGIN):
+                log.info("db_router_switch", role=role, previous=current.name,
+                         endpoint=best.name, p50_ms=round(best.latency.percentile(50), 1),
+                         previous_p50_ms=round(current_median, 1))
+                self._set_current(role, best, now)
+                return best
+        return current
+
+    def _set_current(self, role, endpoint, now):
+        self._current[role] = endpoint.name
+        self._switched_at[role] = now
+
+    @staticmethod
+    def _median_or_inf(endpoint):
+        median = endpoint.latency.percentile(50)
+        return median if median is not None else float("inf")
+
+    # ---------------- background probes ----------------
+
+    def probe(self, endpoint):
+        import psycopg2
+
+        start = time.perf_counter()
+        try:
+            conn = psycopg2.connect(
+                endpoint.url,
+                connect_timeout=PROBE_TIMEOUT_SECONDS,
+                application_name="tripplanner_probe",
+            )
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT 1")
+                ms = (time.perf_counter() - start) * 1000
+                if endpoint.role == REPLICA:
+                    cur.execute(REPLICA_LAG_SQL)
+                    self.record_lag(endpoint.name, float(cur.fetchone()[0]))
+                cur.close()
+            finally:
+                conn.close()
+        except psycopg2.Error as e:
+            self.record_failure(endpoint.name, e)
+            return None
+        self.record(endpoint.name, ms)
+        return ms
+
+    def probe_all(self):
+        for endpoint in list(self.endpoints.values()):
+            self.probe(endpoint)
+
+    def start_probes(self, interval_seconds):
+        """Probe every endpoint every interval_seconds on a daemon thread"""
+        if interval_seconds <= 0:
+            return
+        with self._lock:
+            if self._probe_thread and self._probe_thread.is_alive():
+                return
+            self._probe_thread = threading.Thread(
+                target=self._probe_forever, args=(interval_seconds,),
+                name="db-router-probe", daemon=True
+            )
+            self._probe_thread.start()
+
+    def _probe_forever(self, interval_seconds):
+        while True:
+            try:
+                self.probe_all()
+            except Exception:
+                log.exception("db_router_probe_error")
+            time.sleep(interval_seconds)
+
+    def stats(self):
+        with self._lock:
+            current = dict(self._current)
+            return {
+                "current": current,
+                "endpoints": [
+                    {
+                        "name": e.name,
+                        "role": e.role,
+                        "host": e.host,
+                        "healthy": self.usable(e),
+                        "selected": current.get(e.role) == e.name,
+                        "consecutive_failures": e.failures,
+                        "lag_seconds": e.lag_seconds,
+                        "last_error": e.last_error,
+                        "last_checked": e.last_checked,
+                        "latency": e.latency.snapshot(),
+                    }
+                    for e in self.endpoints.values()
+                ],
+            }
+
+    def public_stats(self):
+        """stats() without hostnames or driver errors, for unauthenticated callers"""
+        stats = self.stats()
+        for endpoint in stats["endpoints"]:
+            for field in PRIVATE_STATS_FIELDS:
+                endpoint.pop(field, None)
+        return stats
@@ -0,0 +1,262 @@
+import hashlib
+import pickle
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask import Response, render_template, request
+from markupsafe import Markup
+
+import metrics
+
+
+# ------------------ Rendered fragment cache ------------------
+#
+# The task list of day.html and the member list of trip.html are cached
+# as rendered HTML, keyed by the version counter of the trip/day they
+# show. Writes bump the counter (live_updates.publish does it for every
+# trip/day event), so a cached fragment is never stale: a changed trip
+# simply stops matching its old keys, and those age out of the LRU.
+#
+# Versions live in Postgres (cache_versions) so every worker sees the
+# same counters. The same counters produce the ETag/Last-Modified of the
+# page, which lets a browser revalidate with a 304 and no rendering.
+
+DEFAULT_MAX_ENTRIES = 512
+SHARED_TTL_SECONDS = 24 * 3600
+
+
+def trip_scope(trip_id):
+    return f"trip:{trip_id}"
+
+
+def day_scope(day_id):
+    return f"day:{day_id}"
+
+
+def friends_scope(user_id):
+    return f"friends:{user_id}"
+
+
+def version_scopes(trip_id, day_id):
+    """Scope bumped by an event on trip_id/day_id (day_id None = trip-wide)"""
+    return [day_scope(day_id)] if day_id else [trip_scope(trip_id)]
+
+
+BUMP_VERSIONS_SQL = """
+    INSERT INTO cache_versions (scope, version, updated_at)
+    SELECT scope, 1, now() FROM unnest(%s::text[]) AS scope
+    ON CONFLICT (scope) DO UPDATE
+    SET version = cache_versions.version + 1,
+        updated_at = now()
+"""
+
+GET_VERSIONS_SQL = """
+    SELECT scope, version, updated_at FROM cache_versions
+    WHERE scope = ANY(%s)
+"""
+
+
+def bump_versions(conn, scopes):
+    cur = conn.cursor()
+    cur.execute(BUMP_VERSIONS_SQL, (list(scopes),))
+    cur.close()
+
+
+async def abump_versions(aconn, scopes):
+    await aconn.execute(BUMP_VERSIONS_SQL, (list(scopes),))
+
+
+def _versions(rows, scopes):
+    found = {row["scope"]: (row["version"], row["updated_at"]) for row in rows}
+    return {scope: found.get(scope, (0, None)) for scope in scopes}
+
+
+def get_versions(conn, scopes):
+    """{scope: (version, updated_at)}; scopes never bumped are (0, None)"""
+    cur = conn.cursor()
+    cur.execute(GET_VERSIONS_SQL, (list(scopes),))
+    rows = cur.fetchall()
+    cur.close()
+    return _versions(rows, scopes)
+
+
+async def aget_versions(aconn, scopes):
+    cur = await aconn.execute(GET_VERSIONS_SQL, (list(scopes),))
+    return _versions(await cur.fetchall(), scopes)
+
+
+# ---------------- backends ----------------
+
+class LRUBackend:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Shared second tier, so workers reuse each other's renders"""
+
+    def __init__(self, url, ttl_seconds=SHARED_TTL_SECONDS):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("FRAGMENT_CACHE_REDIS_URL is set but redis is not installed")
+        self.client = redis.Redis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, key):
+        value = self.client.get(key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value):
+        self.client.set(key, pickle.dumps(value), ex=self.ttl_seconds)
+
+
+def _fragment_key(parts):
+    return "fragment:" + ":".join(str(part) for part in parts)
+
+
+class FragmentCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.local = LRUBackend(max_entries)
+        self.shared = None
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, max_entries=DEFAULT_MAX_ENTRIES, redis_url=None):
+        self.local = LRUBackend(max_entries)
+        self.shared = RedisBackend(redis_url) if redis_url else None
+
+    def _lookup(self, key):
+        html = self.local.get(key)
+        if html is None and self.shared is not None:
+            html = self.shared.get(key)
+            if html is not None:
+                self.local.set(key, html)
+
+        if html is not None:
+            self.hits += 1
+            metrics.cache_requests.inc(cache="fragment", result="hit")
+        else:
+            self.misses += 1
+            metrics.cache_requests.inc(cache="fragment", result="miss")
+        return html
+
+    def _store(self, key, html):
+        self.local.set(key, html)
+        if self.shared is not None:
+            self.shared.set(key, html)
+
+    def render(self, key, template, **context):
+        """Rendered template for key, from cache when possible"""
+        key = _fragment_key(key)
+        html = self._lookup(key)
+        if html is None:
+            html = render_template(template, **context)
+            self._store(key, html)
+        return Markup(html)
+
+    async def arender(self, key, template, **context):
+        """render() for the Quart views in asgi.py"""
+        from quart import render_template as arender_template
+
+        key = _fragment_key(key)
+        html = self._lookup(key)
+        if html is None:
+            html = await arender_template(template, **context)
+            self._store(key, html)
+        return Markup(html)
+
+    def stats(self):
+        return {
+            "entries": len(self.local),
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared": self.shared is not None,
+        }
+
+
+fragment_cache = FragmentCache()
+
+
+# ---------------- conditional GET ----------------
+
+def page_validators(versions, *parts):
+    """
+    (etag, last_modified) for a page built from these scope versions plus
+    any extra parts the page depends on (user, date, ...).
+    """
+    raw = "|".join(
+        [f"{scope}={version}" for scope, (version, _) in sorted(versions.items())]
+        + [str(part) for part in parts]
+    )
+    etag = hashlib.sha1(raw.encode()).hexdigest()[:20]
+
+    stamps = [updated_at for _, updated_at in versions.values() if updated_at]
+    last_modified = max(stamps) if stamps else None
+    if last_modified is not None and last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+
+    # Date-dependent flags (past/today/upcoming) change at midnight
+    midnight = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    if last_modified is None or last_modified < midnight:
+        last_modified = midnight
+
+    return etag, last_modified
+
+
+def _is_fresh(req, etag, last_modified):
+    if req.if_none_match:
+        fresh = req.if_none_match.contains_weak(etag)
+    elif req.if_modified_since:
+        fresh = last_modified.replace(microsecond=0) <= req.if_modified_since
+    else:
+        fresh = False
+
+    metrics.cache_requests.inc(cache="http", result="hit" if fresh else "miss")
+    return fresh
+
+
+def not_modified(etag, last_modified):
+    """304 response if the client's copy is current, else None"""
+    if not _is_fresh(request, etag, last_modified):
+        return None
+    return with_validators(Response(status=304), etag, last_modified)
+
+
+def anot_modified(etag, last_modified):
+    """not_modified() for the Quart views in asgi.py"""
+    from quart import Response as QuartResponse, request as quart_request
+
+    if not _is_fresh(quart_request, etag, last_modified):
+        return None
+    return with_validators(QuartResponse("", status=304), etag, last_modified)
+
+
+def with_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    # Pages are per user: cache in the browser only, and always revalidate
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add("Cookie")
+    return response
@@ -0,0 +1,375 @@
+import secrets
+
+from app_logging import get_logger
+
+
+# ------------------ Friend graph ------------------
+#
+# Users are found by a short public id ("TP-7K3QX9") that they share to
+# be added as friends. It is stored in users.public_id under a unique
+# index, generated at registration and backfilled for older accounts, so
+# resolving one is an index lookup and never ambiguous.
+#
+# Friendships are stored in both directions in `friends` (user_id,
+# friend_id), so "friends of X" and mutual friends are primary key range
+# scans. Pending requests are served by a partial index on status.
+
+log = get_logger("friend_graph")
+
+PUBLIC_ID_PREFIX = "TP-"
+PUBLIC_ID_LENGTH = 6
+# Crockford base32: no I/L/O/U, so ids survive being read out loud
+PUBLIC_ID_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+PUBLIC_ID_ATTEMPTS = 8
+BACKFILL_BATCH_SIZE = 1000
+
+
+def new_public_id():
+    return PUBLIC_ID_PREFIX + "".join(
+        secrets.choice(PUBLIC_ID_ALPHABET) for _ in range(PUBLIC_ID_LENGTH)
+    )
+
+
+def normalize_public_id(public_id):
+    public_id = (public_id or "").strip().upper()
+    if not public_id.startswith(PUBLIC_ID_PREFIX):
+        return None
+    return public_id
+
+
+CREATE_USER_SQL = """
+    INSERT INTO users (id, name, password, created_at, public_id)
+    VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT (public_id) DO NOTHING
+    RETURNING public_id
+"""
+
+
+def create_user(conn, user_id, name, password, created_at):
+    """Insert a user with a fresh public id; returns the public id"""
+    cur = conn.cursor()
+    try:
+        for _ in range(PUBLIC_ID_ATTEMPTS):
+            cur.execute(CREATE_USER_SQL, (user_id, name, password, created_at, new_public_id()))
+            row = cur.fetchone()
+            if row:
+                return row["public_id"]
+    finally:
+        cur.close()
+    raise RuntimeError("Could not allocate a unique public id")
+
+
+def resolve_public_id(public_id, conn):
+    """User id for a public id like 'TP-7K3QX9', or None"""
+    public_id = normalize_public_id(public_id)
+    if not public_id:
+        return None
+
+    cur = conn.cursor()
+    cur.execute("SELECT id FROM users WHERE public_id = %s", (public_id,))
+    user = cur.fetchone()
+    cur.close()
+    return user["id"] if user else None
+
+
+# ---------------- backfill ----------------
+
+# Older accounts keep the id they may already have shared, unless another
+# account in the batch or table claimed it first (prefix collision)
+BACKFILL_LEGACY_SQL = """
+    UPDATE users u
+    SET public_id = c.public_id
+    FROM (
+        SELECT DISTINCT ON (public_id) id, public_id
+        FROM (
+            SELECT id, 'TP-' || UPPER(LEFT(SPLIT_PART(id::text, '-', 1), 6)) AS public_id
+            FROM users
+            WHERE id = ANY(%s::uuid[])
+        ) candidates
+        ORDER BY public_id, id
+    ) c
+    WHERE u.id = c.id
+    AND u.public_id IS NULL
+    AND NOT EXISTS (SELECT 1 FROM users x WHERE x.public_id = c.public_id)
+"""
+
+ASSIGN_PUBLIC_ID_SQL = """
+    UPDATE users SET public_id = %s
+    WHERE id = %s AND public_id IS NULL
+    AND NOT EXISTS (SELECT 1 FROM users x WHERE x.public_id = %s)
+"""
+
+
+def backfill_public_ids(conn, batch_size=BACKFILL_BATCH_SIZE):
+    """Give every user without a public id one, batch_size rows at a time"""
+    cur = conn.cursor()
+    total = 0
+    while True:
+        cur.execute("""
+            SELECT id FROM users WHERE public_id IS NULL
+            ORDER BY id LIMIT %s
+        """, (batch_size,))
+        ids = [row["id"] for row in cur.fetchall()]
+        if not ids:
+            break
+
+        cur.execute(BACKFILL_LEGACY_SQL, (ids,))
+
+        # Collision losers get a fresh id
+        cur.execute("SELECT id FROM users WHERE id = ANY(%s::uuid[]) AND public_id IS NULL", (ids,))
+        for row in cur.fetchall():
+            for _ in range(PUBLIC_ID_ATTEMPTS):
+                public_id = new_public_id()
+                cur.execute(ASSIGN_PUBLIC_ID_SQL, (public_id, row["id"], public_id))
+                if cur.rowcount:
+                    break
+
+        conn.commit()
+        total += len(ids)
+        log.info("public_ids_backfilled", total=total)
+    cur.close()
+    return total
+
+
+# ---------------- graph queries ----------------
+
+FRIENDS_SQL = """
+    SELECT u.id, u.name, u.public_id
+    FROM friends f
+    JOIN users u ON u.id = f.friend_id
+    WHERE f.user_id = %s
+    ORDER BY u.name
+"""
+
+FRIEND_COUNT_SQL = "SELECT COUNT(*) AS count FROM friends WHERE user_id = %s"
+
+ARE_FRIENDS_SQL = "SELECT 1 FROM friends WHERE user_id = %s AND friend_id = %s"
+
+MUTUAL_FRIENDS_SQL = """
+    SELECT u.id, u.name, u.public_id
+    FROM friends a
+    JOIN friends b ON b.user_id = %s AND b.friend_id = a.friend_id
+    JOIN users u ON u.id = a.friend_id
+    WHERE a.user_id = %s
+    ORDER BY u.name
+"""
+
+PENDING_REQUESTS_SQL = """
+    SELECT fr.id, fr.sender_id, u.name AS sender_name, u.public_id AS sender_public_id,
+           fr.message, fr.created_at
+    FROM friend_requests fr
+    JOIN users u ON u.id = fr.sender_id
+    WHERE fr.receiver_id = %s AND fr.status = 'pending'
+    ORDER BY fr.created_at DESC
+"""
+
+SENT_REQUESTS_SQL = """
+    SELECT fr.id, fr.receiver_id, u.name AS receiver_name, u.public_id AS receiver_public_id,
+           fr.message, fr.created_at
+    FROM friend_requests fr
+    JOIN users u ON u.id = fr.receiver_id
+    WHERE fr.sender_id = %s AND fr.status = 'pending'
+    ORDER BY fr.created_at DESC
+"""
+
+# Friends of the user who aren't on the trip yet
+INVITABLE_FRIENDS_SQL = """
+    SELECT u.id, u.name, u.public_id
+    FROM friends f
+    JOIN users u ON u.id = f.friend_id
+    WHERE f.user_id = %s
+    AND NOT EXISTS (
+        SELECT 1 FROM trip_members tm
+        WHERE tm.trip_id = %s AND tm.user_id = f.friend_id
+    )
+    ORDER BY u.name
+"""
+
+
+def _fetchall(conn, sql, params):
+    cur = conn.cursor()
+    cur.execute(sql, params)
+    rows = cur.fetchall()
+    cur.close()
+    return rows
+
+
+def friends_of(conn, user_id):
+    return _fetchall(conn, FRIENDS_SQL, (user_id,))
+
+
+def friend_count(conn, user_id):
+    return _fetchall(conn, FRIEND_COUNT_SQL, (user_id,))[0]["count"]
+
+
+def are_friends(conn, user_id, other_id):
+    return bool(_fetchall(conn, ARE_FRIENDS_SQL, (user_id, other_id)))
+
+
+def mutual_friends(conn, user_id, other_id):
+    return _fetchall(conn, MUTUAL_FRIENDS_SQL, (other_id, user_id))
+
+
+def pending_requests(conn, user_id):
+    """Requests waiting for user_id to accept or reject"""
+    return _fetchall(conn, PENDING_REQUESTS_SQL, (user_id,))
+
+
+def sent_requests(conn, user_id):
+    """Requests user_id sent that are still pending"""
+    return _fetchall(conn, SENT_REQUESTS_SQL, (user_id,))
+
+
+def invitable_friends(conn, user_id, trip_id):
+    return _fetchall(conn, INVITABLE_FRIENDS_SQL, (user_id, trip_id))
+
+
+# ---------------- request lifecycle ----------------
+#
+# Each action is one statement, so concurrent clicks can't interleave a
+# check with the write it guards. A partial unique index allows a single
+# pending request per (sender, receiver); accepting locks that request
+# row, and only the caller that flips it from pending inserts the two
+# friendship rows.
+
+SENT = "sent"
+ALREADY_SENT = "already_sent"
+ALREADY_FRIENDS = "already_friends"
+ACCEPTED = "accepted"
+NOT_FOUND = "not_found"
+SELF = "self"
+
+SEND_REQUEST_SQL = """
+    WITH receiver AS (
+        SELECT id FROM users WHERE public_id = %(public_id)s
+    ),
+    state AS (
+        SELECT r.id AS receiver_id,
+            r.id = %(sender_id)s AS is_self,
+            EXISTS (
+                SELECT 1 FROM friends f
+                WHERE f.user_id = %(sender_id)s AND f.friend_id = r.id
+            ) AS already_friends,
+            EXISTS (
+                SELECT 1 FROM friend_requests fr
+                WHERE fr.sender_id = r.id AND fr.receiver_id = %(sender_id)s
+                AND fr.status = 'pending'
+            ) AS reverse_pending
+        FROM receiver r
+    ),
+    inserted AS (
+        INSERT INTO friend_requests (id, sender_id, receiver_id, message, status, created_at)
+        SELECT %(id)s, %(sender_id)s, receiver_id, %(message)s, 'pending', %(now)s
+        FROM state
+        WHERE NOT is_self AND NOT already_friends AND NOT reverse_pending
+        ON CONFLICT (sender_id, receiver_id) WHERE status = 'pending' DO NOTHING
+        RETURNING id
+    )
+    SELECT s.receiver_id, s.is_self, s.already_friends, s.reverse_pending,
+        EXISTS (SELECT 1 FROM inserted) AS created
+    FROM state s
+"""
+
+# The friends inserts only see the request this call flipped from pending
+ACCEPT_REQUEST_SQL = """
+    WITH accepted AS (
+        UPDATE friend_requests
+        SET status = 'accepted', responded_at = %(now)s
+        WHERE sender_id = %(sender_id)s AND receiver_id = %(receiver_id)s
+        AND status = 'pending'
+        RETURNING sender_id, receiver_id
+    ),
+    linked AS (
+        INSERT INTO friends (user_id, friend_id, created_at)
+        SELECT sender_id, receiver_id, %(now)s FROM accepted
+        UNION ALL
+        SELECT receiver_id, sender_id, %(now)s FROM accepted
+        ON CONFLICT (user_id, friend_id) DO NOTHING
+    )
+    SELECT COUNT(*) AS accepted FROM accepted
+"""
+
+REJECT_REQUEST_SQL = """
+    UPDATE friend_requests
+    SET status = 'rejected', responded_at = %s
+    WHERE sender_id = %s AND receiver_id = %s AND status = 'pending'
+"""
+
+
+def send_friend_request(conn, request_id, sender_id, receiver_public_id, message, now):
+    """
+    (outcome, receiver_id). A request to someone who already asked the
+    sender accepts theirs instead of opening a second one.
+    """
+    public_id = normalize_public_id(receiver_public_id)
+    if not public_id:
+        return NOT_FOUND, None
+
+    cur = conn.cursor()
+    cur.execute(SEND_REQUEST_SQL, {
+        "id": request_id,
+        "sender_id": sender_id,
+        "public_id": public_id,
+        "message": message,
+        "now": now,
+    })
+    row = cur.fetchone()
+    cur.close()
+
+    if not row:
+        return NOT_FOUND, None
+    receiver_id = row["receiver_id"]
+    if row["is_self"]:
+        return SELF, receiver_id
+    if row["already_friends"]:
+        return ALREADY_FRIENDS, receiver_id
+    if row["reverse_pending"]:
+        accept_friend_request(conn, receiver_id, sender_id, now)
+        return ACCEPTED, receiver_id
+    return (SENT if row["created"] else ALREADY_SENT), receiver_id
+
+
+def accept_friend_request(conn, sender_id, receiver_id, now):
+    """True if this call accepted the pending request"""
+    cur = conn.cursor()
+    cur.execute(ACCEPT_REQUEST_SQL, {
+        "sender_id": sender_id,
+        "receiver_id": receiver_id,
+        "now": now,
+    })
+    accepted = cur.fetchone()["accepted"] > 0
+    cur.close()
+    return accepted
+
+
+def reject_friend_request(conn, sender_id, receiver_id, now):
+    """True if this call rejected the pending request"""
+    cur = conn.cursor()
+    cur.execute(REJECT_REQUEST_SQL, (now, sender_id, receiver_id))
+    rejected = cur.rowcount > 0
+    cur.close()
+    return rejected
+
+
+# ---------------- bulk operations ----------------
+
+# Only the inviter's friends are added; members already on the trip are
+# skipped by the primary key
+INVITE_FRIENDS_SQL = """
+    INSERT INTO trip_members (trip_id, user_id, role, joined_at)
+    SELECT %s, u.id, 'member', %s
+    FROM users u
+    JOIN friends f ON f.friend_id = u.id AND f.user_id = %s
+    WHERE u.public_id = ANY(%s)
+    ON CONFLICT (trip_id, user_id) DO NOTHING
+    RETURNING user_id
+"""
+
+
+def invite_friends_to_trip(conn, trip_id, inviter_id, public_ids, joined_at):
+    """Add the inviter's friends to a trip in one statement; returns added user ids"""
+    public_ids = [p for p in (normalize_public_id(p) for p in public_ids) if p]
+    if not public_ids:
+        return []
+    rows = _fetchall(conn, INVITE_FRIENDS_SQL, (trip_id, joined_at, inviter_id, public_ids))
+    return [row["user_id"] for row in rows]
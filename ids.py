@@ -0,0 +1,46 @@
+import hashlib
+import os
+import time
+import uuid
+
+
+# ------------------ Row ids ------------------
+#
+# Keys are native uuid columns. New ids are UUIDv7: the first 48 bits
+# are the creation time in milliseconds, so new rows land at the right
+# edge of each primary key btree instead of on random pages. The rest is
+# random, which keeps ids unguessable.
+#
+# Rows created before the uuid migration could in principle have held
+# any text; the migration turns a value that isn't a uuid into the md5
+# of it (db.py, text_to_uuid), and as_uuid does the same, so an old link
+# still finds its row.
+
+UUID_URL_ARGS = ("trip_id", "day_id", "task_id", "group_id", "thread_id", "user_id", "sender_id")
+
+
+def uuid7():
+    value = (time.time_ns() // 1_000_000) << 80 | int.from_bytes(os.urandom(10), "big")
+    value = value & ~(0xF << 76) | 0x7 << 76  # version 7
+    value = value & ~(0x3 << 62) | 0x2 << 62  # RFC 4122 variant
+    return uuid.UUID(int=value)
+
+
+def new_id():
+    return str(uuid7())
+
+
+def as_uuid(value):
+    """Canonical uuid text for an id, mapping legacy non-uuid ids like the migration"""
+    try:
+        return str(uuid.UUID(value))
+    except (TypeError, ValueError, AttributeError):
+        return str(uuid.UUID(hashlib.md5(str(value).encode()).hexdigest()))
+
+
+def normalize_url_ids(endpoint, values):
+    """url_value_preprocessor: ids from old links, matched the way the database stores them"""
+    if values:
+        for arg in UUID_URL_ARGS:
+            if arg in values:
+                values[arg] = as_uuid(values[arg])
@@ -0,0 +1,196 @@
+import json
+import queue
+import select
+import threading
+import time
+
+from app_logging import get_logger
+from db import get_direct_database_url
+from fragment_cache import abump_versions, bump_versions, version_scopes
+
+
+# ------------------ Live day/trip updates ------------------
+#
+# Writes publish small JSON events with Postgres NOTIFY on one channel.
+# Each worker process holds a single LISTEN connection on a background
+# thread and fans events out to in-memory subscriber queues, so hundreds
+# of open Server-Sent Event streams cost one database connection, not one
+# each. Events carry trip_id/day_id; subscribers register for a whole trip
+# (day_id None) or for one day.
+
+log = get_logger("live_updates")
+
+CHANNEL = "trip_events"
+SUBSCRIBER_QUEUE_SIZE = 100
+KEEPALIVE_SECONDS = 15
+# NOTIFY payloads must stay under 8000 bytes. Over this, the longest
+# event fields go out as null (see _payload) and clients refetch
+NOTIFY_PAYLOAD_BYTES = 7900
+
+
+def _encode(payload):
+    return json.dumps(payload, default=str)
+
+
+def _payload(trip_id, day_id, event_type, data):
+    payload = {"type": event_type, "trip_id": trip_id, "day_id": day_id, **data}
+    text = _encode(payload)
+    longest_first = sorted(data, key=lambda key: len(_encode(data[key])), reverse=True)
+    for key in longest_first:
+        if len(text.encode()) <= NOTIFY_PAYLOAD_BYTES:
+            break
+        payload[key] = None
+        text = _encode(payload)
+    return text
+
+
+# The cache version is bumped before the NOTIFY: on an autocommit
+# connection the write has already landed, so it must invalidate cached
+# pages even if the notification then fails
+
+def publish(conn, trip_id, day_id, event_type, **data):
+    """
+    NOTIFY subscribers of trip/day. Delivered when conn commits. Also
+    bumps the trip/day cache version, so cached fragments and ETags of
+    the changed page stop matching.
+    """
+    bump_versions(conn, version_scopes(trip_id, day_id))
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT pg_notify(%s, %s)",
+        (CHANNEL, _payload(trip_id, day_id, event_type, data))
+    )
+    cur.close()
+
+
+async def apublish(aconn, trip_id, day_id, event_type, **data):
+    """publish() for psycopg 3 async connections"""
+    await abump_versions(aconn, version_scopes(trip_id, day_id))
+    await aconn.execute(
+        "SELECT pg_notify(%s, %s)",
+        (CHANNEL, _payload(trip_id, day_id, event_type, data))
+    )
+
+
+LOCATION_NOTIFY_SQL = f"""
+    SELECT pg_notify('{CHANNEL}', json_build_object(
+        'type', 'location', 'trip_id', trip_id, 'day_id', day_id,
+        'group_id', id, 'lat', %s::float, 'lng', %s::float
+    )::text)
+    FROM transport_groups WHERE id = %s
+"""
+
+
+def publish_location(conn, group_id, lat, lng):
+    """Location event for the group's trip/day, resolved in the same query"""
+    cur = conn.cursor()
+    cur.execute(LOCATION_NOTIFY_SQL, (lat, lng, group_id))
+    cur.close()
+
+
+async def apublish_location(aconn, group_id, lat, lng):
+    await aconn.execute(LOCATION_NOTIFY_SQL, (lat, lng, group_id))
+
+
+class LiveUpdates:
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, trip_id, day_id=None):
+        """Returns (key, queue); pass both to unsubscribe() when done"""
+        self._ensure_listener()
+        key = (trip_id, day_id)
+        q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(key, set()).add(q)
+        return key, q
+
+    def unsubscribe(self, key, q):
+        with self._lock:
+            subs = self._subscribers.get(key)
+            if subs:
+                subs.discard(q)
+                if not subs:
+                    del self._subscribers[key]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subs) for subs in self._subscribers.values())
+
+    def dispatch(self, event):
+        trip_id = event.get("trip_id")
+        keys = [(trip_id, None)]
+        if event.get("day_id"):
+            keys.append((trip_id, event["day_id"]))
+
+        with self._lock:
+            targets = [q for key in keys for q in self._subscribers.get(key, ())]
+
+        for q in targets:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                # Slow client: drop the event, it will resync on reconnect
+                pass
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._listen_forever, name="live-updates", daemon=True
+            )
+            self._thread.start()
+
+    def _listen_forever(self):
+        while True:
+            try:
+                self._listen()
+            except Exception as e:
+                log.warning("live_updates_listener_error", error=str(e))
+                time.sleep(2)
+
+    def _listen(self):
+        import psycopg2
+
+        # LISTEN needs a session, which the transaction-mode pooler can't keep
+        conn = psycopg2.connect(get_direct_database_url(), connect_timeout=5)
+        conn.autocommit = True
+        try:
+            cur = conn.cursor()
+            cur.execute(f"LISTEN {CHANNEL}")
+            cur.close()
+
+            while True:
+                if select.select([conn], [], [], KEEPALIVE_SECONDS) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    try:
+                        self.dispatch(json.loads(notify.payload))
+                    except ValueError:
+                        continue
+        finally:
+            conn.close()
+
+
+live_updates = LiveUpdates()
+
+
+def event_stream(trip_id, day_id=None):
+    """Generator of SSE frames for one subscriber"""
+    key, q = live_updates.subscribe(trip_id, day_id)
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                event = q.get(timeout=KEEPALIVE_SECONDS)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    finally:
+        live_updates.unsubscribe(key, q)
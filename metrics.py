@@ -0,0 +1,299 @@
+import atexit
+import bisect
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+
+from app_logging import get_logger
+
+
+# ------------------ Prometheus metrics ------------------
+#
+# /metrics serves counters and histograms in the Prometheus text format:
+# per-route latency, database time per request, connection acquisition
+# time and retries, cache hit rates and import/export throughput.
+#
+# Observing is a dict lookup and a few additions under one lock. Each
+# process keeps its own values; with METRICS_DIR set, every worker dumps
+# them to METRICS_DIR/metrics-<pid>.json every few seconds (and at exit),
+# and a scrape, whichever worker serves it, sums all the files. Files of
+# workers that have exited stay, so counters never go backwards when
+# gunicorn recycles a worker; empty the directory when the server starts.
+#
+# Gauges (endpoint health, cache size) describe the serving process and
+# are added at scrape time rather than stored.
+
+log = get_logger("metrics")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PREFIX = "tripplanner_"
+DEFAULT_FLUSH_SECONDS = 5
+
+# Upper bounds (seconds) of histogram buckets; +Inf is implied
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_lock = threading.Lock()
+_metrics = {}
+_settings = {
+    "directory": None,
+    "flush_seconds": DEFAULT_FLUSH_SECONDS,
+}
+_flusher = None
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = PREFIX + name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        _metrics[self.name] = self
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[label]) for label in self.labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def snapshot(self):
+        return [[list(key), value] for key, value in self.values.items()]
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = PREFIX + name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}
+        _metrics[self.name] = self
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[label]) for label in self.labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            # [count per bucket ..., count above the last bucket, sum]
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 2)
+            counts[slot] += 1
+            counts[-1] += value
+
+    def snapshot(self):
+        return [[list(key), list(counts)] for key, counts in self.values.items()]
+
+    @staticmethod
+    def merge(total, counts):
+        if total is None:
+            return list(counts)
+        return [a + b for a, b in zip(total, counts)]
+
+
+# ---------------- the app's metrics ----------------
+
+request_seconds = Histogram(
+    "request_duration_seconds", "Time to handle a request",
+    labels=("endpoint", "method", "status"),
+)
+request_db_seconds = Histogram(
+    "request_db_seconds", "Time spent in queries per request",
+    labels=("endpoint",),
+)
+request_queries = Counter(
+    "request_queries_total", "Queries run while handling requests",
+    labels=("endpoint",),
+)
+db_connect_seconds = Histogram(
+    "db_connect_seconds", "Time to open a database connection",
+    labels=("endpoint",),
+)
+db_connect_retries = Counter(
+    "db_connect_retries_total", "Failed connection attempts that were retried",
+    labels=("endpoint",),
+)
+db_connect_failures = Counter(
+    "db_connect_failures_total", "Connection checkouts that gave up after retrying",
+    labels=("endpoint",),
+)
+cache_requests = Counter(
+    "cache_requests_total", "Cache lookups: fragment renders and conditional GETs",
+    labels=("cache", "result"),
+)
+imports = Counter(
+    "imports_total", "Trip imports",
+    labels=("format", "outcome"),
+)
+import_tasks = Counter(
+    "import_tasks_total", "Tasks created by trip imports",
+)
+import_seconds = Histogram(
+    "import_duration_seconds", "Time to import a trip",
+    labels=("format",),
+)
+exports = Counter(
+    "exports_total", "Trip exports streamed",
+    labels=("format", "outcome"),
+)
+export_tasks = Counter(
+    "export_tasks_total", "Tasks written by trip exports",
+)
+export_seconds = Histogram(
+    "export_duration_seconds", "Time to stream a trip export",
+    labels=("format",),
+)
+rate_limited = Counter(
+    "rate_limited_total", "Sign-in form posts turned away by the rate limiter",
+    labels=("action", "key"),
+)
+
+
+def observe_request(endpoint, method, status, seconds, profile=None):
+    endpoint = endpoint or "unmatched"
+    request_seconds.observe(seconds, endpoint=endpoint, method=method, status=status)
+    if profile is not None and profile.count:
+        request_db_seconds.observe(profile.total_ms / 1000, endpoint=endpoint)
+        request_queries.inc(profile.count, endpoint=endpoint)
+
+
+# ---------------- multi-process ----------------
+
+def configure(directory=None, flush_seconds=DEFAULT_FLUSH_SECONDS):
+    _settings["directory"] = directory
+    _settings["flush_seconds"] = flush_seconds
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        _start_flusher()
+
+
+def _start_flusher():
+    global _flusher
+    if _flusher is not None and _flusher.is_alive():
+        return
+    _flusher = threading.Thread(target=_flush_forever, name="metrics-flush", daemon=True)
+    _flusher.start()
+
+
+def _flush_forever():
+    while True:
+        time.sleep(_settings["flush_seconds"])
+        try:
+            flush()
+        except Exception:
+            log.exception("metrics_flush_failed")
+
+
+def _snapshot():
+    with _lock:
+        return {name: metric.snapshot() for name, metric in _metrics.items()}
+
+
+def flush():
+    """Write this process's values to METRICS_DIR (no-op without one)"""
+    directory = _settings["directory"]
+    if not directory:
+        return
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".metrics-", suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(_snapshot(), f)
+    os.replace(tmp, os.path.join(directory, f"metrics-{os.getpid()}.json"))
+
+
+def _after_fork():
+    # A forked worker starts from zero; the parent's counts are its own
+    global _flusher, _lock
+    _lock = threading.Lock()
+    for metric in _metrics.values():
+        metric.values = {}
+    _flusher = None
+    if _settings["directory"]:
+        _start_flusher()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+atexit.register(flush)
+
+
+def collect():
+    """{name: {label values tuple: value}} summed over all processes"""
+    snapshots = []
+    directory = _settings["directory"]
+    if directory:
+        flush()
+        for path in glob.glob(os.path.join(directory, "metrics-*.json")):
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # being replaced right now; next scrape gets it
+    else:
+        snapshots.append(_snapshot())
+
+    totals = {name: {} for name in _metrics}
+    for snapshot in snapshots:
+        for name, values in snapshot.items():
+            metric = _metrics.get(name)
+            if metric is None:
+                continue  # written by an older version of this module
+            for key, value in values:
+                key = tuple(key)
+                totals[name][key] = metric.merge(totals[name].get(key), value)
+    return totals
+
+
+# ---------------- exposition ----------------
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def gauge_lines(name, help, samples):
+    """Exposition lines for a gauge; samples = [(labels dict, value)]"""
+    lines = [f"# HELP {PREFIX}{name} {help}", f"# TYPE {PREFIX}{name} gauge"]
+    for labels, value in samples:
+        if value is None:
+            continue
+        lines.append(f"{PREFIX}{name}{_labels(labels.keys(), labels.values())} {_number(value)}")
+    return lines
+
+
+def render(gauges=()):
+    """The /metrics body; gauges = extra lines from gauge_lines()"""
+    totals = collect()
+    lines = []
+    for name, metric in _metrics.items():
+        lines.append(f"# HELP {name} {metric.help}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        for key, value in sorted(totals[name].items()):
+            if metric.kind == "counter":
+                lines.append(f"{name}{_labels(metric.labels, key)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + ("+Inf",), value[:-1]):
+                cumulative += count
+                le = ("le", bound if bound == "+Inf" else _number(float(bound)))
+                lines.append(f"{name}_bucket{_labels(metric.labels, key, [le])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(metric.labels, key)} {_number(value[-1])}")
+            lines.append(f"{name}_count{_labels(metric.labels, key)} {cumulative}")
+    lines.extend(gauges)
+    return "\n".join(lines) + "\n"
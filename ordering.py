@@ -0,0 +1,319 @@
+from contextlib import contextmanager
+
+
+# ------------------ Task order keys ------------------
+#
+# Tasks are ordered by a string key (tasks.order_key, compared with
+# COLLATE "C") instead of a float. A new key can always be generated
+# strictly between any two existing keys, so inserting anywhere touches
+# one row and never runs out of precision. Keys follow the usual
+# fractional-indexing layout: a variable-length "integer" head that makes
+# appends at either end cheap, plus a base-62 fractional tail used for
+# inserts in the middle.
+
+DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+INTEGER_ZERO = "a0"
+SMALLEST_INTEGER = "A" + DIGITS[0] * 26
+
+# Keys longer than this trigger a background rebalance of the day
+MAX_KEY_LENGTH = 32
+
+
+def _midpoint(a, b):
+    """Fractional string strictly between a and b (b=None means 1.0)"""
+    zero = DIGITS[0]
+    if b is not None and a >= b:
+        raise ValueError(f"{a!r} >= {b!r}")
+    if a[-1:] == zero or (b and b[-1:] == zero):
+        raise ValueError("trailing zero")
+
+    if b:
+        n = 0
+        while (a[n] if n < len(a) else zero) == b[n]:
+            n += 1
+        if n > 0:
+            return b[:n] + _midpoint(a[n:], b[n:])
+
+    digit_a = DIGITS.index(a[0]) if a else 0
+    digit_b = DIGITS.index(b[0]) if b is not None else len(DIGITS)
+    if digit_b - digit_a > 1:
+        return DIGITS[(digit_a + digit_b + 1) // 2]
+    if b and len(b) > 1:
+        return b[:1]
+    return DIGITS[digit_a] + _midpoint(a[1:], None)
+
+
+def _integer_length(head):
+    if "a" <= head <= "z":
+        return ord(head) - ord("a") + 2
+    if "A" <= head <= "Z":
+        return ord("Z") - ord(head) + 2
+    raise ValueError(f"invalid order key head: {head!r}")
+
+
+def _integer_part(key):
+    length = _integer_length(key[0])
+    if length > len(key):
+        raise ValueError(f"invalid order key: {key!r}")
+    return key[:length]
+
+
+def _validate(key):
+    if key == SMALLEST_INTEGER:
+        raise ValueError(f"invalid order key: {key!r}")
+    integer = _integer_part(key)
+    if key[len(integer):][-1:] == DIGITS[0]:
+        raise ValueError(f"invalid order key: {key!r}")
+
+
+def _increment_integer(x):
+    head, digs = x[0], list(x[1:])
+    carry = True
+    for i in reversed(range(len(digs))):
+        d = DIGITS.index(digs[i]) + 1
+        if d == len(DIGITS):
+            digs[i] = DIGITS[0]
+        else:
+            digs[i] = DIGITS[d]
+            carry = False
+            break
+    if not carry:
+        return head + "".join(digs)
+    if head == "Z":
+        return "a" + DIGITS[0]
+    if head == "z":
+        return None
+    head = chr(ord(head) + 1)
+    if head > "a":
+        digs.append(DIGITS[0])
+    else:
+        digs.pop()
+    return head + "".join(digs)
+
+
+def _decrement_integer(x):
+    head, digs = x[0], list(x[1:])
+    borrow = True
+    for i in reversed(range(len(digs))):
+        d = DIGITS.index(digs[i]) - 1
+        if d == -1:
+            digs[i] = DIGITS[-1]
+        else:
+            digs[i] = DIGITS[d]
+            borrow = False
+            break
+    if not borrow:
+        return head + "".join(digs)
+    if head == "a":
+        return "Z" + DIGITS[-1]
+    if head == "A":
+        return None
+    head = chr(ord(head) - 1)
+    if head < "Z":
+        digs.append(DIGITS[-1])
+    else:
+        digs.pop()
+    return head + "".join(digs)
+
+
+def key_between(a, b):
+    """
+    Order key strictly between a and b. Either bound may be None to mean
+    "before everything" / "after everything".
+    """
+    if a is not None:
+        _validate(a)
+    if b is not None:
+        _validate(b)
+    if a is not None and b is not None and a >= b:
+        raise ValueError(f"{a!r} >= {b!r}")
+
+    if a is None:
+        if b is None:
+            return INTEGER_ZERO
+        int_b = _integer_part(b)
+        if int_b == SMALLEST_INTEGER:
+            return int_b + _midpoint("", b[len(int_b):])
+        if int_b < b:
+            return int_b
+        key = _decrement_integer(int_b)
+        if key is None:
+            raise ValueError("cannot decrement any more")
+        return key
+
+    int_a = _integer_part(a)
+    frac_a = a[len(int_a):]
+
+    if b is None:
+        key = _increment_integer(int_a)
+        return int_a + _midpoint(frac_a, None) if key is None else key
+
+    int_b = _integer_part(b)
+    if int_a == int_b:
+        return int_a + _midpoint(frac_a, b[len(int_b):])
+    key = _increment_integer(int_a)
+    if key is None:
+        raise ValueError("cannot increment any more")
+    if key < b:
+        return key
+    return int_a + _midpoint(frac_a, None)
+
+
+def keys_between(a, b, n):
+    """n ascending keys between a and b, spread out to keep them short"""
+    if n <= 0:
+        return []
+    if n == 1:
+        return [key_between(a, b)]
+    if b is None:
+        keys = [key_between(a, None)]
+        for _ in range(n - 1):
+            keys.append(key_between(keys[-1], None))
+        return keys
+    if a is None:
+        keys = [key_between(None, b)]
+        for _ in range(n - 1):
+            keys.append(key_between(None, keys[-1]))
+        keys.reverse()
+        return keys
+    mid = n // 2
+    c = key_between(a, b)
+    return keys_between(a, c, mid) + [c] + keys_between(c, b, n - mid - 1)
+
+
+# ------------------ DB helpers ------------------
+#
+# Allocating a key reads the neighbouring keys and then writes, so two
+# inserts at the same spot, or an insert racing a reorder/rebalance, could
+# otherwise compute the same key from the same snapshot. Everything that
+# reads keys in order to write one runs inside locked_day(), which holds
+# the day's row lock (SELECT ... FOR UPDATE) for one transaction and
+# serialises key allocation per day. Other days are not blocked.
+
+@contextmanager
+def locked_day(conn, day_id):
+    """Run the block in one transaction holding the day's order lock"""
+    autocommit = conn.autocommit
+    conn.autocommit = False
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM days WHERE id = %s FOR UPDATE", (day_id,))
+        cur.close()
+        yield
+        conn.commit()
+    except BaseException:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        if not conn.closed:
+            conn.autocommit = autocommit
+
+
+def neighbour_key(conn, day_id, order_key, pos):
+    """Key of the task right before/after order_key on the same day"""
+    cur = conn.cursor()
+    if pos == "before":
+        cur.execute("""
+            SELECT order_key FROM tasks
+            WHERE day_id = %s AND order_key < %s
+            ORDER BY order_key DESC
+            LIMIT 1
+        """, (day_id, order_key))
+    else:
+        cur.execute("""
+            SELECT order_key FROM tasks
+            WHERE day_id = %s AND order_key > %s
+            ORDER BY order_key ASC
+            LIMIT 1
+        """, (day_id, order_key))
+    row = cur.fetchone()
+    cur.close()
+    return row["order_key"] if row else None
+
+
+def key_for_insert(conn, day_id, ref_task_id, pos):
+    """
+    Key for a new task placed before/after ref_task_id. Reads the
+    reference key itself, so call it inside locked_day() to see keys a
+    concurrent rebalance may just have rewritten.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT order_key FROM tasks WHERE id = %s", (ref_task_id,))
+    ref_key = cur.fetchone()["order_key"]
+    cur.close()
+    other = neighbour_key(conn, day_id, ref_key, pos)
+    if pos == "before":
+        return key_between(other, ref_key)
+    return key_between(ref_key, other)
+
+
+def last_key(conn, day_id):
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT MAX(order_key) AS max_key FROM tasks WHERE day_id = %s
+    """, (day_id,))
+    row = cur.fetchone()
+    cur.close()
+    return row["max_key"] if row else None
+
+
+def apply_order(conn, day_id, task_ids):
+    """
+    Give task_ids fresh, evenly spaced keys in the given order using a
+    single UPDATE. Tasks of the day that are not listed keep their old key,
+    so callers pass the whole day.
+    """
+    from psycopg2.extras import execute_values
+
+    if not task_ids:
+        return 0
+    keys = keys_between(None, None, len(task_ids))
+    cur = conn.cursor()
+    execute_values(cur, """
+        UPDATE tasks SET order_key = v.order_key
+        FROM (VALUES %s) AS v(id, day_id, order_key)
+        WHERE tasks.id = v.id::uuid AND tasks.day_id = v.day_id::uuid
+    """, [(task_id, day_id, key) for task_id, key in zip(task_ids, keys)],
+        page_size=len(task_ids))
+    updated = cur.rowcount
+    cur.close()
+    return updated
+
+
+def rebalance_day(conn, day_id):
+    """Re-key every task of a day in its current order"""
+    with locked_day(conn, day_id):
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT id FROM tasks
+            WHERE day_id = %s
+            ORDER BY order_key ASC, created_at ASC, id ASC
+        """, (day_id,))
+        task_ids = [row["id"] for row in cur.fetchall()]
+        cur.close()
+        apply_order(conn, day_id, task_ids)
+
+
+def backfill_order_keys(conn):
+    """Assign keys to tasks created before order_key existed"""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT DISTINCT day_id FROM tasks WHERE order_key IS NULL
+    """)
+    day_ids = [row["day_id"] for row in cur.fetchall()]
+    cur.close()
+
+    for day_id in day_ids:
+        with locked_day(conn, day_id):
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT id FROM tasks
+                WHERE day_id = %s
+                ORDER BY order_index ASC NULLS LAST, created_at ASC
+            """, (day_id,))
+            task_ids = [row["id"] for row in cur.fetchall()]
+            cur.close()
+            apply_order(conn, day_id, task_ids)
+
+    return len(day_ids)
@@ -0,0 +1,202 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+# ------------------ Password hashing ------------------
+#
+# Passwords are stored as
+#
+#     scrypt$<log2 N>$<r>$<p>$<salt>$<key>        (salt/key: base64)
+#
+# Rows from before hashing hold the plain password. They still verify
+# (constant-time compare) and are rehashed on the next successful login,
+# as are hashes made with older cost settings.
+#
+# scrypt is deliberately slow, so it runs on a small thread pool
+# (hashlib releases the GIL while it works): a login storm queues for
+# PASSWORD_HASH_THREADS cores instead of pinning every request thread.
+# Once PASSWORD_HASH_QUEUE hashes are already waiting, new ones fail
+# fast with PasswordHasherBusy rather than piling up.
+#
+# Pick the cost with `flask --app app calibrate-passwords`: it times
+# each N on this machine and suggests the largest within a budget.
+
+SCHEME = "scrypt"
+DEFAULT_LOG2_N = 15
+DEFAULT_R = 8
+DEFAULT_P = 1
+DEFAULT_QUEUE = 64
+SALT_BYTES = 16
+KEY_BYTES = 32
+MAX_LOG2_N = 20
+
+
+class PasswordHasherBusy(Exception):
+    """Too many hashes already queued; ask the user to retry"""
+
+
+_settings = {
+    "log2_n": DEFAULT_LOG2_N,
+    "r": DEFAULT_R,
+    "p": DEFAULT_P,
+    "threads": os.cpu_count() or 1,
+    "queue": DEFAULT_QUEUE,
+}
+_lock = threading.Lock()
+_pool = None
+_slots = None
+
+
+def configure(log2_n=DEFAULT_LOG2_N, r=DEFAULT_R, p=DEFAULT_P, threads=None, queue=DEFAULT_QUEUE):
+    global _pool, _slots
+    with _lock:
+        _settings.update(log2_n=log2_n, r=r, p=p, threads=threads or os.cpu_count() or 1,
+                         queue=queue)
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+        _slots = None
+
+
+def _reset_after_fork():
+    # The pool's threads don't survive a fork; the child builds its own
+    global _pool, _slots, _lock
+    _lock = threading.Lock()
+    _pool = None
+    _slots = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def hash_threads():
+    return _settings["threads"]
+
+
+def _run(fn, *args):
+    """fn(*args) on the hashing pool; raises PasswordHasherBusy when full"""
+    global _pool, _slots
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=_settings["threads"],
+                                       thread_name_prefix="password-hash")
+            _slots = threading.BoundedSemaphore(_settings["threads"] + _settings["queue"])
+        pool, slots = _pool, _slots
+
+    if not slots.acquire(blocking=False):
+        raise PasswordHasherBusy()
+
+    def call():
+        # Free the slot before the result is handed back to the caller
+        try:
+            return fn(*args)
+        finally:
+            slots.release()
+
+    try:
+        future = pool.submit(call)
+    except BaseException:
+        slots.release()
+        raise
+    return future.result()
+
+
+def _scrypt(password, salt, log2_n, r, p):
+    n = 1 << log2_n
+    return hashlib.scrypt(
+        password.encode(), salt=salt, n=n, r=r, p=p, dklen=KEY_BYTES,
+        maxmem=min(256 * r * (n + p), 2**31 - 1),
+    )
+
+
+def _b64(raw):
+    return base64.b64encode(raw).decode().rstrip("=")
+
+
+def _unb64(text):
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def _encode(password, salt, log2_n, r, p):
+    key = _scrypt(password, salt, log2_n, r, p)
+    return f"{SCHEME}${log2_n}${r}${p}${_b64(salt)}${_b64(key)}"
+
+
+def hash_password(password):
+    salt = secrets.token_bytes(SALT_BYTES)
+    return _run(_encode, password, salt, _settings["log2_n"], _settings["r"], _settings["p"])
+
+
+def _parse(stored):
+    """(log2_n, r, p, salt, key), or None for a legacy plain-text value"""
+    parts = (stored or "").split("$")
+    if len(parts) != 6 or parts[0] != SCHEME:
+        return None
+    try:
+        return int(parts[1]), int(parts[2]), int(parts[3]), _unb64(parts[4]), _unb64(parts[5])
+    except ValueError:
+        return None
+
+
+def needs_rehash(stored):
+    parsed = _parse(stored)
+    if parsed is None:
+        return True
+    log2_n, r, p, _, _ = parsed
+    return (log2_n, r, p) != (_settings["log2_n"], _settings["r"], _settings["p"])
+
+
+def verify_password(stored, password):
+    """
+    (matches, needs_rehash). needs_rehash is only ever True for a match:
+    the caller should then store hash_password(password).
+    """
+    if stored is None or password is None:
+        return False, False
+
+    parsed = _parse(stored)
+    if parsed is None:
+        # Legacy row: the column holds the password itself
+        matches = hmac.compare_digest(stored.encode(), password.encode())
+        return matches, matches
+
+    log2_n, r, p, salt, key = parsed
+    if log2_n > MAX_LOG2_N:
+        return False, False
+    candidate = _run(_scrypt, password, salt, log2_n, r, p)
+    matches = hmac.compare_digest(candidate, key)
+    return matches, matches and needs_rehash(stored)
+
+
+# ---------------- calibration ----------------
+
+def time_hash(log2_n, r=DEFAULT_R, p=DEFAULT_P, runs=3):
+    """Median milliseconds for one hash at this cost, on this machine"""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        _scrypt("calibration", b"\0" * SALT_BYTES, log2_n, r, p)
+        timings.append((time.perf_counter() - started) * 1000)
+    return sorted(timings)[len(timings) // 2]
+
+
+def calibrate(target_ms, r=DEFAULT_R, p=DEFAULT_P, min_log2_n=12, max_log2_n=MAX_LOG2_N):
+    """
+    ([(log2_n, ms)], chosen log2_n): the largest N whose hash fits in
+    target_ms, never below min_log2_n.
+    """
+    results = []
+    chosen = min_log2_n
+    for log2_n in range(min_log2_n, max_log2_n + 1):
+        ms = time_hash(log2_n, r, p)
+        results.append((log2_n, ms))
+        if ms > target_ms:
+            break
+        chosen = log2_n
+    return results, chosen
@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+from app_logging import get_logger
+
+log = get_logger("rate_limit")
+
+
+# ------------------ Sign-in rate limiter ------------------
+#
+# /login, /register and /forgot are throttled with token buckets, one
+# per client IP and one per username, shared by the three forms so an
+# attacker can't alternate between them. A bucket holds up to `burst`
+# tokens and refills at `per_minute`; each attempt takes a token, and an
+# empty bucket turns the attempt away (429 + Retry-After) before the
+# route runs, so a credential-stuffing burst never reaches the database.
+#
+# Buckets live in worker memory (an LRU of the most recently seen keys)
+# unless RATE_LIMIT_REDIS_URL is set, in which case every worker shares
+# them through one Lua script per attempt. If Redis is unreachable the
+# worker falls back to its own buckets rather than letting everyone in.
+
+DEFAULT_MAX_KEYS = 100_000
+DEFAULT_IP_BURST = 30
+DEFAULT_IP_PER_MINUTE = 30
+DEFAULT_USER_BURST = 10
+DEFAULT_USER_PER_MINUTE = 5
+MAX_USERNAME_KEY = 64
+
+
+# ---------------- backends ----------------
+
+class LocalBackend:
+    def __init__(self, max_keys=DEFAULT_MAX_KEYS, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()  # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    def take(self, key, burst, per_second):
+        """(allowed, seconds until a token is available)"""
+        with self._lock:
+            now = self.clock()
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * per_second)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (1 - tokens) / per_second
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+TAKE_TOKEN_LUA = """
+local burst = tonumber(ARGV[1])
+local per_second = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + (now - updated) * per_second)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / per_second) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisBackend:
+    """Buckets shared by every worker; the refill runs inside Redis"""
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_REDIS_URL is set but redis is not installed")
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self.script = self.client.register_script(TAKE_TOKEN_LUA)
+
+    def take(self, key, burst, per_second):
+        allowed, tokens = self.script(keys=[key], args=[burst, per_second])
+        allowed = bool(int(allowed))
+        return allowed, 0.0 if allowed else (1 - float(tokens)) / per_second
+
+
+class RateLimiter:
+    def __init__(self):
+        self.local = LocalBackend()
+        self.shared = None
+        self.limits = {}
+        self.proxy_hops = 0
+        self.configure()
+
+    def configure(self, ip_burst=DEFAULT_IP_BURST, ip_per_minute=DEFAULT_IP_PER_MINUTE,
+                  user_burst=DEFAULT_USER_BURST, user_per_minute=DEFAULT_USER_PER_MINUTE,
+                  redis_url=None, proxy_hops=0, max_keys=DEFAULT_MAX_KEYS):
+        # per_minute 0 turns that bucket off
+        self.limits = {"ip": (ip_burst, ip_per_minute), "user": (user_burst, user_per_minute)}
+        self.local = LocalBackend(max_keys)
+        self.shared = RedisBackend(redis_url) if redis_url else None
+        self.proxy_hops = proxy_hops
+
+    def client_ip(self, request):
+        """
+        The caller's address. Behind proxy_hops trusted proxies it's the
+        X-Forwarded-For entry the outermost one added; anything further
+        left was written by the client and can't be trusted.
+        """
+        if self.proxy_hops:
+            forwarded = [part.strip() for part in request.headers.get("X-Forwarded-For", "").split(",")]
+            if len(forwarded) >= self.proxy_hops and forwarded[-self.proxy_hops]:
+                return forwarded[-self.proxy_hops]
+        return request.remote_addr
+
+    def _take(self, key, burst, per_second):
+        if self.shared is not None:
+            try:
+                return self.shared.take(key, burst, per_second)
+            except Exception:
+                log.warning("rate_limit_shared_failed", exc_info=True)
+        return self.local.take(key, burst, per_second)
+
+    def check(self, action, ip, username):
+        """None if the attempt may go ahead, else seconds to wait"""
+        keys = {
+            "ip": ip,
+            "user": (username or "").strip().lower()[:MAX_USERNAME_KEY],
+        }
+        for kind, value in keys.items():
+            burst, per_minute = self.limits[kind]
+            if not value or per_minute <= 0:
+                continue
+            allowed, wait = self._take(f"ratelimit:{kind}:{value}", burst, per_minute / 60)
+            if not allowed:
+                metrics.rate_limited.inc(action=action, key=kind)
+                return wait
+        return None
+
+    def stats(self):
+        return {
+            "buckets": len(self.local),
+            "shared": self.shared is not None,
+        }
+
+
+rate_limiter = RateLimiter()
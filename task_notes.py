@@ -0,0 +1,263 @@
+import difflib
+import json
+from datetime import datetime, timedelta
+
+from ids import new_id
+
+
+# ------------------ Task notes history ------------------
+#
+# task_notes holds the current text of a task's note and its revision
+# number. task_note_history keeps every revision, but only every
+# SNAPSHOT_INTERVAL-th one (or one whose delta isn't worth it) stores the
+# full text; the rest store a line-level delta from the revision before.
+# Rebuilding any revision reads the nearest snapshot at or before it plus
+# at most SNAPSHOT_INTERVAL - 1 deltas.
+#
+# Saves by the same editor less than DEBOUNCE_SECONDS after their last
+# one rewrite that revision instead of adding one, so autosave bursts
+# leave a single history row.
+#
+# Writes are compare-and-set on the text the editor started from: a save
+# that lost a race updates nothing and is retried against the new text.
+#
+# Delta format (JSON list), applied left to right over the base text:
+#   n > 0   copy the next n characters
+#   n < 0   skip the next -n characters
+#   "text"  insert text
+
+SNAPSHOT_INTERVAL = 16
+DEBOUNCE_SECONDS = 30
+HISTORY_LIMIT = 20
+SAVE_ATTEMPTS = 3
+
+
+def make_delta(old, new):
+    a = old.splitlines(keepends=True)
+    b = new.splitlines(keepends=True)
+    delta = []
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            delta.append(sum(len(line) for line in a[i1:i2]))
+            continue
+        if tag in ("delete", "replace"):
+            delta.append(-sum(len(line) for line in a[i1:i2]))
+        if tag in ("insert", "replace"):
+            delta.append("".join(b[j1:j2]))
+    return delta
+
+
+def apply_delta(base, delta):
+    out = []
+    pos = 0
+    for op in delta:
+        if isinstance(op, str):
+            out.append(op)
+        elif op > 0:
+            out.append(base[pos:pos + op])
+            pos += op
+        else:
+            pos -= op
+    return "".join(out)
+
+
+def encode_revision(revision, old, new):
+    """(text, delta) columns for a history row taking old to new"""
+    if revision % SNAPSHOT_INTERVAL == 1 or old is None:
+        return new, None
+    delta = json.dumps(make_delta(old, new), separators=(",", ":"))
+    # A delta that rewrites most of the note is no cheaper than the text
+    if len(delta) >= len(new) // 2 + 16:
+        return new, None
+    return None, delta
+
+
+def replay(rows):
+    """{revision: text} for consecutive history rows starting at a snapshot"""
+    texts = {}
+    text = None
+    for row in rows:
+        if row["text"] is not None:
+            text = row["text"]
+        else:
+            text = apply_delta(text, json.loads(row["delta"]))
+        texts[row["revision"]] = text
+    return texts
+
+
+# ---------------- queries ----------------
+
+NOTE_SQL = """
+    SELECT n.*, h.edited_by AS last_edited_by, h.edited_at AS last_edited_at
+    FROM task_notes n
+    LEFT JOIN task_note_history h
+        ON h.note_id = n.id AND h.revision = n.revision
+    WHERE n.task_id = %s
+"""
+
+# Rows from the last snapshot at or before `from_revision` up to `to_revision`
+HISTORY_RANGE_SQL = """
+    SELECT h.revision, h.text, h.delta, h.edited_by, h.edited_at, u.name AS editor_name
+    FROM task_note_history h
+    LEFT JOIN users u ON u.id = h.edited_by
+    WHERE h.note_id = %(note_id)s
+    AND h.revision <= %(to_revision)s
+    AND h.revision >= COALESCE((
+        SELECT MAX(revision) FROM task_note_history
+        WHERE note_id = %(note_id)s
+        AND revision <= %(from_revision)s
+        AND text IS NOT NULL
+    ), 1)
+    ORDER BY h.revision
+"""
+
+CREATE_NOTE_SQL = """
+    WITH note AS (
+        INSERT INTO task_notes (id, task_id, current_text, revision, updated_at)
+        VALUES (%(note_id)s, %(task_id)s, %(text)s, 1, %(now)s)
+        ON CONFLICT (task_id) DO NOTHING
+        RETURNING id
+    )
+    INSERT INTO task_note_history (id, note_id, revision, text, delta, edited_by, edited_at)
+    SELECT %(history_id)s, id, 1, %(text)s, NULL, %(user_id)s, %(now)s FROM note
+    RETURNING revision
+"""
+
+APPEND_REVISION_SQL = """
+    WITH note AS (
+        UPDATE task_notes
+        SET current_text = %(text)s, revision = revision + 1, updated_at = %(now)s
+        WHERE id = %(note_id)s AND revision = %(base_revision)s
+        AND current_text IS NOT DISTINCT FROM %(base_text)s
+        RETURNING id, revision
+    )
+    INSERT INTO task_note_history (id, note_id, revision, text, delta, edited_by, edited_at)
+    SELECT %(history_id)s, id, revision, %(snapshot)s, %(delta)s, %(user_id)s, %(now)s FROM note
+    RETURNING revision
+"""
+
+COALESCE_REVISION_SQL = """
+    WITH note AS (
+        UPDATE task_notes
+        SET current_text = %(text)s, updated_at = %(now)s
+        WHERE id = %(note_id)s AND revision = %(base_revision)s
+        AND current_text IS NOT DISTINCT FROM %(base_text)s
+        RETURNING id, revision
+    )
+    UPDATE task_note_history h
+    SET text = %(snapshot)s, delta = %(delta)s, edited_at = %(now)s
+    FROM note
+    WHERE h.note_id = note.id AND h.revision = note.revision
+    RETURNING h.revision
+"""
+
+
+def get_note(conn, task_id):
+    cur = conn.cursor()
+    cur.execute(NOTE_SQL, (task_id,))
+    note = cur.fetchone()
+    cur.close()
+    return note
+
+
+def history_rows(conn, note_id, from_revision, to_revision):
+    cur = conn.cursor()
+    cur.execute(HISTORY_RANGE_SQL, {
+        "note_id": note_id,
+        "from_revision": from_revision,
+        "to_revision": to_revision,
+    })
+    rows = cur.fetchall()
+    cur.close()
+    return rows
+
+
+def note_revision(conn, note_id, revision):
+    """Text of one revision, or None if it doesn't exist"""
+    return replay(history_rows(conn, note_id, revision, revision)).get(revision)
+
+
+def note_history(conn, note, limit=HISTORY_LIMIT):
+    """Newest `limit` revisions with their full text, newest first"""
+    if not note or not note["revision"]:
+        return []
+    oldest = max(1, note["revision"] - limit + 1)
+    rows = history_rows(conn, note["id"], oldest, note["revision"])
+    texts = replay(rows)
+    return [
+        {
+            "revision": row["revision"],
+            "text": texts[row["revision"]],
+            "edited_by": row["editor_name"] or row["edited_by"],
+            "edited_at": row["edited_at"],
+        }
+        for row in reversed(rows)
+        if row["revision"] >= oldest
+    ]
+
+
+def should_coalesce(note, user_id, now):
+    if note["revision"] <= 1 or note["last_edited_by"] != user_id:
+        return False
+    last = note["last_edited_at"]
+    return last is not None and now - last < timedelta(seconds=DEBOUNCE_SECONDS)
+
+
+def save_note(conn, task_id, user_id, text, now=None):
+    """
+    Save a new text for the task's note. Returns the revision written, or
+    None when the text is unchanged.
+    """
+    now = now or datetime.now()
+    cur = conn.cursor()
+    try:
+        for _ in range(SAVE_ATTEMPTS):
+            note = get_note(conn, task_id)
+
+            if note is None:
+                cur.execute(CREATE_NOTE_SQL, {
+                    "note_id": new_id(),
+                    "history_id": new_id(),
+                    "task_id": task_id,
+                    "text": text,
+                    "user_id": user_id,
+                    "now": now,
+                })
+            elif note["current_text"] == text:
+                return None
+            elif should_coalesce(note, user_id, now):
+                # Rewrite the latest revision as a delta from the one before
+                revision = note["revision"]
+                previous = note_revision(conn, note["id"], revision - 1)
+                snapshot, delta = encode_revision(revision, previous, text)
+                cur.execute(COALESCE_REVISION_SQL, {
+                    "note_id": note["id"],
+                    "base_revision": revision,
+                    "base_text": note["current_text"],
+                    "text": text,
+                    "snapshot": snapshot,
+                    "delta": delta,
+                    "now": now,
+                })
+            else:
+                revision = note["revision"] + 1
+                snapshot, delta = encode_revision(revision, note["current_text"] or "", text)
+                cur.execute(APPEND_REVISION_SQL, {
+                    "note_id": note["id"],
+                    "history_id": new_id(),
+                    "base_revision": note["revision"],
+                    "base_text": note["current_text"],
+                    "text": text,
+                    "snapshot": snapshot,
+                    "delta": delta,
+                    "user_id": user_id,
+                    "now": now,
+                })
+
+            row = cur.fetchone()
+            if row:
+                return row["revision"]
+    finally:
+        cur.close()
+    raise RuntimeError("Note changed during save; try again")
@@ -0,0 +1,252 @@
+from datetime import datetime
+
+from ids import new_id
+
+
+# ------------------ Task status event log ------------------
+#
+# task_status_events is append-only and ordered by a monotonic `seq`.
+# task_status_current holds the compacted state: the latest event per
+# (task, user). Every write appends to the log and folds into the current
+# state in the same statement, so readers never have to scan the log.
+#
+# Status is tracked per member. A RESET event clears only the state of
+# the member who logged it. Group progress is rolled up from the members
+# required by task_assignments (every trip member when a task has none).
+
+STATUSES = ("YES", "NO", "SKIPPED")
+RESET = "RESET"
+
+
+RECORD_STATUS_SQL = """
+    WITH ev AS (
+        INSERT INTO task_status_events
+        (id, task_id, user_id, status, responded_at)
+        VALUES (%s, %s, %s, %s, %s)
+        RETURNING task_id, user_id, status, responded_at, seq
+    )
+    INSERT INTO task_status_current
+    (task_id, user_id, status, responded_at, seq)
+    SELECT task_id, user_id, status, responded_at, seq FROM ev
+    ON CONFLICT (task_id, user_id) DO UPDATE
+    SET status = EXCLUDED.status,
+        responded_at = EXCLUDED.responded_at,
+        seq = EXCLUDED.seq
+    WHERE task_status_current.seq < EXCLUDED.seq
+"""
+
+RESET_STATUS_SQL = """
+    WITH ev AS (
+        INSERT INTO task_status_events
+        (id, task_id, user_id, status, responded_at)
+        VALUES (%s, %s, %s, %s, %s)
+        RETURNING task_id, user_id
+    )
+    DELETE FROM task_status_current c
+    USING ev
+    WHERE c.task_id = ev.task_id AND c.user_id = ev.user_id
+"""
+
+# Each trip member of each task in scope, with their current status and
+# whether the task needs them. {task_filter} narrows `tasks t`.
+MEMBER_ROWS_SQL = """
+    scoped_tasks AS (
+        SELECT t.id, t.trip_id,
+            EXISTS (
+                SELECT 1 FROM task_assignments x WHERE x.task_id = t.id
+            ) AS has_assignments
+        FROM tasks t
+        WHERE (t.is_deleted IS NULL OR t.is_deleted = false)
+        {task_filter}
+    ),
+    member_rows AS (
+        SELECT st.id AS task_id, m.user_id, c.status,
+            CASE WHEN st.has_assignments
+                 THEN COALESCE(a.required, false)
+                 ELSE true END AS required
+        FROM scoped_tasks st
+        JOIN trip_members m ON m.trip_id = st.trip_id
+        LEFT JOIN task_assignments a
+            ON a.task_id = st.id AND a.user_id = m.user_id
+        LEFT JOIN task_status_current c
+            ON c.task_id = st.id AND c.user_id = m.user_id
+    )
+"""
+
+DAY_MEMBER_STATUSES_SQL = f"""
+    WITH {MEMBER_ROWS_SQL.format(task_filter="AND t.day_id = %s")}
+    SELECT task_id,
+        COALESCE(
+            jsonb_object_agg(user_id, status)
+                FILTER (WHERE status IS NOT NULL),
+            '{{}}'::jsonb
+        ) AS members,
+        COALESCE(
+            jsonb_agg(user_id) FILTER (WHERE required), '[]'::jsonb
+        ) AS required_members,
+        COUNT(*) FILTER (WHERE required) AS required,
+        COUNT(*) FILTER (WHERE required AND status = 'YES') AS yes,
+        COUNT(*) FILTER (WHERE required AND status = 'NO') AS no,
+        COUNT(*) FILTER (WHERE required AND status = 'SKIPPED') AS skipped
+    FROM member_rows
+    GROUP BY task_id
+"""
+
+# Tasks in scope counted by group status, the rollup group_status() makes
+# of one task: complete (or skipped) once every required member says so.
+# {task_filter} uses the columns of tasks unqualified.
+TASK_COMPLETION_SQL = """
+    WITH {member_rows},
+    task_rollup AS (
+        SELECT task_id,
+            COUNT(*) FILTER (WHERE required) AS required,
+            COUNT(*) FILTER (WHERE required AND status = 'YES') AS yes,
+            COUNT(*) FILTER (WHERE required AND status = 'SKIPPED') AS skipped
+        FROM member_rows
+        GROUP BY task_id
+    )
+    SELECT
+        (SELECT COUNT(*) FROM scoped_tasks) AS total,
+        COUNT(*) FILTER (WHERE required > 0 AND yes = required) AS completed,
+        COUNT(*) FILTER (WHERE required > 0 AND skipped = required) AS skipped
+    FROM task_rollup
+"""
+
+
+def task_completion_sql(task_filter=""):
+    return TASK_COMPLETION_SQL.format(member_rows=MEMBER_ROWS_SQL.format(task_filter=task_filter))
+
+def _event_params(task_id, user_id, status, responded_at=None):
+    return (
+        new_id(),
+        task_id,
+        user_id,
+        status,
+        responded_at or datetime.now().isoformat()
+    )
+
+
+def record_status(conn, task_id, user_id, status, responded_at=None):
+    """Append a status event and fold it into task_status_current"""
+    cur = conn.cursor()
+    cur.execute(
+        RECORD_STATUS_SQL,
+        _event_params(task_id, user_id, status, responded_at)
+    )
+    cur.close()
+
+
+def reset_status(conn, task_id, user_id):
+    """Append a RESET event and clear this member's current state"""
+    cur = conn.cursor()
+    cur.execute(RESET_STATUS_SQL, _event_params(task_id, user_id, RESET))
+    cur.close()
+
+
+def day_member_statuses(conn, day_id):
+    """
+    Every member's status plus the group rollup for all tasks of a day,
+    in one query returning one row per task:
+
+    {task_id: {"members": {user_id: status}, "required_members",
+               "required", "yes", "no", "skipped", "pending", "status"}}
+
+    Joins go through the (trip_id, user_id), (task_id, user_id) primary
+    keys, so cost grows with tasks x members of this day only.
+    """
+    cur = conn.cursor()
+    cur.execute(DAY_MEMBER_STATUSES_SQL, (day_id,))
+    rows = cur.fetchall()
+    cur.close()
+    return rollup_rows(rows)
+
+
+# Async variants for the ASGI serving mode (psycopg 3 AsyncConnection)
+
+async def arecord_status(aconn, task_id, user_id, status, responded_at=None):
+    await aconn.execute(
+        RECORD_STATUS_SQL,
+        _event_params(task_id, user_id, status, responded_at)
+    )
+
+
+async def areset_status(aconn, task_id, user_id):
+    await aconn.execute(RESET_STATUS_SQL, _event_params(task_id, user_id, RESET))
+
+
+async def aday_member_statuses(aconn, day_id):
+    cur = await aconn.execute(DAY_MEMBER_STATUSES_SQL, (day_id,))
+    return rollup_rows(await cur.fetchall())
+
+
+def rollup_rows(rows):
+    result = {}
+    for row in rows:
+        entry = dict(row)
+        entry["pending"] = max(
+            entry["required"] - entry["yes"] - entry["no"] - entry["skipped"], 0
+        )
+        entry["status"] = group_status(entry)
+        result[entry.pop("task_id")] = entry
+    return result
+
+
+def group_status(counts):
+    """YES/SKIPPED once every required member agrees, else None"""
+    required = counts["required"]
+    if not required:
+        return None
+    if counts["yes"] == required:
+        return "YES"
+    if counts["skipped"] == required:
+        return "SKIPPED"
+    return None
+
+
+def compact_events(conn, older_than_days):
+    """
+    Collapse superseded events older than N days into one summary row per
+    (task, user). The newest event of each pair is never touched, so
+    task_status_current stays valid. Returns the number of events removed.
+    """
+    cur = conn.cursor()
+    cur.execute("""
+        WITH old AS (
+            DELETE FROM task_status_events e
+            WHERE e.responded_at < NOW() - make_interval(days => %s)
+            AND e.status <> 'RESET'
+            AND EXISTS (
+                SELECT 1 FROM task_status_events newer
+                WHERE newer.task_id = e.task_id
+                AND newer.user_id = e.user_id
+                AND newer.seq > e.seq
+            )
+            RETURNING e.task_id, e.user_id, e.status, e.responded_at,
+                      e.seq, e.collapsed_count
+        ),
+        folded AS (
+            SELECT DISTINCT ON (task_id, user_id)
+                task_id, user_id, status, responded_at, seq,
+                SUM(COALESCE(collapsed_count, 1))
+                    OVER (PARTITION BY task_id, user_id) AS collapsed_count,
+                COUNT(*) OVER (PARTITION BY task_id, user_id) AS removed
+            FROM old
+            ORDER BY task_id, user_id, seq DESC
+        ),
+        summary AS (
+            INSERT INTO task_status_events
+            (id, task_id, user_id, status, responded_at, seq,
+             is_summary, collapsed_count)
+            SELECT uuid_v7(), task_id, user_id, status,
+                   responded_at, seq, true, collapsed_count
+            FROM folded
+            RETURNING 1
+        )
+        SELECT COALESCE(SUM(removed), 0) - (SELECT COUNT(*) FROM summary)
+               AS removed
+        FROM folded
+    """, (older_than_days,))
+    removed = cur.fetchone()["removed"]
+    cur.close()
+    conn.commit()
+    return removed
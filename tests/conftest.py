@@ -5,10 +5,168 @@ import pytest
 # Add project root (trip/) to Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from app import app as flask_app
+from app import create_app
 
 
 @pytest.fixture
 def app():
-    flask_app.config["TESTING"] = True
-    return flask_app
\ No newline at end of file
+    return create_app({"TESTING": True})
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+# ---------------- fake connection ----------------
+
+class FakeConnection:
+    """
+    Stands in for a psycopg2 connection and its cursor: records every
+    query and answers fetchall() with `rows` and each fetchone() with the
+    next of `one`.
+    """
+
+    def __init__(self, rows=(), one=()):
+        self.rows = list(rows)
+        self.one = list(one)
+        self.executed = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.one.pop(0)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_conn():
+    """Factory: fake_conn(rows=..., one=...)"""
+    return FakeConnection
+
+
+# ---------------- scratch database ----------------
+#
+# Tests that need Postgres take the `database` fixture and are skipped
+# unless TEST_DATABASE_URL points at a scratch database, e.g.
+#   TEST_DATABASE_URL=postgresql://localhost:5432/postgres
+
+@pytest.fixture(scope="session")
+def database():
+    url = os.environ.get("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL not set")
+
+    import db
+    db.configure(url=url, probe_interval=0)
+    db.init_db()
+    return db
+
+
+PARALLEL_CLICKS = 8
+
+
+@pytest.fixture
+def in_parallel(database):
+    """
+    Factory: in_parallel(fn) runs fn(conn) on PARALLEL_CLICKS connections
+    released at the same moment and returns the results.
+    """
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    def run(fn):
+        barrier = threading.Barrier(PARALLEL_CLICKS)
+
+        def click(_):
+            conn = database.connect()
+            try:
+                barrier.wait()
+                return fn(conn)
+            finally:
+                conn.close()
+
+        with ThreadPoolExecutor(PARALLEL_CLICKS) as pool:
+            return list(pool.map(click, range(PARALLEL_CLICKS)))
+
+    return run
+
+
+@pytest.fixture
+def make_trip(database):
+    """
+    Factory: make_trip(members=2) -> (trip_id, [user ids]), the first
+    user owning the trip. `join` adds existing users as members too.
+    Everything it created is deleted afterwards.
+    """
+    from datetime import datetime
+
+    import friend_graph
+    from ids import new_id
+
+    conn = database.connect()
+    trips, users = [], []
+
+    def make(members=2, join=(), created_at=None):
+        now = datetime.now().isoformat()
+        user_ids = [new_id() for _ in range(members)]
+        for user_id in user_ids:
+            friend_graph.create_user(conn, user_id, f"user-{user_id[-12:]}", "pw", now)
+        users.extend(user_ids)
+        user_ids += list(join)
+
+        trip_id = new_id()
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO trips (id, name, start_date, end_date, owner_id, created_at)
+            VALUES (%s, 'Test trip', '2026-05-01', '2026-05-03', %s, %s)
+        """, (trip_id, user_ids[0], created_at or now))
+        for i, user_id in enumerate(user_ids):
+            cur.execute("""
+                INSERT INTO trip_members (trip_id, user_id, role, joined_at)
+                VALUES (%s, %s, %s, now())
+            """, (trip_id, user_id, "owner" if i == 0 else "member"))
+        cur.close()
+        trips.append(trip_id)
+        return trip_id, user_ids
+
+    yield make
+
+    cur = conn.cursor()
+    for table in ("chat_messages", "chat_members"):
+        cur.execute(f"""
+            DELETE FROM {table} WHERE thread_id IN (
+                SELECT id FROM chat_threads WHERE trip_id = ANY(%s::uuid[])
+            )
+        """, (trips,))
+    cur.execute("DELETE FROM chat_threads WHERE trip_id = ANY(%s::uuid[])", (trips,))
+    cur.execute("""
+        DELETE FROM task_status_current WHERE task_id IN (
+            SELECT id FROM tasks WHERE trip_id = ANY(%s::uuid[])
+        )
+    """, (trips,))
+    cur.execute("""
+        DELETE FROM task_status_events WHERE task_id IN (
+            SELECT id FROM tasks WHERE trip_id = ANY(%s::uuid[])
+        )
+    """, (trips,))
+    cur.execute("""
+        DELETE FROM transport_group_members WHERE transport_group_id IN (
+            SELECT id FROM transport_groups WHERE trip_id = ANY(%s::uuid[])
+        )
+    """, (trips,))
+    for table in ("tasks", "days", "transport_groups", "trip_members"):
+        cur.execute(f"DELETE FROM {table} WHERE trip_id = ANY(%s::uuid[])", (trips,))
+    cur.execute("DELETE FROM trips WHERE id = ANY(%s::uuid[])", (trips,))
+    cur.execute("DELETE FROM users WHERE id = ANY(%s::uuid[])", (users,))
+    cur.close()
+    conn.close()
@@ -0,0 +1,54 @@
+import gzip
+import json
+
+import pytest
+from flask import jsonify
+
+import api
+
+
+def test_requires_login(client):
+    response = client.get("/api/v1/trips")
+    assert response.status_code == 401
+    assert response.get_json() == {"error": "Login required"}
+
+
+def test_cursor_round_trip(app):
+    cursor = api.encode_cursor(["2026-05-01T10:00:00", "trip-1"])
+    with app.test_request_context(f"/api/v1/trips?cursor={cursor}"):
+        assert api.decode_cursor(2) == ["2026-05-01T10:00:00", "trip-1"]
+
+    with app.test_request_context("/api/v1/trips?cursor=garbage"):
+        with pytest.raises(api.ApiError):
+            api.decode_cursor(2)
+
+
+def test_sparse_fields_are_validated(app):
+    with app.test_request_context("/api/v1/trips?fields=name,start_date"):
+        assert api.requested_fields(api.TRIP_FIELDS) == ["id", "name", "start_date"]
+
+    with app.test_request_context("/api/v1/trips?fields=name,password"):
+        with pytest.raises(api.ApiError) as e:
+            api.requested_fields(api.TRIP_FIELDS)
+        assert e.value.status == 400
+
+
+def test_select_list_adds_sort_columns_only():
+    assert api.select_list(["id", "title", "status"], ("order_key", "id"),
+                           api.TASK_FIELDS, "x") == "x.id, x.title, x.order_key"
+
+
+def test_large_bodies_are_gzipped(app):
+    payload = {"data": [{"id": str(i), "title": "Museum visit"} for i in range(100)]}
+    with app.test_request_context("/api/v1/trips", headers={"Accept-Encoding": "gzip"}):
+        response = api.compress(jsonify(payload))
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert json.loads(gzip.decompress(response.get_data())) == payload
+
+
+def test_small_bodies_are_left_alone(app):
+    with app.test_request_context("/api/v1/trips", headers={"Accept-Encoding": "gzip"}):
+        response = api.compress(jsonify({"data": []}))
+    assert "Content-Encoding" not in response.headers
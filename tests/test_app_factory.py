@@ -0,0 +1,49 @@
+import os
+import socket
+import subprocess
+import sys
+
+import pytest
+
+import db
+from app import create_app
+
+ROOT = os.path.dirname(os.path.abspath(db.__file__))
+
+
+def test_create_app_without_database_url(monkeypatch):
+    monkeypatch.delenv("DATABASE_URL", raising=False)
+    app = create_app({"TESTING": True, "DATABASE_URL": None})
+    assert "main.dashboard" in app.view_functions
+
+
+def test_importing_db_leaves_socket_alone():
+    code = "import socket; f = socket.getaddrinfo; import db; print(socket.getaddrinfo is f)"
+    env = {k: v for k, v in os.environ.items() if k != "DATABASE_URL"}
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True, text=True, check=True, cwd=ROOT, env=env,
+    )
+    assert out.stdout.strip() == "True"
+
+
+def test_network_tuning_is_opt_in():
+    try:
+        create_app({"TESTING": True, "DB_NETWORK_TUNING": True})
+        assert socket.getaddrinfo is not db._original_getaddrinfo
+    finally:
+        db.remove_network_tuning()
+    assert socket.getaddrinfo is db._original_getaddrinfo
+
+
+def test_database_url_is_read_lazily(monkeypatch):
+    monkeypatch.delenv("DATABASE_URL", raising=False)
+    db.configure(url=None)
+    with pytest.raises(RuntimeError):
+        db.get_database_url()
+
+    db.configure(url="postgresql://u:p@db-pooler.example/x")
+    try:
+        assert db.get_database_url() == "postgresql://u:p@db-pooler.example/x"
+    finally:
+        db.configure(url=None)
@@ -0,0 +1,67 @@
+import io
+import json
+
+import app_logging
+from app_logging import QueryProfile, configure_logging, flush_logging, get_logger, log_request
+
+
+def capture(**settings):
+    stream = io.StringIO()
+    configure_logging(stream=stream, **settings)
+    return stream
+
+
+def records(stream):
+    flush_logging()
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_keyword_arguments_become_json_fields():
+    stream = capture()
+
+    get_logger("test").warning("db_connect_slow", ms=250.5, host="primary")
+
+    [entry] = records(stream)
+    assert entry["event"] == "db_connect_slow"
+    assert entry["level"] == "warning"
+    assert entry["logger"] == "tripplanner.test"
+    assert entry["ms"] == 250.5 and entry["host"] == "primary"
+
+
+def test_exceptions_keep_their_traceback():
+    stream = capture()
+
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        get_logger("test").exception("import_failed", trip_id="t1")
+
+    [entry] = records(stream)
+    assert entry["trip_id"] == "t1"
+    assert "ValueError: boom" in entry["exc"]
+
+
+def test_sampled_out_requests_are_still_logged_when_slow():
+    stream = capture(sample_rates={"main.ping": 0.0}, slow_request_ms=100)
+    profile = QueryProfile()
+    profile.record("SELECT 1", 80.0, 1)
+
+    log_request("GET", "/ping", "main.ping", 200, 5.0)
+    log_request("GET", "/ping", "main.ping", 200, 150.0, profile=profile)
+
+    [entry] = records(stream)
+    assert entry["event"] == "slow_request"
+    assert entry["query_count"] == 1
+    assert entry["slowest_queries"][0]["sql"] == "SELECT 1"
+
+
+def test_profile_keeps_only_the_slowest_queries():
+    profile = QueryProfile()
+    for ms in range(50):
+        profile.record(f"SELECT {ms}", float(ms), 0)
+
+    summary = profile.summary()
+
+    assert summary["query_count"] == 50
+    assert len(summary["slowest_queries"]) == app_logging.PROFILE_TOP_QUERIES
+    assert summary["slowest_queries"][0]["ms"] == 49.0
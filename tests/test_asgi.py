@@ -0,0 +1,122 @@
+import asyncio
+import time
+
+from asgi import create_asgi_app
+from db_async import close_async_pool
+from fragment_cache import anot_modified, page_validators
+from ids import new_id
+
+
+def asgi_get(app, path, headers=()):
+    """(status, headers) of one GET sent straight through the ASGI app"""
+    async def request():
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+            "query_string": b"", "root_path": "", "client": ("127.0.0.1", 50000),
+            "server": ("localhost", 80),
+            "headers": [(name.lower().encode(), value.encode()) for name, value in headers],
+        }
+        body_sent = asyncio.Event()
+        sent = []
+
+        async def receive():
+            if not body_sent.is_set():
+                body_sent.set()
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await asyncio.Event().wait()
+
+        async def send(message):
+            sent.append(message)
+
+        try:
+            await app(scope, receive, send)
+        finally:
+            await close_async_pool()
+        start = next(m for m in sent if m["type"] == "http.response.start")
+        return start["status"], {
+            name.decode().lower(): value.decode() for name, value in start["headers"]
+        }
+
+    return asyncio.run(request())
+
+
+def test_trip_and_day_pages_go_to_the_async_app():
+    hybrid = create_asgi_app({"TESTING": True})
+
+    assert hybrid.is_async({"path": "/trip/t1", "method": "GET"})
+    assert hybrid.is_async({"path": "/trip/t1/day/d1", "method": "GET"})
+    assert not hybrid.is_async({"path": "/friends", "method": "GET"})
+
+    status, headers = asgi_get(hybrid, "/trip/t1")
+    assert status == 302
+    assert headers["location"] == "/"
+
+
+def test_async_not_modified_matches_the_etag():
+    hybrid = create_asgi_app({"TESTING": True})
+    etag, last_modified = page_validators({"day:d1": (5, None)}, "u1")
+
+    async def check(header):
+        async with hybrid.async_app.test_request_context("/", headers={"If-None-Match": header}):
+            return anot_modified(etag, last_modified)
+
+    response = asyncio.run(check(f'"{etag}"'))
+    assert response.status_code == 304
+    assert response.headers["ETag"] == f'"{etag}"'
+    assert asyncio.run(check('"stale"')) is None
+
+
+def test_successful_async_post_marks_write():
+    quart_app = create_asgi_app({"TESTING": True}).async_app
+
+    async def write():
+        return "ok"
+
+    async def bad_write():
+        return "no", 400
+
+    quart_app.add_url_rule("/_write", "write", write, methods=["POST"])
+    quart_app.add_url_rule("/_bad_write", "bad_write", bad_write, methods=["POST"])
+
+    async def stamps():
+        client = quart_app.test_client()
+        await client.post("/_bad_write")
+        async with client.session_transaction() as sess:
+            before = sess.get("db_wrote_at")
+        await client.post("/_write")
+        async with client.session_transaction() as sess:
+            return before, sess.get("db_wrote_at")
+
+    before, after = asyncio.run(stamps())
+    assert before is None
+    assert after <= time.time()
+
+
+# ---------------- against Postgres ----------------
+
+def session_cookie(hybrid, user_id):
+    flask_app = hybrid.wsgi_app.wsgi_application
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    return "Cookie", f"session={serializer.dumps({'user_id': user_id})}"
+
+
+def test_async_pages_revalidate_with_304(database, make_trip):
+    trip_id, (ana, _) = make_trip()
+    conn = database.connect()
+    day_id = new_id()
+    cur = conn.cursor()
+    cur.execute("INSERT INTO days (id, trip_id, date) VALUES (%s, %s, '2020-05-01')",
+                (day_id, trip_id))
+    cur.close()
+    conn.close()
+    hybrid = create_asgi_app({"TESTING": True})
+    cookie = session_cookie(hybrid, ana)
+
+    for path in (f"/trip/{trip_id}", f"/trip/{trip_id}/day/{day_id}"):
+        status, headers = asgi_get(hybrid, path, [cookie])
+        assert status == 200
+        assert "cookie" in headers["vary"].lower()
+
+        again, _ = asgi_get(hybrid, path, [cookie, ("If-None-Match", headers["etag"])])
+        assert again == 304
@@ -0,0 +1,90 @@
+import json
+import select
+
+import chat
+from live_updates import CHANNEL
+
+
+def test_thread_lookup_retries_after_losing_creation_race(fake_conn):
+    conn = fake_conn(one=[None, {"id": "thread-1"}])
+
+    assert chat.trip_thread(conn, "trip-1") == {"id": "thread-1"}
+    assert len(conn.executed) == 2
+
+
+# ---------------- against Postgres ----------------
+
+def listen(database):
+    conn = database.connect()
+    cur = conn.cursor()
+    cur.execute(f"LISTEN {CHANNEL}")
+    cur.close()
+    return conn
+
+
+def notifications(conn, count):
+    payloads = []
+    while len(payloads) < count and select.select([conn], [], [], 5) != ([], [], []):
+        conn.poll()
+        payloads.extend(json.loads(n.payload) for n in conn.notifies)
+        conn.notifies.clear()
+    return payloads
+
+
+def test_pages_run_newest_first_and_seek_past_the_cursor(database, make_trip):
+    trip_id, (ana, _) = make_trip()
+    conn = database.connect()
+    thread = chat.trip_thread(conn, trip_id)
+    for i in range(5):
+        chat.post_message(conn, thread, ana, f"message {i}")
+
+    first, has_more = chat.messages_page(conn, thread["id"], limit=3)
+    last = first[-1]
+    rest, more_after = chat.messages_page(
+        conn, thread["id"], limit=3, before=(last["created_at"].isoformat(), last["id"])
+    )
+    conn.close()
+
+    assert [m["message"] for m in first] == ["message 4", "message 3", "message 2"]
+    assert has_more
+    assert [m["message"] for m in rest] == ["message 1", "message 0"]
+    assert not more_after
+
+
+def test_posting_bumps_the_other_members_unread_counts(database, make_trip):
+    trip_id, (ana, ben) = make_trip()
+    conn = database.connect()
+    thread = chat.trip_thread(conn, trip_id)
+    chat.post_message(conn, thread, ana, "hi")
+    chat.post_message(conn, thread, ana, "there")
+
+    ben_unread = [r["unread_count"] for r in chat.unread_counts(conn, ben)]
+    ana_unread = chat.unread_counts(conn, ana)
+    chat.mark_read(conn, thread["id"], ben)
+    ben_after = chat.unread_counts(conn, ben)
+    conn.close()
+
+    assert ben_unread == [2]
+    assert ana_unread == []
+    assert ben_after == []
+
+
+def test_messages_that_escape_long_are_stored_and_announced(database, make_trip):
+    trip_id, (ana, _) = make_trip()
+    listener = listen(database)
+    conn = database.connect()
+    thread = chat.trip_thread(conn, trip_id)
+    short = 'say "hi"\n'
+    # Within MAX_MESSAGE_LENGTH, but each character escapes to 2 or 6 bytes
+    escaped = ["a" + "\n" * 3998 + "a", '"' * chat.MAX_MESSAGE_LENGTH,
+               "\x01" * chat.MAX_MESSAGE_LENGTH]
+
+    stored = [chat.post_message(conn, thread, ana, text) for text in [short] + escaped]
+    payloads = notifications(listener, len(stored))
+    conn.close()
+    listener.close()
+
+    assert [row["message"] for row in stored] == [short] + escaped
+    assert [p["id"] for p in payloads] == [str(row["id"]) for row in stored]
+    assert payloads[0]["message"] == short
+    assert all(p["message"] is None for p in payloads[1:])
@@ -0,0 +1,71 @@
+from datetime import time
+
+from day_optimizer import optimize_day
+
+
+def make_task(task_id, lat, lng, start_time=None, end_time=None):
+    return {
+        "id": task_id,
+        "lat": lat,
+        "lng": lng,
+        "start_time": start_time,
+        "end_time": end_time,
+    }
+
+
+def test_optimizer_untangles_zigzag_route():
+    # points along a line visited out of order
+    tasks = [
+        make_task("a", 0.0, 0.00),
+        make_task("c", 0.0, 0.02),
+        make_task("b", 0.0, 0.01),
+        make_task("d", 0.0, 0.03),
+    ]
+
+    result = optimize_day(tasks, speed_kmph=5)
+
+    assert result["changed"]
+    assert result["order"] == ["a", "b", "c", "d"]
+    assert result["minutes_saved"] > 0
+
+
+def test_optimizer_keeps_untagged_tasks_in_place():
+    tasks = [
+        make_task("a", 0.0, 0.00),
+        make_task("c", 0.0, 0.02),
+        make_task("lunch", None, None),
+        make_task("b", 0.0, 0.01),
+        make_task("d", 0.0, 0.03),
+    ]
+
+    result = optimize_day(tasks, speed_kmph=5)
+
+    assert result["order"][2] == "lunch"
+
+
+def test_optimizer_respects_time_windows():
+    # "c" must be visited at 09:00 sharp, before "b" opens
+    tasks = [
+        make_task("a", 0.0, 0.00, "08:00", "08:00"),
+        make_task("c", 0.0, 0.02, "09:00", "09:00"),
+        make_task("b", 0.0, 0.01, "12:00", "12:00"),
+        make_task("d", 0.0, 0.03, "13:00", "13:00"),
+    ]
+
+    result = optimize_day(tasks, speed_kmph=5)
+
+    assert result["order"].index("c") < result["order"].index("b")
+
+
+def test_time_windows_accept_time_columns():
+    # TIME columns come back as datetime.time, the same windows as "HH:MM"
+    tasks = [
+        make_task("a", 0.0, 0.00, time(8, 0), time(8, 0)),
+        make_task("c", 0.0, 0.02, time(9, 0), time(9, 0)),
+        make_task("b", 0.0, 0.01, time(12, 0), time(12, 0)),
+        make_task("d", 0.0, 0.03, time(13, 0), time(13, 0)),
+    ]
+
+    result = optimize_day(tasks, speed_kmph=5)
+
+    assert result["order"].index("c") < result["order"].index("b")
@@ -0,0 +1,55 @@
+from datetime import datetime, timezone
+
+from fragment_cache import FragmentCache, LRUBackend, not_modified, page_validators
+
+
+def test_lru_evicts_least_recently_used():
+    lru = LRUBackend(max_entries=2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    lru.get("a")
+    lru.set("c", 3)
+
+    assert lru.get("a") == 1
+    assert lru.get("b") is None
+    assert lru.get("c") == 3
+
+
+def test_render_is_cached_per_key(app):
+    cache = FragmentCache()
+    members = [{"user_id": "u1", "name": "Ana", "role": "owner"}]
+
+    with app.test_request_context("/"):
+        first = cache.render(("trip-members", "t1", 3), "fragments/trip_members.html", members=members)
+        # Same key: served from cache even if the context differs
+        again = cache.render(("trip-members", "t1", 3), "fragments/trip_members.html", members=[])
+        bumped = cache.render(("trip-members", "t1", 4), "fragments/trip_members.html", members=[])
+
+    assert "Ana" in first
+    assert again == first
+    assert "Ana" not in bumped
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_validators_follow_versions_and_user():
+    stamp = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    v1 = {"trip:t1": (1, stamp)}
+    v2 = {"trip:t1": (2, stamp)}
+
+    etag, _ = page_validators(v1, "u1")
+    assert page_validators(v1, "u1")[0] == etag
+    assert page_validators(v2, "u1")[0] != etag
+    assert page_validators(v1, "u2")[0] != etag
+
+
+def test_not_modified_on_matching_etag(app):
+    etag, last_modified = page_validators({"day:d1": (5, None)}, "u1")
+
+    with app.test_request_context("/", headers={"If-None-Match": f'"{etag}"'}):
+        response = not_modified(etag, last_modified)
+        assert response.status_code == 304
+        assert response.headers["ETag"] == f'"{etag}"'
+
+    with app.test_request_context("/", headers={"If-None-Match": '"stale"'}):
+        assert not_modified(etag, last_modified) is None
@@ -0,0 +1,56 @@
+import uuid
+
+import friend_graph
+
+
+def test_public_ids_use_prefix_and_unambiguous_alphabet():
+    public_id = friend_graph.new_public_id()
+
+    assert public_id.startswith("TP-")
+    assert len(public_id) == 3 + friend_graph.PUBLIC_ID_LENGTH
+    assert all(c in friend_graph.PUBLIC_ID_ALPHABET for c in public_id[3:])
+
+
+def test_normalize_public_id():
+    assert friend_graph.normalize_public_id("  tp-7k3qx9 ") == "TP-7K3QX9"
+    assert friend_graph.normalize_public_id("7K3QX9") is None
+    assert friend_graph.normalize_public_id(None) is None
+
+
+def test_create_user_retries_on_public_id_collision(fake_conn):
+    conn = fake_conn(one=[None, {"public_id": "TP-AAAAAA"}])
+
+    public_id = friend_graph.create_user(conn, "user-1", "ana", "pw", "2026-05-01")
+
+    assert public_id == "TP-AAAAAA"
+    assert len(conn.executed) == 2
+    assert all(params[0] == "user-1" for _, params in conn.executed)
+
+
+def test_invite_without_valid_ids_runs_no_query(fake_conn):
+    conn = fake_conn()
+
+    assert friend_graph.invite_friends_to_trip(conn, "trip-1", "user-1", ["", "bogus"], "now") == []
+    assert conn.executed == []
+
+
+# ---------------- against Postgres ----------------
+
+def test_backfill_keeps_the_previously_shown_id(database):
+    # The id shown before public_id was stored: "TP-" + the uuid's first 6 chars
+    user_id = str(uuid.uuid4())
+    conn = database.connect()
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO users (id, name, password, created_at)
+        VALUES (%s, %s, 'pw', now())
+    """, (user_id, f"legacy-{user_id[:8]}"))
+
+    friend_graph.backfill_public_ids(conn)
+    cur.execute("SELECT public_id FROM users WHERE id = %s", (user_id,))
+    public_id = cur.fetchone()["public_id"]
+    cur.execute("DELETE FROM users WHERE id = %s", (user_id,))
+    cur.close()
+    conn.close()
+
+    assert public_id == "TP-" + user_id[:6].upper()
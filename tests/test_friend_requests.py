@@ -0,0 +1,84 @@
+import uuid
+from datetime import datetime
+
+import pytest
+
+import db
+import friend_graph
+
+@pytest.fixture
+def users(database):
+    conn = database.connect()
+    now = datetime.now().isoformat()
+    created = []
+    for name in ("ana", "ben"):
+        user_id = str(uuid.uuid4())
+        public_id = friend_graph.create_user(conn, user_id, f"{name}-{user_id[:8]}", "pw", now)
+        created.append({"id": user_id, "public_id": public_id})
+    yield created
+
+    ids = [u["id"] for u in created]
+    cur = conn.cursor()
+    cur.execute("DELETE FROM friends WHERE user_id = ANY(%s::uuid[]) OR friend_id = ANY(%s::uuid[])", (ids, ids))
+    cur.execute("DELETE FROM friend_requests WHERE sender_id = ANY(%s::uuid[])", (ids,))
+    cur.execute("DELETE FROM users WHERE id = ANY(%s::uuid[])", (ids,))
+    cur.close()
+    conn.close()
+
+
+def friend_rows(conn, a, b):
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT COUNT(*) AS count FROM friends
+        WHERE (user_id = %s AND friend_id = %s) OR (user_id = %s AND friend_id = %s)
+    """, (a, b, b, a))
+    count = cur.fetchone()["count"]
+    cur.close()
+    return count
+
+
+def test_parallel_sends_open_one_request(users, in_parallel):
+    ana, ben = users
+    now = datetime.now().isoformat()
+
+    outcomes = in_parallel(lambda conn: friend_graph.send_friend_request(
+        conn, str(uuid.uuid4()), ana["id"], ben["public_id"], "", now
+    )[0])
+
+    assert outcomes.count(friend_graph.SENT) == 1
+    assert set(outcomes) <= {friend_graph.SENT, friend_graph.ALREADY_SENT}
+
+    conn = db.connect()
+    assert len(friend_graph.pending_requests(conn, ben["id"])) == 1
+    conn.close()
+
+
+def test_parallel_accepts_link_once(users, in_parallel):
+    ana, ben = users
+    now = datetime.now().isoformat()
+    conn = db.connect()
+    friend_graph.send_friend_request(conn, str(uuid.uuid4()), ana["id"], ben["public_id"], "", now)
+
+    results = in_parallel(
+        lambda c: friend_graph.accept_friend_request(c, ana["id"], ben["id"], now)
+    )
+
+    assert results.count(True) == 1
+    assert friend_rows(conn, ana["id"], ben["id"]) == 2
+    assert friend_graph.pending_requests(conn, ben["id"]) == []
+    conn.close()
+
+
+def test_request_back_accepts_the_pending_one(users):
+    ana, ben = users
+    now = datetime.now().isoformat()
+    conn = db.connect()
+    friend_graph.send_friend_request(conn, str(uuid.uuid4()), ana["id"], ben["public_id"], "", now)
+
+    outcome, _ = friend_graph.send_friend_request(
+        conn, str(uuid.uuid4()), ben["id"], ana["public_id"], "", now
+    )
+
+    assert outcome == friend_graph.ACCEPTED
+    assert friend_rows(conn, ana["id"], ben["id"]) == 2
+    conn.close()
@@ -0,0 +1,38 @@
+import hashlib
+import time
+import uuid
+
+from ids import as_uuid, new_id, normalize_url_ids, uuid7
+
+
+def test_uuid7_is_version_7_and_time_ordered():
+    ids = []
+    for _ in range(5):
+        ids.append(uuid7())
+        time.sleep(0.002)
+
+    assert all(value.version == 7 and value.variant == uuid.RFC_4122 for value in ids)
+    assert ids == sorted(ids, key=lambda value: value.int)
+    assert abs((ids[0].int >> 80) - time.time() * 1000) < 60_000
+
+
+def test_new_ids_are_unique_strings():
+    ids = {new_id() for _ in range(1000)}
+
+    assert len(ids) == 1000
+    assert all(str(uuid.UUID(value)) == value for value in ids)
+
+
+def test_as_uuid_maps_legacy_ids_like_the_migration():
+    value = "6F9619FF-8B86-D011-B42D-00C04FC964FF"
+
+    assert as_uuid(value) == value.lower()
+    assert as_uuid("walk") == str(uuid.UUID(hashlib.md5(b"walk").hexdigest()))
+
+
+def test_normalize_url_ids_only_touches_id_args():
+    values = {"trip_id": "legacy", "mode": "walk"}
+    normalize_url_ids("main.trip", values)
+
+    assert values == {"trip_id": as_uuid("legacy"), "mode": "walk"}
+    normalize_url_ids("static", None)
@@ -0,0 +1,58 @@
+import json
+
+from fragment_cache import BUMP_VERSIONS_SQL
+from live_updates import NOTIFY_PAYLOAD_BYTES, LiveUpdates, publish
+
+
+def make_hub(monkeypatch):
+    hub = LiveUpdates()
+    monkeypatch.setattr(hub, "_ensure_listener", lambda: None)
+    return hub
+
+
+def test_day_event_reaches_day_and_trip_subscribers(monkeypatch):
+    hub = make_hub(monkeypatch)
+    _, day_q = hub.subscribe("trip-1", "day-1")
+    _, trip_q = hub.subscribe("trip-1")
+    _, other_q = hub.subscribe("trip-1", "day-2")
+
+    hub.dispatch({"type": "status", "trip_id": "trip-1", "day_id": "day-1"})
+
+    assert day_q.qsize() == 1
+    assert trip_q.qsize() == 1
+    assert other_q.empty()
+
+
+def test_unsubscribe_stops_delivery(monkeypatch):
+    hub = make_hub(monkeypatch)
+    key, q = hub.subscribe("trip-1", "day-1")
+    hub.unsubscribe(key, q)
+
+    hub.dispatch({"type": "task", "trip_id": "trip-1", "day_id": "day-1"})
+
+    assert q.empty()
+    assert hub.subscriber_count() == 0
+
+
+def test_publish_bumps_versions_before_notifying(fake_conn):
+    conn = fake_conn()
+
+    publish(conn, "trip-1", "day-1", "task", action="added", task_id="task-1")
+
+    assert conn.executed[0][0] == BUMP_VERSIONS_SQL
+    assert "pg_notify" in conn.executed[1][0]
+
+
+def test_oversized_event_drops_its_longest_field(fake_conn):
+    conn = fake_conn()
+    title = 'a "quoted"\n title ' * 1000
+
+    publish(conn, "trip-1", "day-1", "task", action="edited",
+            task_id="task-1", title=title, start_time="10:00")
+
+    _, (_, payload) = conn.executed[1]
+    event = json.loads(payload)
+    assert len(payload.encode()) <= NOTIFY_PAYLOAD_BYTES
+    assert event["title"] is None
+    assert event["task_id"] == "task-1"
+    assert event["start_time"] == "10:00"
@@ -0,0 +1,63 @@
+import pytest
+
+from ids import new_id
+
+
+# ---------------- against Postgres ----------------
+
+@pytest.fixture
+def group(database, make_trip):
+    """A transport group on a fresh trip, plus a user outside that trip"""
+    trip_id, (owner,) = make_trip(members=1)
+    _, (outsider,) = make_trip(members=1)
+    group_id = new_id()
+    conn = database.connect()
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO transport_groups (id, trip_id, mode_id, created_at)
+        VALUES (%s, %s, 'walk', now())
+    """, (group_id, trip_id))
+    cur.close()
+    yield group_id, owner, outsider
+
+    cur = conn.cursor()
+    cur.execute("DELETE FROM location_updates WHERE transport_group_id = %s", (group_id,))
+    cur.execute("DELETE FROM transport_groups WHERE id = %s", (group_id,))
+    cur.close()
+    conn.close()
+
+
+def post_location(client, user_id, group_id):
+    with client.session_transaction() as sess:
+        sess["user_id"] = user_id
+    return client.post(f"/group/{group_id}/location", json={"lat": 48.85, "lng": 2.35})
+
+
+def location_count(database, group_id):
+    conn = database.connect()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT COUNT(*) AS count FROM location_updates WHERE transport_group_id = %s
+    """, (group_id,))
+    count = cur.fetchone()["count"]
+    cur.close()
+    conn.close()
+    return count
+
+
+def test_non_member_cannot_move_a_group(database, client, group):
+    group_id, _, outsider = group
+
+    response = post_location(client, outsider, group_id)
+
+    assert response.status_code == 404
+    assert location_count(database, group_id) == 0
+
+
+def test_trip_member_posts_a_location(database, client, group):
+    group_id, owner, _ = group
+
+    response = post_location(client, owner, group_id)
+
+    assert response.status_code == 200
+    assert location_count(database, group_id) == 1
@@ -0,0 +1,43 @@
+import json
+import os
+
+import metrics
+
+jobs = metrics.Counter("test_jobs_total", "Jobs", labels=("kind",))
+job_seconds = metrics.Histogram("test_job_seconds", "Job time", buckets=(0.1, 1))
+
+
+def test_histogram_buckets_are_cumulative():
+    job_seconds.observe(0.05)
+    job_seconds.observe(0.5)
+    job_seconds.observe(3)
+
+    body = metrics.render()
+
+    assert 'tripplanner_test_job_seconds_bucket{le="0.1"} 1' in body
+    assert 'tripplanner_test_job_seconds_bucket{le="1"} 2' in body
+    assert 'tripplanner_test_job_seconds_bucket{le="+Inf"} 3' in body
+    assert "tripplanner_test_job_seconds_count 3" in body
+
+
+def test_scrape_sums_every_workers_file(tmp_path):
+    metrics.configure(directory=str(tmp_path))
+    try:
+        jobs.inc(kind="import")
+        # Another worker's last flush
+        other = {"tripplanner_test_jobs_total": [[["import"], 4], [["export"], 1]]}
+        (tmp_path / "metrics-999999.json").write_text(json.dumps(other))
+
+        body = metrics.render()
+    finally:
+        metrics.configure(directory=None)
+
+    assert 'tripplanner_test_jobs_total{kind="import"} 5' in body
+    assert 'tripplanner_test_jobs_total{kind="export"} 1' in body
+    assert f"metrics-{os.getpid()}.json" in os.listdir(tmp_path)
+
+
+def test_label_values_are_escaped():
+    lines = metrics.gauge_lines("test_gauge", "Gauge", [({"name": 'a"b'}, 1)])
+
+    assert lines[-1] == 'tripplanner_test_gauge{name="a\\"b"} 1'
@@ -0,0 +1,104 @@
+import pytest
+
+from ids import new_id
+from ordering import (
+    key_between, key_for_insert, keys_between, locked_day, rebalance_day
+)
+
+
+def test_keys_between_are_sorted_and_unique():
+    keys = keys_between(None, None, 500)
+
+    assert keys == sorted(keys)
+    assert len(set(keys)) == len(keys)
+
+
+def test_repeated_insert_at_same_spot_never_collides():
+    low, high = "a0", "a1"
+    for _ in range(100):
+        key = key_between(low, high)
+        assert low < key < high
+        high = key
+
+
+def test_prepend_and_append():
+    first = key_between(None, "a0")
+    last = key_between("a0", None)
+
+    assert first < "a0" < last
+
+
+def test_bulk_keys_fit_between_neighbours():
+    keys = keys_between("a0", "a1", 50)
+
+    assert keys == sorted(keys)
+    assert "a0" < keys[0] and keys[-1] < "a1"
+
+
+def test_rejects_inverted_bounds():
+    with pytest.raises(ValueError):
+        key_between("a1", "a0")
+
+
+# ---------------- against Postgres ----------------
+
+def add_day(conn, trip_id):
+    day_id, task_id = new_id(), new_id()
+    cur = conn.cursor()
+    cur.execute("INSERT INTO days (id, trip_id, date) VALUES (%s, %s, '2026-05-01')",
+                (day_id, trip_id))
+    cur.execute("""
+        INSERT INTO tasks (id, trip_id, day_id, title, start_time, order_key, created_at)
+        VALUES (%s, %s, %s, 'Museum', '10:00', 'a0', now())
+    """, (task_id, trip_id, day_id))
+    cur.close()
+    return day_id, task_id
+
+
+def insert_after(conn, trip_id, day_id, ref_task_id):
+    with locked_day(conn, day_id):
+        key = key_for_insert(conn, day_id, ref_task_id, "after")
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO tasks (id, trip_id, day_id, title, start_time, order_key, created_at)
+            VALUES (%s, %s, %s, 'Lunch', '12:00', %s, now())
+        """, (new_id(), trip_id, day_id, key))
+        cur.close()
+    return key
+
+
+def day_keys(conn, day_id):
+    cur = conn.cursor()
+    cur.execute("SELECT order_key FROM tasks WHERE day_id = %s ORDER BY order_key", (day_id,))
+    keys = [row["order_key"] for row in cur.fetchall()]
+    cur.close()
+    return keys
+
+
+def test_parallel_inserts_at_one_spot_get_distinct_keys(database, make_trip, in_parallel):
+    trip_id, _ = make_trip(members=1)
+    conn = database.connect()
+    day_id, first = add_day(conn, trip_id)
+
+    keys = in_parallel(lambda c: insert_after(c, trip_id, day_id, first))
+    stored = day_keys(conn, day_id)
+    conn.close()
+
+    assert len(set(keys)) == len(keys)
+    assert len(set(stored)) == len(stored) == len(keys) + 1
+
+
+def test_inserts_racing_a_rebalance_keep_keys_distinct(database, make_trip, in_parallel):
+    trip_id, _ = make_trip(members=1)
+    conn = database.connect()
+    day_id, first = add_day(conn, trip_id)
+
+    def click(c):
+        rebalance_day(c, day_id)
+        return insert_after(c, trip_id, day_id, first)
+
+    in_parallel(click)
+    stored = day_keys(conn, day_id)
+    conn.close()
+
+    assert len(set(stored)) == len(stored)
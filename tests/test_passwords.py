@@ -0,0 +1,54 @@
+import threading
+
+import pytest
+
+import passwords
+
+
+@pytest.fixture(autouse=True)
+def cheap_hashes():
+    passwords.configure(log2_n=10)
+    yield
+    passwords.configure()
+
+
+def test_hash_round_trip():
+    stored = passwords.hash_password("s3cret")
+
+    assert stored.startswith("scrypt$10$8$1$")
+    assert passwords.verify_password(stored, "s3cret") == (True, False)
+    assert passwords.verify_password(stored, "S3cret") == (False, False)
+
+
+def test_plain_text_row_matches_and_asks_for_rehash():
+    assert passwords.verify_password("hunter2", "hunter2") == (True, True)
+    assert passwords.verify_password("hunter2", "hunter3") == (False, False)
+
+
+def test_older_cost_is_upgraded_on_login():
+    stored = passwords.hash_password("s3cret")
+    passwords.configure(log2_n=11)
+
+    assert passwords.verify_password(stored, "s3cret") == (True, True)
+    assert passwords.hash_password("s3cret").startswith("scrypt$11$")
+
+
+def test_full_queue_fails_fast():
+    passwords.configure(log2_n=10, threads=1, queue=0)
+    started, release = threading.Event(), threading.Event()
+
+    def hold():
+        started.set()
+        release.wait(5)
+
+    holder = threading.Thread(target=passwords._run, args=(hold,))
+    holder.start()
+    started.wait(5)
+    try:
+        with pytest.raises(passwords.PasswordHasherBusy):
+            passwords.hash_password("s3cret")
+    finally:
+        release.set()
+        holder.join()
+
+    assert passwords.verify_password(passwords.hash_password("s3cret"), "s3cret")[0]
@@ -0,0 +1,57 @@
+from flask import request
+
+from rate_limit import LocalBackend, rate_limiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_allows_a_burst_then_refills():
+    clock = FakeClock()
+    buckets = LocalBackend(clock=clock)
+
+    assert [buckets.take("k", 3, 1)[0] for _ in range(4)] == [True, True, True, False]
+    assert buckets.take("k", 3, 1) == (False, 1.0)
+
+    clock.now += 1
+    assert buckets.take("k", 3, 1) == (True, 0.0)
+    assert buckets.take("k", 3, 1)[0] is False
+
+
+def test_least_recently_used_buckets_are_dropped():
+    buckets = LocalBackend(max_keys=2)
+    for key in ("a", "b", "a", "c"):
+        buckets.take(key, 5, 1)
+
+    assert len(buckets) == 2
+    assert set(buckets._buckets) == {"a", "c"}
+
+
+def test_rejected_before_the_route_runs(client):
+    rate_limiter.configure(user_burst=1, user_per_minute=6)
+    try:
+        assert rate_limiter.check("login", "10.0.0.1", " Alice ") is None
+
+        # No database here: reaching the route would fail
+        response = client.post("/login", data={"username": "alice", "password": "x"})
+
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "10"
+        assert b"Too many attempts" in response.data
+    finally:
+        rate_limiter.configure()
+
+
+def test_forwarded_for_is_only_trusted_for_known_hops(app):
+    rate_limiter.configure(proxy_hops=1)
+    try:
+        headers = {"X-Forwarded-For": "6.6.6.6, 203.0.113.9"}
+        with app.test_request_context(headers=headers, environ_base={"REMOTE_ADDR": "10.0.0.2"}):
+            assert rate_limiter.client_ip(request) == "203.0.113.9"
+    finally:
+        rate_limiter.configure()
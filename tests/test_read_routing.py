@@ -0,0 +1,76 @@
+import os
+import time
+
+import pytest
+from flask import session
+
+import db
+from db_router import PRIMARY, REPLICA
+
+
+def test_read_only_views_prefer_replica(app):
+    with app.test_request_context("/dashboard"):
+        assert db.request_role() == REPLICA
+
+
+def test_other_views_use_primary(app):
+    with app.test_request_context("/friends"):
+        assert db.request_role() == PRIMARY
+
+
+def test_reads_stick_to_primary_after_own_write(app):
+    with app.test_request_context("/dashboard"):
+        db.mark_write()
+        assert db.request_role() == PRIMARY
+
+    with app.test_request_context("/dashboard"):
+        session["db_wrote_at"] = time.time() - 60
+        assert db.request_role() == REPLICA
+
+
+def test_successful_post_marks_write(app):
+    app.add_url_rule("/_write", "write", lambda: "ok", methods=["POST"])
+    app.add_url_rule("/_bad_write", "bad_write", lambda: ("no", 400), methods=["POST"])
+    client = app.test_client()
+
+    client.post("/_bad_write")
+    with client.session_transaction() as sess:
+        assert "db_wrote_at" not in sess
+
+    client.post("/_write")
+    with client.session_transaction() as sess:
+        assert sess["db_wrote_at"] <= time.time()
+
+
+# Needs two local servers, e.g.
+#   TEST_PRIMARY_URL=postgresql://localhost:5432/postgres
+#   TEST_REPLICA_URL=postgresql://localhost:5433/postgres
+@pytest.mark.skipif(
+    not (os.environ.get("TEST_PRIMARY_URL") and os.environ.get("TEST_REPLICA_URL")),
+    reason="TEST_PRIMARY_URL / TEST_REPLICA_URL not set"
+)
+def test_routes_between_two_servers(app):
+    db.configure(
+        url=os.environ["TEST_PRIMARY_URL"],
+        replica_urls=[os.environ["TEST_REPLICA_URL"]],
+        probe_interval=0,
+    )
+
+    def server_port():
+        conn = db.get_db()
+        cur = conn.cursor()
+        cur.execute("SELECT inet_server_port() AS port")
+        return cur.fetchone()["port"]
+
+    try:
+        with app.test_request_context("/dashboard"):
+            replica_port = server_port()
+        with app.test_request_context("/friends"):
+            primary_port = server_port()
+        assert replica_port != primary_port
+
+        with app.test_request_context("/dashboard"):
+            db.mark_write()
+            assert server_port() == primary_port
+    finally:
+        db.configure(url=None)
@@ -0,0 +1,48 @@
+import json
+from datetime import datetime, timedelta
+
+import task_notes
+from task_notes import apply_delta, encode_revision, make_delta, replay, should_coalesce
+
+
+def test_delta_round_trip():
+    old = "Bring passports\nBook taxi\nCall hotel\n"
+    new = "Bring passports\nBook taxi for 9am\nCall hotel\nBuy SIM\n"
+
+    delta = make_delta(old, new)
+
+    assert apply_delta(old, delta) == new
+    # Unchanged lines are copied by length, not stored
+    assert "Bring passports\n" not in json.dumps(delta)
+
+
+def test_snapshots_bound_replay_length():
+    assert encode_revision(1, None, "a")[0] == "a"
+    assert encode_revision(task_notes.SNAPSHOT_INTERVAL + 1, "x\n" * 50, "x\n" * 51)[1] is None
+
+    snapshot, delta = encode_revision(2, "line\n" * 50, "line\n" * 50 + "more\n")
+    assert snapshot is None and delta is not None
+
+
+def test_replay_rebuilds_each_revision():
+    texts = ["one\n", "one\ntwo\n", "one\ntwo\nthree\n"]
+    rows = [{"revision": 1, "text": texts[0], "delta": None}]
+    for revision, (old, new) in enumerate(zip(texts, texts[1:]), start=2):
+        rows.append({
+            "revision": revision,
+            "text": None,
+            "delta": json.dumps(make_delta(old, new)),
+        })
+
+    assert replay(rows) == {1: texts[0], 2: texts[1], 3: texts[2]}
+
+
+def test_quick_resaves_by_same_editor_coalesce():
+    now = datetime(2026, 5, 1, 12, 0, 0)
+    note = {"revision": 4, "last_edited_by": "user-1", "last_edited_at": now - timedelta(seconds=5)}
+
+    assert should_coalesce(note, "user-1", now)
+    assert not should_coalesce(note, "user-2", now)
+    assert not should_coalesce(
+        note, "user-1", now + timedelta(seconds=task_notes.DEBOUNCE_SECONDS)
+    )
@@ -0,0 +1,42 @@
+from app import task_completion_stats
+from ids import new_id
+from task_status import day_member_statuses, group_status, record_status
+
+
+def test_group_status_needs_every_required_member():
+    assert group_status({"required": 2, "yes": 1, "skipped": 0}) is None
+    assert group_status({"required": 2, "yes": 2, "skipped": 0}) == "YES"
+    assert group_status({"required": 2, "yes": 0, "skipped": 2}) == "SKIPPED"
+    assert group_status({"required": 0, "yes": 0, "skipped": 0}) is None
+
+
+# ---------------- against Postgres ----------------
+
+def add_task(conn, trip_id):
+    day_id, task_id = new_id(), new_id()
+    cur = conn.cursor()
+    cur.execute("INSERT INTO days (id, trip_id, date) VALUES (%s, %s, '2026-05-01')",
+                (day_id, trip_id))
+    cur.execute("""
+        INSERT INTO tasks (id, trip_id, day_id, title, start_time, order_key, created_at)
+        VALUES (%s, %s, %s, 'Museum', '10:00', 'a0', now())
+    """, (task_id, trip_id, day_id))
+    cur.close()
+    return day_id, task_id
+
+
+def test_one_members_yes_does_not_complete_the_task(database, make_trip):
+    trip_id, (ana, ben) = make_trip()
+    conn = database.connect()
+    day_id, task_id = add_task(conn, trip_id)
+
+    record_status(conn, task_id, ana, "YES")
+    after_ana = task_completion_stats(conn, "AND trip_id = %s", (trip_id,))
+    record_status(conn, task_id, ben, "YES")
+    after_both = task_completion_stats(conn, "AND trip_id = %s", (trip_id,))
+    rollup = day_member_statuses(conn, day_id)[task_id]
+    conn.close()
+
+    assert after_ana == {"total": 1, "completed": 0, "skipped": 0, "unanswered": 1}
+    assert after_both == {"total": 1, "completed": 1, "skipped": 0, "unanswered": 0}
+    assert rollup["status"] == "YES"
@@ -0,0 +1,95 @@
+import io
+import json
+
+from werkzeug.datastructures import FileStorage
+
+from app import csv_to_trip_json
+from ids import new_id
+from trip_export import chunked, csv_parts, export_rows, json_parts
+
+
+def row(trip, day=None, task=None, **fields):
+    values = {
+        "trip_id": trip, "trip_name": f"Trip {trip}",
+        "start_date": "2026-05-01", "end_date": "2026-05-03",
+        "day_id": day, "day_date": f"2026-05-0{day}" if day else None,
+        "task_id": task, "title": f"Task {task}", "description": "",
+        "start_time": "09:00", "end_time": "10:00", "lat": None, "lng": None,
+    }
+    values.update(fields)
+    return values
+
+
+ROWS = [
+    row("a", 1, "t1", start_time="08:30", end_time="09:00", lat=48.8566, lng=2.3522),
+    row("a", 1, "t2", title='Dinner, "late"', description="table for 4\nby the window"),
+    row("a", 2),
+    row("a", 3, "t3", start_time="11:15", end_time="12:00"),
+]
+
+
+def test_csv_export_imports_back():
+    content = "".join(csv_parts(iter(ROWS))).encode()
+
+    data = csv_to_trip_json(FileStorage(io.BytesIO(content), filename="trip.csv"))
+
+    assert data["trip_name"] == "Trip a"
+    assert [day["date"] for day in data["days"]] == ["2026-05-01", "2026-05-03"]
+    first, second = data["days"][0]["tasks"]
+    assert (first["start_time"], first["lat"], first["lng"]) == ("08:30", 48.8566, 2.3522)
+    assert second["title"] == 'Dinner, "late"'
+    assert second["description"] == "table for 4\nby the window"
+
+
+def test_json_export_is_the_import_shape():
+    data = json.loads("".join(json_parts(iter(ROWS))))
+
+    assert data["trip_name"] == "Trip a"
+    assert [len(day["tasks"]) for day in data["days"]] == [2, 0, 1]
+    assert data["days"][0]["tasks"][0] == {
+        "title": "Task t1", "start_time": "08:30", "end_time": "09:00",
+        "description": "", "lat": 48.8566, "lng": 2.3522,
+    }
+
+
+def test_history_export_lists_every_trip():
+    rows = ROWS + [row("b"), row("c", 1, "t9")]
+
+    data = json.loads("".join(json_parts(iter(rows), many=True)))
+
+    assert [trip["trip_name"] for trip in data["trips"]] == ["Trip a", "Trip b", "Trip c"]
+    assert data["trips"][1]["days"] == []
+    assert json.loads("".join(json_parts(iter([]), many=True))) == {"trips": []}
+
+
+def test_chunks_are_bounded_and_lossless():
+    parts = ["x" * 10] * 25
+
+    chunks = list(chunked(iter(parts), size=100))
+
+    assert "".join(chunks) == "".join(parts)
+    assert all(len(chunk) <= 100 for chunk in chunks[:-1])
+    assert len(chunks) == 3
+
+
+# ---------------- against Postgres ----------------
+
+def test_export_keeps_tasks_whose_deleted_flag_is_null(database, make_trip):
+    trip_id, (ana, _) = make_trip()
+    conn = database.connect()
+    day_id = new_id()
+    cur = conn.cursor()
+    cur.execute("INSERT INTO days (id, trip_id, date) VALUES (%s, %s, '2026-05-01')",
+                (day_id, trip_id))
+    for title, is_deleted in (("never flagged", None), ("kept", False), ("deleted", True)):
+        cur.execute("""
+            INSERT INTO tasks (id, trip_id, day_id, title, start_time, order_key,
+                               is_deleted, created_at)
+            VALUES (%s, %s, %s, %s, '10:00', %s, %s, now())
+        """, (new_id(), trip_id, day_id, title, "a" + str(len(title)), is_deleted))
+    cur.close()
+
+    titles = sorted(r["title"] for r in export_rows(conn, ana, trip_id))
+    conn.close()
+
+    assert titles == ["kept", "never flagged"]
@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+
+from trip_list import user_trips_page
+
+
+def test_first_page_fetches_one_extra_row_to_detect_more(fake_conn):
+    conn = fake_conn(rows=[{"id": f"trip-{i}"} for i in range(4)])
+
+    rows, has_more = user_trips_page(conn, "user-1", limit=3)
+
+    assert [r["id"] for r in rows] == ["trip-0", "trip-1", "trip-2"]
+    assert has_more
+    assert conn.executed[0][1] == {"user_id": "user-1", "limit": 4}
+
+
+# ---------------- against Postgres ----------------
+
+def test_pages_interleave_owned_and_joined_trips_newest_first(database, make_trip):
+    start = datetime(2026, 5, 1)
+    mine, (me,) = make_trip(members=1, created_at=start)
+    expected = [mine]
+    for i in range(1, 7):
+        created_at = start + timedelta(hours=i)
+        if i % 2:
+            trip_id, _ = make_trip(members=1, join=[me], created_at=created_at)
+        else:
+            trip_id, _ = make_trip(members=0, join=[me], created_at=created_at)
+        expected.append(trip_id)
+    expected.reverse()
+
+    conn = database.connect()
+    seen, after, has_more = [], None, True
+    while has_more:
+        rows, has_more = user_trips_page(conn, me, limit=2, after=after)
+        seen += [row["id"] for row in rows]
+        after = (rows[-1]["created_at"].isoformat(), rows[-1]["id"])
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT COUNT(*) AS missing FROM trip_members
+        WHERE user_id = %s AND trip_created_at IS NULL
+    """, (me,))
+    missing = cur.fetchone()["missing"]
+    cur.close()
+    conn.close()
+
+    assert seen == expected
+    assert missing == 0
@@ -0,0 +1,188 @@
+import csv
+import json
+import time
+
+import metrics
+from app_logging import get_logger
+from db import connect
+from db_router import PRIMARY
+
+log = get_logger("trip_export")
+
+
+# ------------------ Trip export ------------------
+#
+# /trip/<id>/export.{csv,json} and /trips/export.{csv,json} write trips in
+# the formats /import-trip reads (csv_to_trip_json, or the JSON trip
+# object), so an export can be imported again as is. The whole-history
+# JSON export is {"trips": [trip, ...]}, each one importable on its own.
+#
+# Rows come from a single ordered query through a server-side (named)
+# cursor, EXPORT_BATCH_ROWS at a time, inside one read-only REPEATABLE
+# READ transaction so every batch sees the same snapshot. They are
+# written out as they arrive and sent in chunks of about
+# EXPORT_CHUNK_CHARS, so memory stays flat however many tasks a user has.
+#
+# The stream outlives the request: the request's connection is closed by
+# teardown before the first chunk is sent, so the export opens its own
+# and closes it when the stream ends or the client goes away.
+
+EXPORT_BATCH_ROWS = 2000
+EXPORT_CHUNK_CHARS = 64 * 1024
+EXPORT_FORMATS = {"csv": "text/csv", "json": "application/json"}
+
+CSV_COLUMNS = (
+    "trip_name", "trip_start", "trip_end", "day_date", "time", "title", "lat", "lng", "description"
+)
+
+# A trip with no days still gets one row (day_id NULL), a day with no
+# tasks one row (task_id NULL); only the JSON format can show them
+EXPORT_ROWS_SQL = """
+    SELECT tr.id AS trip_id, tr.name AS trip_name,
+           to_char(tr.start_date, 'YYYY-MM-DD') AS start_date,
+           to_char(tr.end_date, 'YYYY-MM-DD') AS end_date,
+           d.id AS day_id, to_char(d.date, 'YYYY-MM-DD') AS day_date,
+           t.id AS task_id, t.title, t.description,
+           to_char(t.start_time, 'HH24:MI') AS start_time,
+           to_char(t.end_time, 'HH24:MI') AS end_time,
+           t.lat, t.lng
+    FROM trips tr
+    LEFT JOIN days d ON d.trip_id = tr.id
+    LEFT JOIN tasks t ON t.day_id = d.id AND (t.is_deleted IS NULL OR t.is_deleted = false)
+    WHERE (tr.owner_id = %(user_id)s OR EXISTS (
+        SELECT 1 FROM trip_members tm
+        WHERE tm.trip_id = tr.id AND tm.user_id = %(user_id)s
+    )) {trip_filter}
+    ORDER BY tr.start_date, tr.id, d.date, d.id, t.start_time, t.order_key, t.id
+"""
+
+
+def export_rows(conn, user_id, trip_id=None, batch_size=EXPORT_BATCH_ROWS):
+    """Every row of the user's trips (or of one of them), one batch in memory at a time"""
+    trip_filter = "AND tr.id = %(trip_id)s" if trip_id else ""
+    conn.set_session(isolation_level="REPEATABLE READ", readonly=True, autocommit=False)
+    try:
+        cur = conn.cursor(name="trip_export")
+        cur.itersize = batch_size
+        cur.execute(EXPORT_ROWS_SQL.format(trip_filter=trip_filter),
+                    {"user_id": user_id, "trip_id": trip_id})
+        yield from cur
+        cur.close()
+    finally:
+        if not conn.closed:
+            conn.rollback()
+            conn.set_session(isolation_level="DEFAULT", readonly="DEFAULT", autocommit=True)
+
+
+# ---------------- formats ----------------
+
+class _Echo:
+    """csv.writer target that hands each written line back to the caller"""
+
+    def write(self, text):
+        return text
+
+
+def csv_parts(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for row in rows:
+        if row["task_id"] is None:
+            continue
+        yield writer.writerow((
+            row["trip_name"], row["start_date"], row["end_date"], row["day_date"],
+            row["start_time"], row["title"], row["lat"], row["lng"], row["description"],
+        ))
+
+
+def task_json(row):
+    task = {
+        "title": row["title"],
+        "start_time": row["start_time"],
+        "end_time": row["end_time"],
+        "description": row["description"] or "",
+    }
+    if row["lat"] is not None and row["lng"] is not None:
+        task["lat"] = row["lat"]
+        task["lng"] = row["lng"]
+    return task
+
+
+def json_parts(rows, many=False):
+    """
+    The import JSON, written as the ordered rows go by: a trip, a day or
+    a task is opened when its first row arrives and closed at the next.
+    """
+    if many:
+        yield '{"trips": ['
+    trip_id = day_id = None
+    for row in rows:
+        if row["trip_id"] != trip_id:
+            if trip_id is not None:
+                yield ("]}" if day_id is not None else "") + "]}, "
+            header = json.dumps({
+                "trip_name": row["trip_name"],
+                "start_date": row["start_date"],
+                "end_date": row["end_date"],
+            })
+            yield header[:-1] + ', "days": ['
+            trip_id, day_id = row["trip_id"], None
+
+        if row["day_id"] is not None and row["day_id"] != day_id:
+            yield ("]}, " if day_id is not None else "") + f'{{"date": {json.dumps(row["day_date"])}, "tasks": ['
+            day_id, first_task = row["day_id"], True
+
+        if row["task_id"] is not None:
+            yield ("" if first_task else ", ") + json.dumps(task_json(row))
+            first_task = False
+
+    if trip_id is not None:
+        yield ("]}" if day_id is not None else "") + "]}"
+    if many:
+        yield "]}"
+
+
+def chunked(parts, size=EXPORT_CHUNK_CHARS):
+    buffer, length = [], 0
+    for part in parts:
+        buffer.append(part)
+        length += len(part)
+        if length >= size:
+            yield "".join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+# ---------------- streaming ----------------
+
+def export_stream(fmt, user_id, trip_id=None, role=PRIMARY):
+    """Chunks of the export, on a connection of its own to `role`"""
+    started = time.perf_counter()
+    counted = {"tasks": 0}
+    outcome = "aborted"
+
+    def counting(rows):
+        for row in rows:
+            if row["task_id"] is not None:
+                counted["tasks"] += 1
+            yield row
+
+    conn = connect(role, application_name="tripplanner_export")
+    try:
+        rows = counting(export_rows(conn, user_id, trip_id))
+        parts = csv_parts(rows) if fmt == "csv" else json_parts(rows, many=trip_id is None)
+        yield from chunked(parts)
+        outcome = "completed"
+    except Exception:
+        outcome = "failed"
+        log.exception("trip_export_failed", user_id=user_id, trip_id=trip_id, format=fmt)
+        raise
+    finally:
+        conn.close()
+        seconds = time.perf_counter() - started
+        metrics.exports.inc(format=fmt, outcome=outcome)
+        metrics.export_tasks.inc(counted["tasks"])
+        metrics.export_seconds.observe(seconds, format=fmt)
+        log.info("trip_exported", user_id=user_id, trip_id=trip_id, format=fmt,
+                 outcome=outcome, tasks=counted["tasks"], ms=round(seconds * 1000, 1))
@@ -0,0 +1,99 @@
+from app_logging import get_logger
+
+log = get_logger("trip_list")
+
+
+# ------------------ User trip list ------------------
+#
+# Trips a user owns or belongs to, newest first, one keyset page at a
+# time on (created_at, id). The two halves are separate index scans, each
+# read in that order and stopped after `limit` rows:
+#
+#   owned    trips (owner_id, created_at DESC, id DESC)
+#   joined   trip_members (user_id, trip_created_at DESC, trip_id DESC)
+#            WHERE role IS DISTINCT FROM 'owner'
+#
+# trip_members.trip_created_at is a copy of the trip's created_at, filled
+# in by a trigger on insert (db.py). Without it the joined half would have
+# to join and sort every trip the user belongs to before the LIMIT. With
+# it, neither half sorts or fans out per member, and a page costs the
+# same whether the user has ten trips or ten thousand.
+
+TRIPS_PAGE_SIZE = 24
+BACKFILL_BATCH_SIZE = 5000
+
+USER_TRIPS_SQL = """
+    WITH page AS (
+        (
+            SELECT t.id, t.created_at
+            FROM trips t
+            WHERE t.owner_id = %(user_id)s {owned_keyset}
+            ORDER BY t.created_at DESC, t.id DESC
+            LIMIT %(limit)s
+        )
+        UNION
+        (
+            SELECT tm.trip_id AS id, tm.trip_created_at AS created_at
+            FROM trip_members tm
+            WHERE tm.user_id = %(user_id)s AND tm.role IS DISTINCT FROM 'owner' {joined_keyset}
+            ORDER BY tm.trip_created_at DESC, tm.trip_id DESC
+            LIMIT %(limit)s
+        )
+        ORDER BY created_at DESC, id DESC
+        LIMIT %(limit)s
+    )
+    SELECT {columns}, t.owner_id = %(user_id)s AS is_owner
+    FROM page
+    JOIN trips t ON t.id = page.id
+    ORDER BY t.created_at DESC, t.id DESC
+"""
+
+KEYSET_SQL = "AND ({created_at}, {id}) < (%(after_created_at)s::timestamp, %(after_id)s)"
+
+# Memberships from before trip_created_at existed, a batch at a time
+BACKFILL_TRIP_CREATED_AT_SQL = """
+    UPDATE trip_members tm SET trip_created_at = t.created_at
+    FROM trips t
+    WHERE t.id = tm.trip_id AND (tm.trip_id, tm.user_id) IN (
+        SELECT m.trip_id, m.user_id
+        FROM trip_members m
+        JOIN trips x ON x.id = m.trip_id
+        WHERE m.trip_created_at IS NULL AND x.created_at IS NOT NULL
+        LIMIT %s
+    )
+"""
+
+def user_trips_page(conn, user_id, limit=TRIPS_PAGE_SIZE, after=None, columns="t.*"):
+    """
+    (rows, has_more) for the page after `after` = (created_at, id) of the
+    last row already shown, or the first page when None.
+    """
+    params = {"user_id": user_id, "limit": limit + 1}
+    owned_keyset = joined_keyset = ""
+    if after:
+        owned_keyset = KEYSET_SQL.format(created_at="t.created_at", id="t.id")
+        joined_keyset = KEYSET_SQL.format(created_at="tm.trip_created_at", id="tm.trip_id")
+        params["after_created_at"], params["after_id"] = after
+
+    cur = conn.cursor()
+    cur.execute(USER_TRIPS_SQL.format(
+        owned_keyset=owned_keyset, joined_keyset=joined_keyset, columns=columns
+    ), params)
+    rows = cur.fetchall()
+    cur.close()
+    return rows[:limit], len(rows) > limit
+
+
+def backfill_trip_created_at(conn, batch_size=BACKFILL_BATCH_SIZE):
+    """Copy created_at into memberships that predate the column"""
+    cur = conn.cursor()
+    total = 0
+    while True:
+        cur.execute(BACKFILL_TRIP_CREATED_AT_SQL, (batch_size,))
+        if not cur.rowcount:
+            break
+        conn.commit()
+        total += cur.rowcount
+        log.info("trip_created_at_backfilled", total=total)
+    cur.close()
+    return total